@@ -1,7 +1,6 @@
 # -*-coding:utf8-*-
 
 import colorsys
-import matplotlib.colors as mc
 
 class PowerPalette:
     """
@@ -33,6 +32,8 @@ class PowerPalette:
         ----------
         - base_color. Any acceptable Matplotlib color.
         """
+        import matplotlib.colors as mc
+        
         self.hue = colorsys.rgb_to_hls(*mc.to_rgb(base_color))[0]
         
         black_lightness = .2
@@ -3,11 +3,49 @@
 import numpy as np
 
 from chessdip.board.power import Side
+from chessdip.board.square import SQUARES, get_square_id
+from chessdip.board.zobrist import get_zobrist_keys
+
+def get_square_mask(squares):
+    """
+    Get the bitboard of squares: each square is the bit of its id, see
+    `Square`.
+    """
+    mask = 0
+    for square in squares:
+        mask |= 1 << get_square_id(square)
+    return mask
 
 class Board:
     """
     The chess board. This class stores the location of supply centers and
     the ownership of each square and supply center.
+    
+    The pieces and supply centers are also stored as bitboards, i.e. ints
+    whose bits are set for the squares they occupy or own, see
+    `get_square_mask`. The bitboards are kept up to date by the
+    BoardInterface, through `add_piece`, `move_piece`, `remove_piece`, and
+    `set_sc_ownership`.
+    
+    Likewise, the Zobrist hash of the position, see `chessdip.board.zobrist`,
+    is updated by these methods and by `set_moved`, `toggle_en_passant`, and
+    `set_phase`. It covers the pieces, whether they moved, the supply center
+    owners, the squares open to en passant, and the phase, but not the year
+    nor the square owners.
+    
+    Attributes:
+    ----------
+    - square_pieces: list of lists of Pieces. The pieces on each square,
+        indexed by square id.
+    - occupied: int. Bitboard of the squares with a piece.
+    - power_pieces: list of ints. Bitboard of the pieces of each power, by
+        index in `powers`.
+    - piece_types: list of ints. Bitboard of the pieces of each type, by
+        piece code.
+    - sc_owned: list of ints. Bitboard of the supply centers of each power,
+        by index in `powers`.
+    - position_hash: int. Zobrist hash of the position.
+    - phase: Phase or None. The phase of the hash, if set.
     """
     def __init__(self, setup):
         """
@@ -23,6 +61,157 @@ class Board:
         self.sc_ownership = np.zeros((8, 8), dtype=int)
         self.sc_ownership[:2][self.sc_mask[:2]] = Side.WHITE
         self.sc_ownership[-2:][self.sc_mask[-2:]] = Side.BLACK
+        
+        self.square_pieces = [[] for _ in range(64)] # pieces on each square
+        self.occupied = 0
+        self.power_pieces = [0] * len(self.powers)
+        self.piece_types = [0] * 5
+        self.sc_owned = [0] * len(self.powers)
+        self.keys = get_zobrist_keys(len(self.powers))
+        self.position_hash = 0
+        self.phase = None
+        for rank in range(8):
+            for file in range(8):
+                if self.sc_mask[rank, file]:
+                    owner = self.sc_ownership[rank, file]
+                    self.sc_owned[owner] |= 1 << (rank * 8 + file)
+                    self.position_hash ^= self.keys.sc[owner][rank * 8 + file]
+    
+    def add_piece(self, piece):
+        index = get_square_id(piece.square)
+        self.square_pieces[index].append(piece)
+        self._update_square(index)
+        self.position_hash ^= self._get_piece_key(piece, index)
+    
+    def remove_piece(self, piece):
+        index = get_square_id(piece.square)
+        self.square_pieces[index].remove(piece)
+        self._update_square(index)
+        self.position_hash ^= self._get_piece_key(piece, index)
+    
+    def move_piece(self, piece, square):
+        """
+        Update the bitboards and the hash for `piece` moving to `square`.
+        This is called before the piece is moved, while it is still on its
+        square.
+        """
+        self.remove_piece(piece)
+        index = get_square_id(square)
+        self.square_pieces[index].append(piece)
+        self._update_square(index)
+        self.position_hash ^= self._get_piece_key(piece, index)
+    
+    def set_moved(self, piece, moved):
+        if piece.moved != moved:
+            piece.moved = moved
+            self.position_hash ^= self.keys.moved[get_square_id(piece.square)]
+    
+    def toggle_en_passant(self, square):
+        """
+        Add `square` to the squares open to en passant in the hash, or
+        remove it if it was there.
+        """
+        self.position_hash ^= self.keys.en_passant[get_square_id(square)]
+    
+    def set_phase(self, phase):
+        if self.phase is not None:
+            self.position_hash ^= self.keys.phase[self.phase]
+        self.phase = phase
+        self.position_hash ^= self.keys.phase[phase]
+    
+    def compute_hash(self, en_passant_squares=()):
+        """
+        Compute the Zobrist hash of the position from scratch, e.g. to check
+        `position_hash`.
+        
+        Parameters:
+        ----------
+        - en_passant_squares: iterable of Squares, optional. The squares
+            open to en passant. Default value is ().
+        """
+        position_hash = 0
+        for index, pieces in enumerate(self.square_pieces):
+            for piece in pieces:
+                position_hash ^= self._get_piece_key(piece, index)
+        for index, square in enumerate(SQUARES):
+            if self.sc_mask[square.rank, square.file]:
+                position_hash ^= self.keys.sc[self.sc_ownership[square.rank, square.file]][index]
+        for square in en_passant_squares:
+            position_hash ^= self.keys.en_passant[get_square_id(square)]
+        if self.phase is not None:
+            position_hash ^= self.keys.phase[self.phase]
+        return position_hash
+    
+    def clear_pieces(self):
+        for index, pieces in enumerate(self.square_pieces):
+            for piece in pieces:
+                self.position_hash ^= self._get_piece_key(piece, index)
+            pieces.clear()
+        self.occupied = 0
+        for i in range(len(self.power_pieces)):
+            self.power_pieces[i] = 0
+        for i in range(len(self.piece_types)):
+            self.piece_types[i] = 0
+    
+    def _get_piece_key(self, piece, index):
+        key = self.keys.pieces[self.powers.index(piece.power)][piece.code][index]
+        if piece.moved:
+            key ^= self.keys.moved[index]
+        return key
+    
+    def _update_square(self, index):
+        """
+        Set the bit of a square in the bitboards from the pieces on it.
+        While orders are executed, a piece may move onto a square before
+        the piece on it leaves, so there may be several.
+        """
+        bit = 1 << index
+        mask = ~bit
+        self.occupied &= mask
+        for i in range(len(self.power_pieces)):
+            self.power_pieces[i] &= mask
+        for i in range(len(self.piece_types)):
+            self.piece_types[i] &= mask
+        for piece in self.square_pieces[index]:
+            self.occupied |= bit
+            self.power_pieces[self.powers.index(piece.power)] |= bit
+            self.piece_types[piece.code] |= bit
+    
+    def get_occupied(self):
+        return self.occupied
+    
+    def get_power_pieces(self, power, code=None):
+        """
+        Get the bitboard of the pieces of `power`, or of its pieces of type
+        `code` if given.
+        """
+        mask = self.power_pieces[self.powers.index(power)]
+        if code is not None:
+            mask &= self.piece_types[code]
+        return mask
+    
+    def is_occupied(self, square):
+        return bool(self.occupied >> get_square_id(square) & 1)
+    
+    def is_path_blocked(self, squares):
+        """
+        Check if a piece stands on any of `squares`, e.g. the intermediate
+        squares of a chess path.
+        """
+        return bool(self.occupied & get_square_mask(squares))
+    
+    def get_sc_count(self, power):
+        return self.sc_owned[self.powers.index(power)].bit_count()
+    
+    def get_sc_counts(self):
+        """
+        Get the number of supply centers of each power.
+        
+        Returns:
+        -------
+        - dict of Power: int.
+        """
+        return {power: sc_owned.bit_count() for power, sc_owned in zip(self.powers, self.sc_owned)}
     
     def set_ownership(self, square, power):
         old_code = self.ownership[square.rank, square.file]
@@ -38,7 +227,11 @@ class Board:
         old_code = self.sc_ownership[square.rank, square.file]
         new_code = self.powers.index(power)
         if old_code != new_code:
-            self.sc_ownership[square.rank, square.file] = self.powers.index(power)
+            self.sc_ownership[square.rank, square.file] = new_code
+            index = get_square_id(square)
+            self.sc_owned[old_code] &= ~(1 << index)
+            self.sc_owned[new_code] |= 1 << index
+            self.position_hash ^= self.keys.sc[old_code][index] ^ self.keys.sc[new_code][index]
             return True
         return False
     
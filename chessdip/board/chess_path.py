@@ -1,9 +1,11 @@
 # -*-coding:utf8-*-
 
 from chessdip.board.power import Side
-from chessdip.board.square import Square
+from chessdip.board.square import SQUARES, get_square, get_square_id
 from chessdip.board.piece import Piece
 
+_PATH_TABLE = None # see `_get_path_table`
+
 class ChessPath:
     """
     Class managing the path of a piece. Different pieces move differently;
@@ -34,7 +36,7 @@ class ChessPath:
         elif exception == "castle":
             self.valid = True
             if self.piece.code == Piece.KING:
-                self.intermediate_squares = []
+                self.intermediate_squares = ()
             elif self.piece.code == Piece.ROOK:
                 _, squares = ChessPath.validate_path(self.piece, self.land)
                 self.intermediate_squares = squares[:-1]
@@ -45,7 +47,7 @@ class ChessPath:
                 self.valid = abs(dfile) == 1 and abs(drank) in (0, 2)
             else:
                 self.valid = abs(dfile) == 1 and abs(drank) in (0, -2)
-            self.intermediate_squares = []
+            self.intermediate_squares = ()
     
     def __str__(self):
         return f"Chess path for {self.piece} to {self.land}"
@@ -53,55 +55,97 @@ class ChessPath:
     def validate_path(piece, land):
         """
         Validate the `piece`'s move to the `land` square and compute the
-        intermediate squares.
+        intermediate squares. Paths on the board are looked up in a table,
+        computed on first use, see `_get_path_table`.
         
         Returns:
         -------
         - valid: bool.
-        - intermediate_squares: list of Squares.
+        - intermediate_squares: tuple of Squares.
         """
+        global _PATH_TABLE
         start = piece.get_square()
-        if start == land:
-            return False, []
-        valid = False
-        intermediate_squares = []
-        dfile = land.file - start.file
-        drank = land.rank - start.rank
-        dfile_sign = 1 if dfile >= 0 else -1
-        drank_sign = 1 if drank >= 0 else -1
-        file_range = range(start.file, land.file, dfile_sign)[1:]
-        rank_range = range(start.rank, land.rank, drank_sign)[1:]
-        match piece.code:
-            case Piece.KING:
-                if abs(dfile) <= 1 and abs(drank) <= 1:
-                    valid = True
-            case Piece.ROOK:
-                if dfile == 0:
-                    intermediate_squares = [Square(rank=y, file=start.file) for y in rank_range]
+        if 0 <= start.file < 8 and 0 <= start.rank < 8 and 0 <= land.file < 8 and 0 <= land.rank < 8:
+            if _PATH_TABLE is None:
+                _PATH_TABLE = _get_path_table()
+            return _PATH_TABLE[piece.code][piece.power.side][get_square_id(start) * 64 + get_square_id(land)]
+        return _compute_path(piece.code, piece.power.side, start, land)
+
+def _compute_path(code, side, start, land):
+    """
+    Validate the move of a piece of type `code` and of a power on `side`
+    from the `start` square to the `land` square, and compute the
+    intermediate squares. See `ChessPath.validate_path`.
+    """
+    if start == land:
+        return False, ()
+    valid = False
+    intermediate_squares = []
+    dfile = land.file - start.file
+    drank = land.rank - start.rank
+    dfile_sign = 1 if dfile >= 0 else -1
+    drank_sign = 1 if drank >= 0 else -1
+    file_range = range(start.file, land.file, dfile_sign)[1:]
+    rank_range = range(start.rank, land.rank, drank_sign)[1:]
+    match code:
+        case Piece.KING:
+            if abs(dfile) <= 1 and abs(drank) <= 1:
+                valid = True
+        case Piece.ROOK:
+            if dfile == 0:
+                intermediate_squares = [get_square(start.file, y) for y in rank_range]
+                valid = True
+            elif drank == 0:
+                intermediate_squares = [get_square(x, start.rank) for x in file_range]
+                valid = True
+        case Piece.BISHOP:
+            if abs(dfile) == abs(drank):
+                intermediate_squares = [get_square(x, y) for x, y in zip(file_range, rank_range)]
+                valid = True
+        case Piece.KNIGHT:
+            if (abs(drank) == 2 and abs(dfile) == 1) or (abs(dfile) == 2 and abs(drank) == 1):
+                valid = True
+        case Piece.PAWN:
+            if side == Side.WHITE:
+                if drank == 1 and abs(dfile) <= 1:
                     valid = True
-                elif drank == 0:
-                    intermediate_squares = [Square(rank=start.rank, file=x) for x in file_range]
+                elif start.rank < 2 and drank == 2 and dfile == 0:
+                    intermediate_squares.append(get_square(start.file, start.rank + 1))
                     valid = True
-            case Piece.BISHOP:
-                if abs(dfile) == abs(drank):
-                    intermediate_squares = [Square(file=x, rank=y) for x, y in zip(file_range, rank_range)]
+            elif side == Side.BLACK:
+                if drank == -1 and abs(dfile) <= 1:
                     valid = True
-            case Piece.KNIGHT:
-                if (abs(drank) == 2 and abs(dfile) == 1) or (abs(dfile) == 2 and abs(drank) == 1):
+                elif start.rank >= 6 and drank == -2 and dfile == 0:
+                    intermediate_squares.append(get_square(start.file, start.rank - 1))
                     valid = True
-            case Piece.PAWN:
-                if piece.power.side == Side.WHITE:
-                    if drank == 1 and abs(dfile) <= 1:
-                        valid = True
-                    elif start.rank < 2 and drank == 2 and dfile == 0:
-                        intermediate_squares.append(Square(rank=start.rank + 1, file=start.file))
-                        valid = True
-                elif piece.power.side == Side.BLACK:
-                    if drank == -1 and abs(dfile) <= 1:
-                        valid = True
-                    elif start.rank >= 6 and drank == -2 and dfile == 0:
-                        intermediate_squares.append(Square(rank=start.rank - 1, file=start.file))
-                        valid = True
-            case _:
-                pass
-        return valid, intermediate_squares
\ No newline at end of file
+        case _:
+            pass
+    return valid, tuple(intermediate_squares)
+
+def _get_path_table():
+    """
+    Compute the path of every piece type, side, and pair of squares of the
+    board, as returned by `_compute_path`. Only pawns move according to
+    their side, so the tables of the other pieces are shared by all sides.
+    
+    Returns:
+    -------
+    - list, indexed by piece code, then side, then `start * 64 + land`,
+        where squares are indexed by id, of (valid, intermediate_squares)
+        pairs, with canonical squares. Identical pairs are the same object.
+    """
+    invalid = (False, ())
+    table = []
+    for code in (Piece.PAWN, Piece.KNIGHT, Piece.BISHOP, Piece.ROOK, Piece.KING):
+        sides = Side if code == Piece.PAWN else [Side.NEUTRAL]
+        side_tables = []
+        for side in sides:
+            paths = []
+            for start in SQUARES:
+                for land in SQUARES:
+                    valid, intermediate_squares = _compute_path(code, side, start, land)
+                    intermediate_squares = tuple(SQUARES[get_square_id(square)] for square in intermediate_squares)
+                    paths.append((True, intermediate_squares) if valid else invalid)
+            side_tables.append(paths)
+        table.append([side_tables[side if code == Piece.PAWN else 0] for side in Side])
+    return table
@@ -2,7 +2,7 @@
 
 from enum import IntEnum
 
-from chessdip.board.square import Square
+from chessdip.board.square import get_square
 
 class Side(IntEnum):
     """
@@ -44,34 +44,34 @@ class Power:
     def get_king_square(self):
         file = 3 if self.d_king else 4 # d else e
         rank = 0 if self.side == Side.WHITE else 7
-        return Square(file=file, rank=rank)
+        return get_square(file, rank)
     
     def get_king_rook_square(self):
         file = 0 if self.d_king else 7 # a else h
         rank = 0 if self.side == Side.WHITE else 7
-        return Square(file=file, rank=rank)
+        return get_square(file, rank)
     
     def get_queen_rook_square(self):
         file = 7 if self.d_king else 0 # h else a
         rank = 0 if self.side == Side.WHITE else 7
-        return Square(file=file, rank=rank)
+        return get_square(file, rank)
     
     def get_kingside_castle_king_square(self):
         file = 1 if self.d_king else 6 # b else g
         rank = 0 if self.side == Side.WHITE else 7
-        return Square(file=file, rank=rank)
+        return get_square(file, rank)
     
     def get_kingside_castle_rook_square(self):
         file = 2 if self.d_king else 5 # c else f
         rank = 0 if self.side == Side.WHITE else 7
-        return Square(file=file, rank=rank)
+        return get_square(file, rank)
     
     def get_queenside_castle_king_square(self):
         file = 5 if self.d_king else 2 # f else c
         rank = 0 if self.side == Side.WHITE else 7
-        return Square(file=file, rank=rank)
+        return get_square(file, rank)
     
     def get_queenside_castle_rook_square(self):
         file = 4 if self.d_king else 3 # e else d
         rank = 0 if self.side == Side.WHITE else 7
-        return Square(file=file, rank=rank)
\ No newline at end of file
+        return get_square(file, rank)
\ No newline at end of file
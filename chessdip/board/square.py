@@ -3,8 +3,34 @@
 from collections import namedtuple
 
 class Square(namedtuple("Square", ["file", "rank"])):
-    """Squares on the chess board."""
+    """
+    Squares on the chess board. The squares of the board are identified by
+    their id `rank * 8 + file`, from 0 for a1 to 63 for h8, which indexes
+    arrays and bitboards. Each square of the board has a canonical
+    instance, in `SQUARES`, and making a Square of the board returns it, so
+    that dict and set lookups find squares by identity. `get_square` does
+    the same without checking the bounds.
+    
+    Squares still compare and hash as tuples: a Python `__eq__` and
+    `__hash__` on the id would make dict lookups about twice as slow.
+    """
     __slots__ = ()
     
+    def __new__(cls, file, rank):
+        if 0 <= file < 8 and 0 <= rank < 8:
+            return SQUARES[rank * 8 + file]
+        return tuple.__new__(cls, (file, rank))
+    
     def __str__(self):
-        return "abcdefgh"[self.file] + "12345678"[self.rank]
\ No newline at end of file
+        return "abcdefgh"[self.file] + "12345678"[self.rank]
+
+SQUARES = tuple(tuple.__new__(Square, (i % 8, i // 8)) for i in range(64)) # by id
+
+def get_square(file, rank):
+    """
+    Get the canonical Square of a square of the board.
+    """
+    return SQUARES[rank * 8 + file]
+
+def get_square_id(square):
+    return square.rank * 8 + square.file
@@ -0,0 +1,55 @@
+# -*-coding:utf8-*-
+
+"""
+Zobrist keys of positions: a random 64-bit key for each feature of a
+position, such as a piece of a given type and power on a given square. The
+hash of a position is the XOR of the keys of its features, so that it is
+updated in constant time when a feature is added or removed, see
+`Board.position_hash`.
+
+Keys are derived from a hash of the description of their feature, not
+from a random generator, so that hashes are the same in every process and
+every run, e.g. to find duplicates in an archive of games.
+"""
+
+import hashlib
+from functools import lru_cache
+
+def get_key(*description):
+    """
+    Get the 64-bit key of a feature described by plain values.
+    """
+    digest = hashlib.blake2b(repr(description).encode("utf8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+class ZobristKeys:
+    """
+    Keys of the features of a position. Powers are referred to by their
+    index in the `powers` of the board setup, and squares by id, see
+    `Square`.
+    
+    Attributes:
+    ----------
+    - pieces: list, indexed by power index, then piece code, then square
+        id, of ints. Keys of pieces.
+    - moved: list of ints, by square id. Keys of pieces that moved, which
+        have no castle rights.
+    - sc: list, indexed by power index, then square id, of ints. Keys of
+        supply center owners.
+    - en_passant: list of ints, by square id. Keys of the squares that a
+        pawn open to en passant can be taken on.
+    - phase: list of ints, by `Phase`. Keys of the phases.
+    """
+    def __init__(self, n_powers, n_piece_codes=5, n_phases=3):
+        self.pieces = [[[get_key("piece", power, code, square) for square in range(64)] for code in range(n_piece_codes)] for power in range(n_powers)]
+        self.moved = [get_key("moved", square) for square in range(64)]
+        self.sc = [[get_key("sc", power, square) for square in range(64)] for power in range(n_powers)]
+        self.en_passant = [get_key("en_passant", square) for square in range(64)]
+        self.phase = [get_key("phase", phase) for phase in range(n_phases)]
+
+@lru_cache
+def get_zobrist_keys(n_powers):
+    """
+    Get the shared ZobristKeys of boards with `n_powers` powers.
+    """
+    return ZobristKeys(n_powers)
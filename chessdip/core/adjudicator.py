@@ -1,10 +1,13 @@
 # -*-coding:utf8-*-
 
+import time
 from enum import Enum
 
 from chessdip.core.order import (
-    HoldOrder, MoveOrder, ConvoyOrder, SupportOrder, OrderLinker, LinkedOrder
+    HoldOrder, MoveOrder, ConvoyOrder, SupportOrder, OrderLinker, LinkedOrder,
+    BuildOrder, DisbandOrder
 )
+from chessdip.core.stats import AdjudicationStats
 
 class State(Enum):
     UNRESOLVED = 0
@@ -25,8 +28,29 @@ class Adjudicator:
     
     If `verbose` is True, then the adjudicator reports each call to the
     `_resolve` and `_adjudicate` functions, and reports the output.
+    
+    For structured introspection, the adjudicator reports events to its
+    hooks, see `AdjudicationHook`. If `stats` is True, then an
+    AdjudicationStats is created for this adjudicator and returned by
+    `adjudicate`; an optional `hook` receives the same events. Without
+    hooks, the only overhead is a check at each event.
+    
+    A long-lived adjudicator can be reused for other order sets, see
+    `rebind`.
+    
+    The rules of adjudication are written out again by other engines:
+    `StackAdjudicator`, as generators, and `PlanResolver` and
+    `LockstepAdjudicator`, on integer arrays. A change of the rules here
+    must be made there as well; the headless tests check that the engines
+    agree on the test cases.
     """
-    def __init__(self, order_interface, verbose=False):
+    INDEXES = (
+        "moves_by_start", "holds_by_start", "convoys_by_start",
+        "orders_by_start", "opposing_by_landing", "attacks_by_landing",
+        "crossed_squares", "real_supports"
+    )
+    
+    def __init__(self, order_interface, verbose=False, stats=False, hook=None):
         self.order_interface = order_interface
         self.orders = self.order_interface.get_adjudicable_orders()
         self.result = {order: False for order in self.orders}
@@ -35,9 +59,14 @@ class Adjudicator:
         self.cycle = []
         self.recursion_hits = 0
         self.uncertain = True
+        self._build_indexes()
         
         self.verbose = verbose
         self._debug_call_depth = 0
+        
+        self.stats = AdjudicationStats() if stats else None
+        self.hooks = [other_hook for other_hook in (self.stats, hook) if other_hook is not None]
+        self._depth = 0
     
     # ==== Main adjudication functions ====
     
@@ -47,14 +76,100 @@ class Adjudicator:
         orders were properly added: that is, every piece that does not have
         a move order, has a hold order, even if that piece was not ordered
         to hold.
+        
+        Returns:
+        -------
+        - AdjudicationStats or None. The statistics of this adjudicator, if
+            it was created with `stats` set to True.
         """
+        if self.hooks:
+            self._hook_adjudication_started(self.orders)
         for order in self.orders:
-            result = self._resolve(order, True)
+            if self.hooks:
+                result = self._resolve_timed(order)
+            else:
+                result = self._resolve(order, True)
             self.order_interface.set_success(order, result)
         # Set virtual moves to fail
         for order in self.order_interface.get_orders():
             if order.get_virtual():
                 self.order_interface.set_success(order, False)
+        return self.stats
+    
+    def rebind(self, order_interface=None):
+        """
+        Reset the adjudicator for the current order set of its order
+        interface, or of `order_interface` if given, so that it can
+        adjudicate again. The state dicts and the indexes are cleared and
+        refilled instead of being made anew, and the hooks are kept: the
+        statistics, if any, count the events of every order set.
+        
+        Parameters:
+        ----------
+        - order_interface: OrderInterface or None, optional. If None, then
+            the current order interface is kept. Default value is None.
+        """
+        if order_interface is not None:
+            self.order_interface = order_interface
+        self.orders = self.order_interface.get_adjudicable_orders()
+        for state in (self.result, self.resolved, self.visited):
+            state.clear()
+            for order in self.orders:
+                state[order] = False
+        self.cycle.clear()
+        self.recursion_hits = 0
+        self.uncertain = True
+        self._build_indexes(reuse=True)
+        
+        self._debug_call_depth = 0
+        self._depth = 0
+    
+    def close(self):
+        """
+        Release the resources of the adjudicator, e.g. the worker processes
+        of a ParallelAdjudicator. The adjudicator holds none by default.
+        """
+        pass
+    
+    def query(self, orders):
+        """
+        Resolve only `orders`, and the orders that their resolution depends
+        on. The other orders are left unresolved, and the success of orders
+        is not changed in the order interface. The adjudicator stays valid:
+        further queries, or `adjudicate`, reuse the resolved orders. As in
+        `adjudicate`, hold orders are assumed to be properly added.
+        
+        Parameters:
+        ----------
+        - orders: iterable of orders of the order interface. Linked orders
+            are resolved through their order linker.
+        
+        Returns:
+        -------
+        - list of bools: for each order of `orders`, whether it succeeds.
+            Virtual orders fail.
+        
+        Raises:
+        ------
+        - ValueError: if an order is neither virtual nor adjudicated, e.g.
+            a hold order.
+        """
+        orders = list(orders)
+        if self.hooks:
+            self._hook_adjudication_started(orders)
+        results = []
+        for order in orders:
+            resolved_order = order.get_linker() if isinstance(order, LinkedOrder) else order
+            if resolved_order in self.resolved:
+                if self.hooks:
+                    results.append(self._resolve_timed(resolved_order))
+                else:
+                    results.append(self._resolve(resolved_order, True))
+            elif not isinstance(order, OrderLinker) and order.get_virtual():
+                results.append(False)
+            else:
+                raise ValueError(f"Querying unexpected order: {order}")
+        return results
     
     def _resolve(self, order, optimistic):
         """
@@ -67,24 +182,36 @@ class Adjudicator:
         cycles, but I have not checked it. The algorithm seems to work,
         according to the DATC tests.
         """
-        self._debug_out(f"Resolve {order} {self._debug_optimistic(optimistic)}")
-        self._debug_call_depth += 1
+        if self.verbose:
+            self._debug_out(f"Resolve {order} {self._debug_optimistic(optimistic)}")
+            self._debug_call_depth += 1
         
         if isinstance(order, LinkedOrder):
             order = order.get_linker()
+        if self.hooks:
+            self._hook_resolve_started(order, optimistic)
         
         if self.resolved[order]:
-            self._debug_out_decr(f"1. end resolve: {self._debug_result(self.result[order])}, {self._debug_resolved(order)}")
+            if self.verbose:
+                self._debug_out_decr(f"1. end resolve: {self._debug_result(self.result[order])}, {self._debug_resolved(order)}")
+            if self.hooks:
+                self._hook_resolve_ended(order, self.result[order], "resolved")
             return self.result[order]
         elif order in self.cycle:
             self.uncertain = True
-            self._debug_out_decr(f"2. end resolve: in cycle, uncertain, {self._debug_result(optimistic)}, {self._debug_resolved(order)}")
+            if self.verbose:
+                self._debug_out_decr(f"2. end resolve: in cycle, uncertain, {self._debug_result(optimistic)}, {self._debug_resolved(order)}")
+            if self.hooks:
+                self._hook_resolve_ended(order, optimistic, "cycle")
             return optimistic
         elif self.visited[order]:
             self.cycle.append(order)
             self.recursion_hits += 1
             self.uncertain = True
-            self._debug_out_decr(f"3. end resolve: visited, uncertain, {self._debug_result(optimistic)}, {self._debug_resolved(order)}")
+            if self.verbose:
+                self._debug_out_decr(f"3. end resolve: visited, uncertain, {self._debug_result(optimistic)}, {self._debug_resolved(order)}")
+            if self.hooks:
+                self._hook_resolve_ended(order, optimistic, "recursion")
             return optimistic
         
         self.visited[order] = True
@@ -106,7 +233,10 @@ class Adjudicator:
             self.uncertain = old_uncertain
             self.result[order] = opt_result
             self.resolved[order] = True
-            self._debug_out_decr(f"4. end resolve: {self._debug_result(opt_result)}, {self._debug_resolved(order)}")
+            if self.verbose:
+                self._debug_out_decr(f"4. end resolve: {self._debug_result(opt_result)}, {self._debug_resolved(order)}")
+            if self.hooks:
+                self._hook_resolve_ended(order, opt_result, "adjudicated")
             return opt_result
         
         elif order in self.cycle:
@@ -118,17 +248,24 @@ class Adjudicator:
                 self.cycle = self.cycle[:old_cycle_len]
                 self.uncertain = old_uncertain
                 ret = self._resolve(order, optimistic)
-                self._debug_out_decr(f"5. end resolve: ancestor of cycle, {self._debug_result(ret)}, {self._debug_resolved(order)}")
+                if self.verbose:
+                    self._debug_out_decr(f"5. end resolve: ancestor of cycle, {self._debug_result(ret)}, {self._debug_resolved(order)}")
+                if self.hooks:
+                    self._hook_resolve_ended(order, ret, "backup")
                 return ret
         
         elif not order in self.cycle:
             self.cycle.append(order)
-        self._debug_out_decr(f"6. end resolve: not ancestor of cycle, {self._debug_result(optimistic)}, {self._debug_resolved(order)}")
+        if self.verbose:
+            self._debug_out_decr(f"6. end resolve: not ancestor of cycle, {self._debug_result(optimistic)}, {self._debug_resolved(order)}")
+        if self.hooks:
+            self._hook_resolve_ended(order, optimistic, "guess")
         return optimistic
     
     def _adjudicate(self, order, optimistic):
-        self._debug_out(f"Adjudicate {order} {self._debug_optimistic(optimistic)}")
-        self._debug_call_depth += 1
+        if self.verbose:
+            self._debug_out(f"Adjudicate {order} {self._debug_optimistic(optimistic)}")
+            self._debug_call_depth += 1
         if isinstance(order, OrderLinker):
             ret = self._adjudicate_linker(order, optimistic)
         elif isinstance(order, MoveOrder):
@@ -139,15 +276,17 @@ class Adjudicator:
             ret = self._adjudicate_convoy(order, optimistic)
         else:
             raise ValueError(f"Adjudicating unexpected order: {order}")
-        self._debug_out_decr(f"end adjudicate: {self._debug_result(ret)}")
+        if self.verbose:
+            self._debug_out_decr(f"end adjudicate: {self._debug_result(ret)}")
         return ret
     
     def _backup_rule(self, orders):
-        self._debug_out(f"backup rule")
+        if self.verbose:
+            self._debug_out("backup rule")
+            for order in orders:
+                self._debug_out(f"with: {order}")
         if not orders:
             raise NameError("No orders in backup!")
-        for order in orders:
-            self._debug_out(f"with: {order}")
         for order in orders:
             if isinstance(order, ConvoyOrder):
                 self._apply_szykman(orders)
@@ -155,20 +294,28 @@ class Adjudicator:
         self._apply_circular_movement(orders)
     
     def _apply_szykman(self, orders):
-        self._debug_out(f"applying Szykman's rule")
+        if self.verbose:
+            self._debug_out("applying Szykman's rule")
+        for hook in self.hooks:
+            hook.backup_rule_applied("szykman", orders)
         for order in orders:
             if isinstance(order, ConvoyOrder):
-                self._debug_out(f"failing {order}")
+                if self.verbose:
+                    self._debug_out(f"failing {order}")
                 self.result[order] = False
                 self.resolved[order] = True
             else:
                 self.resolved[order] = False
     
     def _apply_circular_movement(self, orders):
-        self._debug_out(f"applying circular movement")
+        if self.verbose:
+            self._debug_out("applying circular movement")
+        for hook in self.hooks:
+            hook.backup_rule_applied("circular", orders)
         for order in orders:
             if isinstance(order, MoveOrder):
-                self._debug_out(f"circulating {order}")
+                if self.verbose:
+                    self._debug_out(f"circulating {order}")
                 self.result[order] = True
                 self.resolved[order] = True
             else:
@@ -216,18 +363,16 @@ class Adjudicator:
         supported_order = order.get_supported_order()
         if isinstance(supported_order, ConvoyOrder) and not self._check_path(supported_order, optimistic):
             return False
-        for other_order in self.orders:
-            if (isinstance(other_order, MoveOrder)
-                and other_order.get_landing_square() == order.get_starting_square()
-            ): # checking for dislodge
-                if self._resolve(other_order, not optimistic):
-                    return False
-                if (other_order.get_piece().get_power() != order.get_piece().get_power()
-                    and order.get_landing_square() != other_order.get_starting_square()
-                    and order.get_landing_square() not in other_order.get_intermediate_squares()
-                    and self._check_path(other_order, not optimistic)
-                ): # checking for cut
-                    return False
+        for other_order in self._get_attacks(order.get_starting_square()):
+            # checking for dislodge
+            if self._resolve(other_order, not optimistic):
+                return False
+            if (other_order.get_piece().get_power() != order.get_piece().get_power()
+                and order.get_landing_square() != other_order.get_starting_square()
+                and order.get_landing_square() not in self.crossed_squares[other_order]
+                and self._check_path(other_order, not optimistic)
+            ): # checking for cut
+                return False
         return True
     
     def _adjudicate_convoy(self, order, optimistic):
@@ -309,7 +454,7 @@ class Adjudicator:
             return 0
         else:
             return (0 if order.is_travel() else 1)  + self._get_support_strength(order, optimistic)
-        
+    
     def _get_attack_strength(self, order, order_at_landing, optimistic):
         # self._debug_out(f"Getting attack strength of {order}")
         if not self._check_path(order, optimistic):
@@ -342,56 +487,209 @@ class Adjudicator:
                 support += 1
         return support
     
-    # ==== Order retrieval ====
+    # ==== Dependency graph ====
     
-    def _get_other_opposing(self, order):
+    def _get_dependency_graph(self):
         """
-        Get other orders with the same landing square.
+        Return the dependency graph of the adjudicable orders, as a dict
+        mapping each order to the list of orders it depends on.
         """
+        return {order: self._get_dependencies(order) for order in self.orders}
+    
+    def _get_dependencies(self, order):
+        """
+        Get the adjudicable orders that may be resolved when adjudicating
+        `order`, that is, the orders that `_resolve` may be called on by
+        `_adjudicate(order, ...)`. This is an over-approximation: some of
+        these orders may not be resolved in practice.
+        
+        A linked order may appear next to its linker in the adjudicable
+        orders; it is resolved through its linker.
+        """
+        if isinstance(order, LinkedOrder):
+            dependencies = [order.get_linker()]
+        elif isinstance(order, OrderLinker):
+            dependencies = []
+            for linked_order in order.get_orders():
+                dependencies.extend(self._get_move_dependencies(linked_order))
+        elif isinstance(order, MoveOrder):
+            dependencies = self._get_move_dependencies(order)
+        elif isinstance(order, SupportOrder):
+            dependencies = self._get_support_dependencies(order)
+        elif isinstance(order, ConvoyOrder):
+            dependencies = self._get_convoy_dependencies(order)
+        else:
+            raise ValueError(f"Adjudicating unexpected order: {order}")
+        
         ret = []
-        for other_order in self.order_interface.get_orders():
-            if (other_order is not order
-                and other_order.get_landing_square() == order.get_landing_square()
-                and not other_order.get_virtual()
-                and isinstance(other_order, MoveOrder | ConvoyOrder)
-            ):
+        for other_order in dependencies:
+            if isinstance(other_order, LinkedOrder):
+                other_order = other_order.get_linker()
+            if other_order in self.resolved and other_order not in ret:
                 ret.append(other_order)
         return ret
     
-    def _get_move(self, square):
+    def _get_move_dependencies(self, order):
+        dependencies = self._get_path_dependencies(order) + self._get_real_supports(order)
+        order_at_landing = self._get_order_at_landing(order)
+        if isinstance(order_at_landing, MoveOrder):
+            dependencies.append(order_at_landing)
+            dependencies.extend(self._get_real_supports(order_at_landing))
+        move_at_landing = self._get_move(order.get_landing_square())
+        if move_at_landing is not None:
+            dependencies.append(move_at_landing)
+        hold_at_landing = self._get_hold(order.get_landing_square())
+        if hold_at_landing is not None:
+            dependencies.extend(self._get_real_supports(hold_at_landing))
+        for other_order in self._get_other_opposing(order):
+            dependencies.extend(self._get_path_dependencies(other_order))
+            dependencies.extend(self._get_real_supports(other_order))
+        return dependencies
+    
+    def _get_support_dependencies(self, order):
+        dependencies = self._get_path_dependencies(order)
+        supported_order = order.get_supported_order()
+        if isinstance(supported_order, ConvoyOrder):
+            dependencies.extend(self._get_path_dependencies(supported_order))
+        for other_order in self._get_attacks(order.get_starting_square()):
+            dependencies.append(other_order)
+            dependencies.extend(self._get_path_dependencies(other_order))
+        return dependencies
+    
+    def _get_convoy_dependencies(self, order):
+        dependencies = self._get_path_dependencies(order) + self._get_real_supports(order)
+        move_at_landing = self._get_move(order.get_landing_square())
+        if move_at_landing is not None:
+            dependencies.append(move_at_landing)
+        for other_order in self._get_other_opposing(order):
+            if isinstance(other_order, ConvoyOrder):
+                dependencies.extend(self._get_path_dependencies(other_order))
+                dependencies.extend(self._get_real_supports(other_order))
+            else:
+                dependencies.append(other_order)
+        return dependencies
+    
+    def _get_path_dependencies(self, order):
+        """
+        Get the orders resolved by `_check_path(order, ...)`.
+        """
+        dependencies = []
+        if isinstance(order, ConvoyOrder):
+            for other_order in order.get_convoyed_order().get_convoys():
+                if other_order is order:
+                    break
+                dependencies.append(other_order)
+        dependencies.extend(order.get_convoys())
+        return dependencies
+    
+    # ==== Order retrieval ====
+    
+    def _build_indexes(self, reuse=False):
+        """
+        Index the orders of the order interface by square, so that the
+        retrieval functions below do not scan the whole order set. Where
+        the retrieval functions return a single order, the index keeps the
+        first matching order in the order set, as a linear scan would.
+        
+        The moves of the adjudicated orders are also indexed by landing
+        square, together with the set of squares they cross, for the cut
+        and dislodge checks of support orders. The real supports of orders
+        are indexed on demand, by `_get_real_supports`.
+        
+        If `reuse` is True, then the existing indexes are cleared and
+        refilled.
+        """
+        for name in Adjudicator.INDEXES:
+            if reuse:
+                getattr(self, name).clear()
+            else:
+                setattr(self, name, {})
         for order in self.order_interface.get_orders():
-            if not order.get_virtual() and isinstance(order, MoveOrder) and order.get_starting_square() == square:
-                return order
-        return None
+            if isinstance(order, BuildOrder | DisbandOrder):
+                continue
+            square = order.get_starting_square()
+            if isinstance(order, HoldOrder):
+                self.holds_by_start.setdefault(square, order)
+            if not isinstance(order, ConvoyOrder):
+                self.orders_by_start.setdefault(square, order)
+            if order.get_virtual():
+                continue
+            if isinstance(order, MoveOrder):
+                self.moves_by_start.setdefault(square, order)
+            elif isinstance(order, ConvoyOrder):
+                self.convoys_by_start.setdefault(square, order)
+            if isinstance(order, MoveOrder | ConvoyOrder):
+                self.opposing_by_landing.setdefault(order.get_landing_square(), []).append(order)
+        
+        for order in self.orders:
+            if isinstance(order, MoveOrder):
+                self.attacks_by_landing.setdefault(order.get_landing_square(), []).append(order)
+                self.crossed_squares[order] = frozenset(order.get_intermediate_squares())
+    
+    def _get_other_opposing(self, order):
+        """
+        Get other orders with the same landing square.
+        """
+        opposing_orders = self.opposing_by_landing.get(order.get_landing_square(), [])
+        return [other_order for other_order in opposing_orders if other_order is not order]
+    
+    def _get_attacks(self, square):
+        """
+        Get the adjudicated moves landing on `square`, in the order of the
+        order set.
+        """
+        return self.attacks_by_landing.get(square, [])
+    
+    def _get_move(self, square):
+        return self.moves_by_start.get(square)
     
     def _get_hold(self, square):
         """
         Get real hold order on `square`, if it exists. Note that all
         non-moving pieces get a real hold order.
         """
-        for order in self.order_interface.get_orders():
-            if isinstance(order, HoldOrder) and order.get_starting_square() == square:
-                return order
-        return None
+        return self.holds_by_start.get(square)
     
     def _get_convoy(self, square):
-        for order in self.order_interface.get_orders():
-            if not order.get_virtual() and isinstance(order, ConvoyOrder) and order.get_starting_square() == square:
-                return order
-        return None
+        return self.convoys_by_start.get(square)
     
     def _get_order_at_landing(self, order):
         """
         Get order at the landing square. This is used when adjudicating move
         orders. In particular, we ignore convoy orders.
         """
-        for other_order in self.order_interface.get_orders():
-            if not isinstance(other_order, ConvoyOrder) and other_order.get_starting_square() == order.get_landing_square():
-                return other_order
-        return None
+        return self.orders_by_start.get(order.get_landing_square())
     
     def _get_real_supports(self, order):
-        return [support_order for support_order in order.get_supports() if not support_order.get_virtual()]
+        real_supports = self.real_supports.get(order)
+        if real_supports is None:
+            real_supports = [support_order for support_order in order.get_supports() if not support_order.get_virtual()]
+            self.real_supports[order] = real_supports
+        return real_supports
+    
+    # ==== Hooks ====
+    
+    def _hook_adjudication_started(self, orders):
+        for hook in self.hooks:
+            hook.adjudication_started(orders)
+    
+    def _resolve_timed(self, order):
+        start = time.perf_counter()
+        result = self._resolve(order, True)
+        seconds = time.perf_counter() - start
+        for hook in self.hooks:
+            hook.order_resolved(order, seconds)
+        return result
+    
+    def _hook_resolve_started(self, order, optimistic):
+        for hook in self.hooks:
+            hook.resolve_started(order, optimistic, self._depth)
+        self._depth += 1
+    
+    def _hook_resolve_ended(self, order, result, outcome):
+        self._depth -= 1
+        for hook in self.hooks:
+            hook.resolve_ended(order, result, outcome, self._depth)
     
     # ==== Debug messages ====
     
@@ -0,0 +1,289 @@
+# -*-coding:utf8-*-
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from chessdip.core.order import (
+    MoveOrder, ConvoyOrder, SupportOrder, OrderLinker, LinkedOrder, BuildOrder
+)
+from chessdip.core.adjudicator import Adjudicator
+
+"""
+Canonical descriptions of positions and order sets, and a cache of
+adjudication results keyed by them.
+
+A description only uses plain values (power names, piece codes, square
+coordinates, flags), so that it does not depend on the identity of the
+Piece and Order objects, nor on the order in which the orders were given.
+Results are aligned with the canonical order of the adjudicable orders,
+and can be packed into a bitset of one bit per order.
+"""
+
+def describe_square(square):
+    return (square.file, square.rank)
+
+def describe_piece(piece):
+    """
+    Describe a piece by its power, code, square, and whether it moved.
+    """
+    return (piece.get_power().name, piece.code, describe_square(piece.get_square()), piece.moved)
+
+def _describe_target(order):
+    """
+    Describe an order that is supported or convoyed by another order.
+    """
+    if order is None:
+        return None
+    target = (type(order).__name__, describe_square(order.get_starting_square()), describe_square(order.get_landing_square()))
+    if isinstance(order, MoveOrder):
+        target += (order.move_type,)
+    return target
+
+def describe_order(order):
+    """
+    Describe an order by everything the adjudicator reads from it: its
+    kind, piece or square, target, path validity, and convoys.
+    """
+    if isinstance(order, OrderLinker):
+        return ("OrderLinker", tuple(sorted((describe_order(linked_order) for linked_order in order.get_orders()), key=repr)))
+    elif isinstance(order, BuildOrder):
+        return ("BuildOrder", order.get_virtual(), order.power.name, order.piece_code, describe_square(order.square))
+    
+    description = [type(order).__name__, order.get_virtual()]
+    if isinstance(order, ConvoyOrder):
+        description.extend([describe_square(order.get_starting_square()), _describe_target(order.get_convoyed_order())])
+    else:
+        description.append(describe_piece(order.get_piece()))
+    
+    if isinstance(order, MoveOrder):
+        description.extend([describe_square(order.get_landing_square()), order.move_type, order.chess_path.valid])
+    elif isinstance(order, SupportOrder):
+        description.extend([describe_square(order.supported_square), order.chess_path.valid, _describe_target(order.get_supported_order())])
+    description.append(tuple(describe_square(convoy_order.get_starting_square()) for convoy_order in order.get_convoys()))
+    return tuple(description)
+
+def get_canonical_orders(orders):
+    """
+    Sort orders by their description.
+    
+    Returns:
+    -------
+    - list of (description, order) pairs.
+    """
+    described_orders = [(describe_order(order), order) for order in orders]
+    described_orders.sort(key=lambda pair: repr(pair[0]))
+    return described_orders
+
+def get_canonical_results(order_interface):
+    """
+    Get the results of the adjudicable orders of an adjudicated order set,
+    in canonical order, see `get_canonical_orders`. Linked orders succeed
+    if all orders of their linker succeed.
+    
+    Returns:
+    -------
+    - tuple of bools.
+    """
+    orders = order_interface.get_adjudicable_orders()
+    return tuple(_get_success(order) for _, order in get_canonical_orders(orders))
+
+def set_canonical_results(order_interface, results):
+    """
+    Set the results of the adjudicable orders of an order set, given in
+    canonical order as by `get_canonical_results`, in the same order as the
+    adjudicator. Virtual orders fail.
+    """
+    orders = order_interface.get_adjudicable_orders()
+    result = dict(zip((order for _, order in get_canonical_orders(orders)), results))
+    for order in orders:
+        order_interface.set_success(order, result[order])
+    for order in order_interface.get_orders():
+        if order.get_virtual():
+            order_interface.set_success(order, False)
+
+def encode_results(results):
+    """
+    Pack results into a bitset: result `i` is bit `i % 8` of byte `i // 8`.
+    
+    Parameters:
+    ----------
+    - results: iterable of bools, or NumPy bool array.
+    
+    Returns:
+    -------
+    - bytes, of length `ceil(len(results) / 8)`.
+    """
+    return np.packbits(np.asarray(results, dtype=bool), bitorder="little").tobytes()
+
+def decode_results(data, count, as_array=False):
+    """
+    Unpack a bitset made by `encode_results`.
+    
+    Parameters:
+    ----------
+    - data: bytes.
+    - count: int. Number of packed results.
+    - as_array: bool, optional. If True, then a NumPy bool array is
+        returned instead of a tuple. Default value is False.
+    
+    Returns:
+    -------
+    - tuple of bools, or NumPy bool array.
+    
+    Raises:
+    ------
+    - ValueError: if `data` is too short for `count` results.
+    """
+    if 8 * len(data) < count:
+        raise ValueError(f"Cannot decode {count} results from {len(data)} bytes.")
+    results = np.unpackbits(np.frombuffer(data, dtype=np.uint8), count=count, bitorder="little").astype(bool)
+    if as_array:
+        return results
+    return tuple(results.tolist())
+
+def _get_success(order):
+    if isinstance(order, LinkedOrder):
+        order = order.get_linker()
+    if isinstance(order, OrderLinker):
+        return all(linked_order.get_success() for linked_order in order.get_orders())
+    return order.get_success()
+
+def get_position_key(order_interface, en_passant=()):
+    """
+    Get a canonical hash of a position and order set, as a hex string.
+    
+    Parameters:
+    ----------
+    - order_interface: OrderInterface. All of its orders, real and
+        virtual, are described, as well as the pieces they belong to.
+    - en_passant: iterable of (Piece, Square), optional. Pawns open to
+        en passant, and the squares they can be taken on. Default value
+        is ().
+    """
+    orders = order_interface.get_orders()
+    pieces = {order.get_piece() for order in orders if order.get_piece() is not None}
+    description = (
+        sorted((describe_piece(piece) for piece in pieces), key=repr),
+        sorted(((describe_piece(piece), describe_square(square)) for piece, square in en_passant), key=repr),
+        [description for description, _ in get_canonical_orders(orders)],
+    )
+    return hashlib.sha256(repr(description).encode("utf8")).hexdigest()
+
+class AdjudicationCache:
+    """
+    Least recently used cache of adjudication results. The results of an
+    adjudication are stored under the canonical hash of the position and
+    order set, see `get_position_key`, so that adjudicating the same order
+    set again, even if entered in another order, only sets the stored
+    results.
+    
+    The results are stored as bitsets, see `encode_results`. The cache can
+    be saved to, and loaded from, a JSON file, where bitsets are written in
+    hexadecimal.
+    """
+    def __init__(self, max_size=1024, path=None):
+        """
+        Parameters:
+        ----------
+        - max_size: int, optional. Maximal number of stored adjudications.
+            Default value is 1024.
+        - path: str or None, optional. Default file for `save` and `load`.
+            If the file exists, then the cache is loaded from it. Default
+            value is None.
+        """
+        self.max_size = max_size
+        self.path = path
+        self.entries = OrderedDict() # key: bitset of the results of the adjudicable orders, in canonical order
+        self.hits = 0
+        self.misses = 0
+        if self.path is not None and os.path.exists(self.path):
+            self.load()
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+    
+    def adjudicate(self, order_interface, adjudicator_class=Adjudicator, en_passant=(), verbose=False, hook=None):
+        """
+        Adjudicate the current order set of `order_interface`, or set the
+        stored results if the position and order set were seen before. The
+        same assumptions as `Adjudicator.adjudicate` hold.
+        
+        Parameters:
+        ----------
+        - order_interface: OrderInterface.
+        - adjudicator_class: class, optional. Adjudicator used on a cache
+            miss. Default value is `Adjudicator`.
+        - en_passant: iterable of (Piece, Square), optional. See
+            `get_position_key`. Default value is ().
+        - verbose: bool, optional. Passed on to the adjudicator on a cache
+            miss. Default value is False.
+        - hook: AdjudicationHook or None, optional. Passed on to the
+            adjudicator on a cache miss, and told of the start of the
+            adjudication on a hit. Default value is None.
+        """
+        key = get_position_key(order_interface, en_passant)
+        orders = order_interface.get_adjudicable_orders()
+        canonical_orders = [order for _, order in get_canonical_orders(orders)]
+        
+        if key in self.entries:
+            self.hits += 1
+            if hook is not None:
+                hook.adjudication_started(orders)
+            self.entries.move_to_end(key)
+            result = dict(zip(canonical_orders, decode_results(self.entries[key], len(canonical_orders))))
+            # Set successes in the same order as the adjudicator
+            for order in orders:
+                order_interface.set_success(order, result[order])
+            for order in order_interface.get_orders():
+                if order.get_virtual():
+                    order_interface.set_success(order, False)
+            return
+        
+        self.misses += 1
+        adjudicator = adjudicator_class(order_interface, verbose=verbose, hook=hook)
+        try:
+            adjudicator.adjudicate()
+        finally:
+            adjudicator.close()
+        results = []
+        for order in canonical_orders:
+            if isinstance(order, LinkedOrder):
+                order = order.get_linker()
+            results.append(adjudicator.result[order])
+        self.entries[key] = encode_results(results)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+    
+    def save(self, path=None):
+        """
+        Save the stored results to a JSON file. If `path` is None, then the
+        default file is used.
+        """
+        if path is None:
+            path = self.path
+        with open(path, "w") as file:
+            json.dump([(key, results.hex()) for key, results in self.entries.items()], file)
+    
+    def load(self, path=None):
+        """
+        Load stored results from a JSON file, in addition to the current
+        ones. If `path` is None, then the default file is used.
+        """
+        if path is None:
+            path = self.path
+        with open(path) as file:
+            entries = json.load(file)
+        for key, results in entries:
+            self.entries[key] = bytes.fromhex(results)
+            self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
@@ -0,0 +1,63 @@
+# -*-coding:utf8-*-
+
+def strongly_connected_components(nodes, edges):
+    """
+    Compute the strongly connected components of a directed graph with
+    Tarjan's algorithm. The algorithm is written with an explicit stack, so
+    that long chains of dependencies do not hit Python's recursion limit.
+    
+    Parameters:
+    ----------
+    - nodes: iterable of hashable objects.
+    - edges: dict mapping each node to an iterable of nodes.
+    
+    Returns:
+    -------
+    - list of lists of nodes. The components are in reverse topological
+        order: a component comes after every component that it has an edge
+        to.
+    """
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    components = []
+    for root in nodes:
+        if root in index:
+            continue
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(edges[root]))]
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in index:
+                    index[child] = lowlink[child] = len(index)
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(edges[child])))
+                    break
+                elif child in on_stack:
+                    lowlink[node] = min(lowlink[node], index[child])
+            else: # all children visited
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        other_node = stack.pop()
+                        on_stack.discard(other_node)
+                        component.append(other_node)
+                        if other_node is node:
+                            break
+                    components.append(component)
+    return components
+
+def is_trivial_component(component, edges):
+    """
+    Check if `component` is a single node without a self-loop.
+    """
+    return len(component) == 1 and component[0] not in edges[component[0]]
@@ -0,0 +1,359 @@
+# -*-coding:utf8-*-
+
+import copy
+
+import numpy as np
+
+from chessdip.core.plan import AdjudicationPlan, PlanResolver
+
+class LockstepAdjudicator:
+    """
+    Adjudicator for a batch of order sets, lowered to AdjudicationPlans,
+    that runs all of them at once on NumPy arrays.
+    
+    Each adjudicated order has a lower and an upper bound on its result,
+    starting at False and True. At each iteration, the hold, attack,
+    prevent and defend strengths of every order of every member are
+    bounded from the current result bounds, which in turn bound the result
+    of each adjudication, as in `Adjudicator`. The bounds only tighten,
+    and the iteration stops when they no longer change. Strengths are
+    doubled, as in PlanResolver.
+    
+    A member is resolved when the bounds of all its results meet. The
+    other members have a cycle or a paradox, and are resolved by a
+    PlanResolver, with the backup rules of `Adjudicator`.
+    
+    Every array is indexed by member, then by order id. Members with fewer
+    orders are padded with orders of kind `AdjudicationPlan.OTHER`. Once
+    the bounds of a member stop changing, the member is left out of the
+    next iterations.
+    """
+    MEMBER_ARRAYS = (
+        "rep", "resolvable", "path_valid", "supported", "is_move",
+        "is_support", "is_convoy", "is_linker", "base", "valid",
+        "at_landing", "move_at_landing", "hold_at_landing",
+        "no_piece_at_landing", "at_landing_leaves", "at_landing_head_to_head",
+        "head_to_head", "same_power_at_landing", "valid_move_at_landing",
+        "hold_at_landing_only", "supports_convoy", "convoy_blocked",
+        "opposing_slots", "opposing_in_slot", "opposing_convoy_in_slot",
+        "path", "supports", "foreign_supports", "linked", "attacks", "cuts",
+        "opposing_moves"
+    )
+    
+    def __init__(self, plans):
+        self.plans = list(plans)
+        self.fallbacks = []
+        self.iterations = 0
+        self._compile()
+    
+    def adjudicate(self):
+        """
+        Resolve the adjudicated orders of every member.
+        
+        Returns:
+        -------
+        - list of lists of bools. For each plan, the results aligned with
+            `plan.adjudicable`, as returned by `PlanResolver.run`.
+        """
+        if not self.plans:
+            return []
+        lower, upper = self._iterate()
+        
+        results = []
+        self.fallbacks = []
+        for b, plan in enumerate(self.plans):
+            n = len(plan.orders)
+            reps = self.rep[b, :n]
+            resolved = lower[b, reps] == upper[b, reps]
+            if np.all(resolved[self.resolvable[b, :n]]):
+                results.append([bool(lower[b, reps[i]]) for i in plan.adjudicable])
+            else:
+                self.fallbacks.append(b)
+                results.append(PlanResolver(plan).run())
+        return results
+    
+    def _compile(self):
+        B = len(self.plans)
+        N = max([len(plan.orders) for plan in self.plans], default=0) or 1
+        self.B, self.N = B, N
+        
+        def vector(fill, dtype=int):
+            return np.full((B, N), fill, dtype=dtype)
+        
+        kind = vector(AdjudicationPlan.OTHER)
+        start, land, power, linker, supported = vector(-1), vector(-1), vector(-1), vector(-1), vector(-1)
+        valid, travel = vector(1), vector(0)
+        crossed = vector(0, dtype=np.uint64)
+        self.resolvable = vector(False, dtype=bool)
+        is_opposing = vector(False, dtype=bool)
+        is_attack = vector(False, dtype=bool)
+        order_at = np.full((B, 64), -1)
+        move_at = np.full((B, 64), -1)
+        hold_at = np.full((B, 64), -1)
+        self.path_valid = vector(True, dtype=bool)
+        supports, linked, path = [], [], []
+        for b, plan in enumerate(self.plans):
+            n = len(plan.orders)
+            kind[b, :n] = plan.kind
+            start[b, :n] = plan.start
+            land[b, :n] = plan.land
+            power[b, :n] = plan.power
+            linker[b, :n] = plan.linker
+            supported[b, :n] = plan.supported
+            valid[b, :n] = plan.valid
+            travel[b, :n] = plan.travel
+            crossed[b, :n] = plan.crossed
+            self.resolvable[b, :n] = plan.resolvable
+            is_opposing[b, plan.opposing] = True
+            is_attack[b, plan.attacks] = True
+            order_at[b] = plan.order_at
+            move_at[b] = plan.move_at
+            hold_at[b] = plan.hold_at
+            supports.append(_from_csr(b, plan.supports_ptr, plan.supports))
+            linked.append(_from_csr(b, plan.linked_ptr, plan.linked))
+            path.append(self._compile_path(b, plan))
+        
+        def matrix(entries):
+            ret = np.zeros((B, N, N), dtype=bool)
+            ret[tuple(np.concatenate(entries, axis=1))] = True
+            return ret
+        
+        self.supports = matrix(supports)
+        self.linked = matrix(linked)
+        self.path = matrix(path)
+        self.rep = np.where(linker != -1, linker, np.arange(N))
+        self.supported = supported
+        
+        self.is_move = kind == AdjudicationPlan.MOVE
+        self.is_support = kind == AdjudicationPlan.SUPPORT
+        self.is_convoy = kind == AdjudicationPlan.CONVOY
+        self.is_linker = kind == AdjudicationPlan.LINKER
+        self.base = np.where(travel == 1, 0, 2)
+        self.valid = valid == 1
+        
+        # Orders with the same landing square, and moves attacking supports
+        has_squares = self.is_move | self.is_support | self.is_convoy | (kind == AdjudicationPlan.HOLD)
+        other = ~np.eye(N, dtype=bool)
+        self.opposing = (has_squares[:, :, None] & is_opposing[:, None, :] & other
+            & (land[:, :, None] == land[:, None, :])
+        )
+        self.attacks = self.is_support[:, :, None] & is_attack[:, None, :] & (start[:, :, None] == land[:, None, :])
+        crossing = (crossed[:, None, :] >> np.maximum(land, 0).astype(np.uint64)[:, :, None]) & np.uint64(1)
+        self.cuts = (self.attacks
+            & (power[:, :, None] != power[:, None, :])
+            & (land[:, :, None] != start[:, None, :])
+            & (crossing == 0)
+        )
+        
+        # Piece at landing, as seen by attack, prevent and move adjudication
+        self.at_landing = np.where(has_squares, _gather(order_at, land), -1)
+        self.move_at_landing = np.where(has_squares, _gather(move_at, land), -1)
+        self.hold_at_landing = np.where(has_squares, _gather(hold_at, land), -1)
+        at_landing = self.at_landing
+        has_at_landing = at_landing != -1
+        at_move = has_at_landing & (_gather(kind, at_landing) == AdjudicationPlan.MOVE)
+        at_land = _gather(land, at_landing)
+        self.no_piece_at_landing = ~has_at_landing
+        self.at_landing_leaves = at_move & (at_land != start)
+        self.at_landing_head_to_head = at_move & (at_land == start)
+        self.head_to_head = self.at_landing_head_to_head & (_gather(valid, at_landing) == 1)
+        self.same_power_at_landing = has_at_landing & (_gather(power, at_landing) == power)
+        self.foreign_supports = self.supports & (power[:, None, :] != _gather(power, at_landing)[:, :, None])
+        
+        # Hold strength at the landing square
+        move_at_landing = self.move_at_landing
+        self.valid_move_at_landing = (move_at_landing != -1) & (_gather(valid, move_at_landing) == 1)
+        self.hold_at_landing_only = ~self.valid_move_at_landing & (self.hold_at_landing != -1)
+        
+        self.supports_convoy = (supported != -1) & (_gather(kind, supported) == AdjudicationPlan.CONVOY)
+        self.convoy_blocked = (move_at_landing == -1) & (self.hold_at_landing != -1)
+        self.opposing_moves = self.opposing & ~self.is_convoy[:, None, :]
+        
+        # Few orders share a landing square: keep the opposing orders of
+        # each order in slots, for `_masked_max`
+        slots = max(int(np.max(np.sum(self.opposing, axis=2))), 1)
+        self.opposing_slots = np.argsort(~self.opposing, axis=2, kind="stable")[:, :, :slots]
+        self.opposing_in_slot = np.take_along_axis(self.opposing, self.opposing_slots, axis=2)
+        self.opposing_convoy_in_slot = self.opposing_in_slot & _gather(self.is_convoy, self.opposing_slots.reshape(B, -1)).reshape(B, N, slots)
+        
+        # Relations that are only counted, see `_count`
+        for name in ("path", "supports", "foreign_supports", "linked", "attacks", "cuts", "opposing_moves"):
+            setattr(self, name, getattr(self, name).astype(np.float32))
+    
+    def _compile_path(self, b, plan):
+        """
+        Get the entries of the orders resolved by `PlanResolver._check_path`
+        for the orders of a plan. A convoy order found among the convoys of
+        its convoyed order only depends on the earlier convoys.
+        """
+        orders, convoys = [], []
+        for i in range(len(plan.orders)):
+            if plan.kind[i] == AdjudicationPlan.CONVOY:
+                convoyed = plan.convoyed[i]
+                earlier = plan.convoys[plan.convoys_ptr[convoyed]:plan.convoys_ptr[convoyed + 1]]
+                found = i in earlier
+                if found:
+                    earlier = earlier[:earlier.index(i)]
+                orders.extend([i] * len(earlier))
+                convoys.extend(earlier)
+                if found:
+                    continue
+            self.path_valid[b, i] = plan.valid[i] == 1
+            own_convoys = plan.convoys[plan.convoys_ptr[i]:plan.convoys_ptr[i + 1]]
+            orders.extend([i] * len(own_convoys))
+            convoys.extend(own_convoys)
+        return np.array([[b] * len(orders), orders, convoys], dtype=int).reshape(3, -1)
+    
+    def _iterate(self):
+        lower = np.zeros((self.B, self.N), dtype=bool)
+        upper = np.ones((self.B, self.N), dtype=bool)
+        self.iterations = 0
+        members = np.arange(self.B)
+        batch = self
+        while len(members):
+            self.iterations += 1
+            member_lower, member_upper = lower[members], upper[members]
+            adj_lower, adj_upper = batch._adjudicate(_gather(member_lower, batch.rep), _gather(member_upper, batch.rep))
+            new_lower = member_lower | (adj_lower & batch.resolvable)
+            new_upper = member_upper & (adj_upper | ~batch.resolvable)
+            lower[members], upper[members] = new_lower, new_upper
+            changed = np.any(new_lower != member_lower, axis=1) | np.any(new_upper != member_upper, axis=1)
+            if not np.all(changed):
+                members = members[changed]
+                batch = self._select(members)
+        return lower, upper
+    
+    def _select(self, members):
+        """
+        Get a copy of this adjudicator restricted to some members.
+        """
+        ret = copy.copy(self)
+        for name in LockstepAdjudicator.MEMBER_ARRAYS:
+            setattr(ret, name, getattr(self, name)[members])
+        return ret
+    
+    def _adjudicate(self, lower, upper):
+        """
+        Bound the adjudication of every order, given bounds on the results
+        of the orders, indexed by order id.
+        """
+        path_lower = self.path_valid & (_count(self.path, ~lower) == 0)
+        path_upper = self.path_valid & (_count(self.path, ~upper) == 0)
+        support_lower = 2 * _count(self.supports, lower)
+        support_upper = 2 * _count(self.supports, upper)
+        
+        attack_lower, attack_upper = self._get_attack_strength(lower, upper, path_lower, path_upper, support_lower, support_upper)
+        prevent_lower, prevent_upper = self._get_prevent_strength(lower, upper, path_lower, path_upper, support_lower, support_upper)
+        
+        # Moves
+        defend_lower = np.where(self.valid, self.base + support_lower, 0)
+        defend_upper = np.where(self.valid, self.base + support_upper, 0)
+        hold_lower, hold_upper = self._get_hold_strength(lower, upper, support_lower, support_upper)
+        first_lower = np.where(self.head_to_head, _gather(defend_lower, self.at_landing), hold_lower)
+        first_upper = np.where(self.head_to_head, _gather(defend_upper, self.at_landing), hold_upper)
+        opposing_lower = np.maximum(first_lower, self._masked_max(self.opposing_in_slot, prevent_lower))
+        opposing_upper = np.maximum(first_upper, self._masked_max(self.opposing_in_slot, prevent_upper))
+        move_lower = attack_lower > opposing_upper
+        move_upper = attack_upper > opposing_lower
+        
+        # Supports
+        supported_lower = ~self.supports_convoy | _gather(path_lower, self.supported)
+        supported_upper = ~self.supports_convoy | _gather(path_upper, self.supported)
+        broken_lower = _count(self.attacks, lower) + _count(self.cuts, path_lower) > 0
+        broken_upper = _count(self.attacks, upper) + _count(self.cuts, path_upper) > 0
+        supporting_lower = path_lower & supported_lower & ~broken_upper
+        supporting_upper = path_upper & supported_upper & ~broken_lower
+        
+        # Convoys
+        has_move = self.move_at_landing != -1
+        leaves_lower = ~has_move | _gather(lower, self.move_at_landing)
+        leaves_upper = ~has_move | _gather(upper, self.move_at_landing)
+        convoy_lower = (path_lower & ~self.convoy_blocked & leaves_lower
+            & (prevent_lower > self._masked_max(self.opposing_convoy_in_slot, prevent_upper))
+            & (_count(self.opposing_moves, upper) == 0)
+        )
+        convoy_upper = (path_upper & ~self.convoy_blocked & leaves_upper
+            & (prevent_upper > self._masked_max(self.opposing_convoy_in_slot, prevent_lower))
+            & (_count(self.opposing_moves, lower) == 0)
+        )
+        
+        adj_lower = np.select([self.is_move, self.is_support, self.is_convoy], [move_lower, supporting_lower, convoy_lower], False)
+        adj_upper = np.select([self.is_move, self.is_support, self.is_convoy], [move_upper, supporting_upper, convoy_upper], True)
+        
+        # Linkers
+        adj_lower = np.where(self.is_linker, _count(self.linked, ~adj_lower) == 0, adj_lower)
+        adj_upper = np.where(self.is_linker, _count(self.linked, ~adj_upper) == 0, adj_upper)
+        return adj_lower, adj_upper
+    
+    def _masked_max(self, in_slot, values):
+        """
+        Get the maximum of `values` over the opposing orders of each order
+        whose slot is in `in_slot`, or -1 if there are none.
+        """
+        return np.max(np.where(in_slot, np.take(values, self.opposing_slots + values.shape[1] * np.arange(len(values))[:, None, None]), -1), axis=2)
+    
+    # ==== Strength computations ====
+    
+    def _get_hold_strength(self, lower, upper, support_lower, support_upper):
+        """
+        Hold strength at the landing square of each order.
+        """
+        move_at_landing = self.move_at_landing
+        hold_at_landing = self.hold_at_landing
+        hold_lower = np.where(self.hold_at_landing_only, 2 + _gather(support_lower, hold_at_landing), 0)
+        hold_upper = np.where(self.hold_at_landing_only, 2 + _gather(support_upper, hold_at_landing), 0)
+        hold_lower = np.where(self.valid_move_at_landing, np.where(_gather(upper, move_at_landing), 0, 2), hold_lower)
+        hold_upper = np.where(self.valid_move_at_landing, np.where(_gather(lower, move_at_landing), 0, 2), hold_upper)
+        return hold_lower, hold_upper
+    
+    def _get_prevent_strength(self, lower, upper, path_lower, path_upper, support_lower, support_upper):
+        head_to_head_lower = self.at_landing_head_to_head & _gather(lower, self.at_landing)
+        head_to_head_upper = self.at_landing_head_to_head & _gather(upper, self.at_landing)
+        prevent_lower = np.where(self.is_convoy, np.maximum(1, support_lower),
+            np.where(head_to_head_upper, 0, self.base + support_lower)
+        )
+        prevent_upper = np.where(self.is_convoy, np.maximum(1, support_upper),
+            np.where(head_to_head_lower, 0, self.base + support_upper)
+        )
+        return np.where(path_lower, prevent_lower, 0), np.where(path_upper, prevent_upper, 0)
+    
+    def _get_attack_strength(self, lower, upper, path_lower, path_upper, support_lower, support_upper):
+        moving_lower = np.maximum(1, self.base + support_lower)
+        moving_upper = np.maximum(1, self.base + support_upper)
+        foreign_lower = 2 * _count(self.foreign_supports, lower)
+        foreign_upper = 2 * _count(self.foreign_supports, upper)
+        staying_lower = np.where(self.same_power_at_landing, 0, np.maximum(1, self.base + foreign_lower))
+        staying_upper = np.where(self.same_power_at_landing, 0, np.maximum(1, self.base + foreign_upper))
+        
+        # The piece at landing moves away if its result is True
+        leaves_lower = self.at_landing_leaves & _gather(lower, self.at_landing)
+        leaves_upper = self.at_landing_leaves & _gather(upper, self.at_landing)
+        attack_lower = np.where(self.no_piece_at_landing | leaves_lower, moving_lower,
+            np.where(leaves_upper, np.minimum(moving_lower, staying_lower), staying_lower)
+        )
+        attack_upper = np.where(self.no_piece_at_landing | leaves_lower, moving_upper,
+            np.where(leaves_upper, np.maximum(moving_upper, staying_upper), staying_upper)
+        )
+        return np.where(path_lower, attack_lower, 0), np.where(path_upper, attack_upper, 0)
+
+def _gather(values, index):
+    """
+    Get `values[b, index[b, i]]` for every member `b` and order `i`. Where
+    `index` is -1, the value of order 0 is returned, and should be masked.
+    """
+    return np.take_along_axis(values, np.maximum(index, 0), axis=1)
+
+def _count(relation, values):
+    """
+    Get the number of orders `j` with `relation[b, i, j]` and `values[b, j]`
+    for every member `b` and order `i`, as a batched matrix product.
+    """
+    return np.matmul(relation, values[:, :, None].astype(np.float32))[:, :, 0].astype(int)
+
+def _from_csr(b, ptr, values):
+    """
+    Get the (member, row, value) entries of a CSR list of a plan, as an
+    array of shape (3, len(values)).
+    """
+    rows = np.repeat(np.arange(len(ptr) - 1), np.diff(ptr))
+    return np.array([np.full(len(values), b), rows, values], dtype=int).reshape(3, -1)
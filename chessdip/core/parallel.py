@@ -0,0 +1,184 @@
+# -*-coding:utf8-*-
+
+import copy
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from chessdip.core.plan import PlanResolver, CompiledAdjudicator
+
+logger = logging.getLogger(__name__)
+
+def get_independent_components(plan):
+    """
+    Split the adjudicated orders of a plan into independent components:
+    two orders are in the same component if one may read the resolution
+    of the other. Orders read the orders that start or land on their
+    starting and landing squares, as well as their convoys, supports,
+    linked orders, and the orders they support or convoy, so these are
+    joined, with a union-find over order ids and square indices.
+    
+    Returns:
+    -------
+    - list of lists of positions in `plan.adjudicable`, one list per
+        component. The components are sorted by their first position, and
+        positions are sorted within each component.
+    """
+    n = len(plan.orders)
+    parent = list(range(n + 64)) # order ids, then square indices
+    
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    
+    def union(i, j):
+        i, j = find(i), find(j)
+        if i != j:
+            parent[j] = i
+    
+    for i in range(n):
+        if plan.start[i] != -1:
+            union(i, n + plan.start[i])
+            union(i, n + plan.land[i])
+        for j in (plan.linker[i], plan.convoyed[i], plan.supported[i]):
+            if j != -1:
+                union(i, j)
+        for ptr, values in ((plan.convoys_ptr, plan.convoys), (plan.supports_ptr, plan.supports), (plan.linked_ptr, plan.linked)):
+            for j in values[ptr[i]:ptr[i + 1]]:
+                union(i, j)
+    
+    components = {} # root: positions
+    for k, i in enumerate(plan.adjudicable):
+        components.setdefault(find(i), []).append(k)
+    return list(components.values())
+
+class ParallelAdjudicator(CompiledAdjudicator):
+    """
+    Adjudicator that splits the compiled order set into independent
+    components, see `get_independent_components`, and resolves them
+    concurrently with PlanResolvers on a pool of worker processes. The
+    components are packed into one job per worker, largest first. Only
+    the integer arrays of the plan are sent to the workers, not the
+    orders.
+    
+    Order sets with fewer than `min_orders` adjudicated orders, or with a
+    single component, are resolved in the current process, as by
+    `CompiledAdjudicator`: sending the plan costs more than resolving it.
+    In verbose mode, or with hooks, the adjudication runs on the orders
+    themselves, as in `Adjudicator`. The results are the same as those of
+    `Adjudicator`, since the resolution of a component never reads the
+    orders of another.
+    
+    If the pool breaks, e.g. because a worker process was killed, then the
+    error is logged and the order set is resolved in the current process.
+    Other errors of the workers are raised.
+    
+    This adjudicator is not offered by `GameManager`: on the 8x8 board,
+    order sets have far fewer orders than the default `min_orders`, and
+    forcing the pool is about 6 times slower than `Adjudicator` on
+    random order sets of a full board, since the components are small. The
+    pool pays off on larger boards and order sets, where the adjudicator
+    is used directly.
+    
+    The pool is made on first use and kept between adjudications, see
+    `rebind`, until `close` is called.
+    """
+    def __init__(self, order_interface, verbose=False, stats=False, hook=None, executor=None, workers=None, min_orders=256):
+        """
+        Parameters:
+        ----------
+        - order_interface, verbose, stats, hook: see `Adjudicator`.
+        - executor: concurrent.futures.Executor or None, optional. The pool
+            resolving the components. If None, then a ProcessPoolExecutor
+            is made when first needed. Default value is None.
+        - workers: int or None, optional. Number of jobs per order set, and
+            of worker processes of the pool made by the adjudicator. If
+            None, then the number of processors is used. Default value is
+            None.
+        - min_orders: int, optional. Number of adjudicated orders from which
+            the components are resolved on the pool. Default value is 256.
+        """
+        super().__init__(order_interface, verbose=verbose, stats=stats, hook=hook)
+        self.own_executor = executor is None
+        self.executor = executor
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.min_orders = min_orders
+        self.components = 0
+    
+    def adjudicate(self):
+        if self.verbose or self.hooks:
+            return super().adjudicate()
+        
+        plan, resolver = self._get_resolver()
+        components = get_independent_components(plan)
+        self.components = len(components)
+        if len(plan.adjudicable) < self.min_orders or len(components) < 2 or self.workers < 2:
+            return super().adjudicate()
+        
+        # Longest processing time first: give each component to the job
+        # with the fewest orders
+        jobs = [[] for _ in range(min(self.workers, len(components)))]
+        for component in sorted(components, key=len, reverse=True):
+            min(jobs, key=len).extend(component)
+        plan_arrays = _get_plan_arrays(plan)
+        adjudicable = plan.adjudicable
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        futures = [self.executor.submit(_resolve_job, plan_arrays, [adjudicable[k] for k in sorted(job)]) for job in jobs]
+        try:
+            job_results = [future.result() for future in futures]
+        except BrokenProcessPool:
+            logger.warning("Worker pool of ParallelAdjudicator broke, resolving in the current process.", exc_info=True)
+            self.close()
+            return super().adjudicate()
+        
+        results = [None] * len(adjudicable)
+        for job, job_result in zip(jobs, job_results):
+            for k, (result, resolved_result, resolved) in zip(sorted(job), job_result):
+                i = adjudicable[k]
+                results[k] = result
+                resolver.result[i] = resolved_result
+                resolver.resolved[i] = resolved
+        for i in adjudicable:
+            self.result[plan.orders[i]] = resolver.result[i]
+            self.resolved[plan.orders[i]] = resolver.resolved[i]
+        for i, result in zip(adjudicable, results):
+            self.order_interface.set_success(plan.orders[i], result)
+        # Set virtual moves to fail
+        for order in self.order_interface.get_orders():
+            if order.get_virtual():
+                self.order_interface.set_success(order, False)
+        return self.stats
+    
+    def close(self):
+        """
+        Shut down the pool, if it was made by this adjudicator.
+        """
+        if self.own_executor and self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+def _get_plan_arrays(plan):
+    """
+    Copy of a plan without its orders, which are not needed to resolve it.
+    """
+    plan_arrays = copy.copy(plan)
+    plan_arrays.orders = [None] * len(plan.orders)
+    plan_arrays.ids = {}
+    plan_arrays.powers = {}
+    return plan_arrays
+
+def _resolve_job(plan, ids):
+    """
+    Resolve the orders `ids` of a plan, in order.
+    
+    Returns:
+    -------
+    - list of (result, resolved result, resolved) for each id.
+    """
+    resolver = PlanResolver(plan)
+    results = [resolver._resolve(i, True) for i in ids]
+    return [(result, resolver.result[i], resolver.resolved[i]) for result, i in zip(results, ids)]
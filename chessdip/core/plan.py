@@ -0,0 +1,541 @@
+# -*-coding:utf8-*-
+
+from itertools import accumulate, chain
+
+from chessdip.board.square import get_square_id
+from chessdip.core.order import (
+    HoldOrder, MoveOrder, ConvoyOrder, SupportOrder, OrderLinker, LinkedOrder
+)
+from chessdip.core.adjudicator import Adjudicator
+
+class AdjudicationPlan:
+    """
+    Order set lowered to flat integer arrays, for `PlanResolver`. Every
+    order, including virtual orders and order linkers, gets an id, which
+    indexes the following lists:
+    - orders: the original orders.
+    - kind: one of the order kinds below.
+    - linker: id of the order linker of a linked order, or -1.
+    - start, land: starting and landing square indices, or -1.
+    - power: power id of the piece, or -1.
+    - valid: path validity of orders with a chess path, 1 for the others.
+    - travel: 1 for travel moves.
+    - crossed: intermediate squares, as a bitmask of square indices.
+    - convoyed, supported: id of the convoyed or supported order, or -1.
+    - resolvable: 1 if the adjudicator keeps a resolution for the order.
+    The convoys, real supports and linked orders of each order are stored
+    in compressed sparse row (CSR) form: the convoys of order `i` are
+    `convoys[convoys_ptr[i]:convoys_ptr[i + 1]]`, and likewise for the
+    others.
+    
+    The lookups of `Adjudicator` by square are lists of length 64 holding
+    an order id or -1 (`move_at`, `hold_at`, `convoy_at`, `order_at`), or
+    CSR lists by landing square (`opposing`, `attacks`). Finally,
+    `adjudicable` lists the ids of the adjudicated orders, in the order of
+    `OrderInterface.get_adjudicable_orders`.
+    """
+    HOLD = 0
+    MOVE = 1
+    SUPPORT = 2
+    CONVOY = 3
+    LINKER = 4
+    OTHER = 5
+    
+    def __init__(self, order_interface):
+        self.ids = {}
+        self.orders = []
+        self.powers = {}
+        for order in order_interface.get_orders():
+            self._get_id(order)
+        self.adjudicable = [self._get_id(order) for order in order_interface.get_adjudicable_orders()]
+        
+        # Orders may be added while compiling, e.g. order linkers
+        i = 0
+        self.kind, self.linker, self.start, self.land, self.power = [], [], [], [], []
+        self.valid, self.travel, self.crossed, self.convoyed, self.supported = [], [], [], [], []
+        convoys, supports, linked = [], [], []
+        while i < len(self.orders):
+            self._compile_order(self.orders[i], convoys, supports, linked)
+            i += 1
+        self.convoys_ptr, self.convoys = _to_csr(convoys)
+        self.supports_ptr, self.supports = _to_csr(supports)
+        self.linked_ptr, self.linked = _to_csr(linked)
+        
+        self.resolvable = [0] * len(self.orders)
+        for i in self.adjudicable:
+            self.resolvable[i] = 1
+        self._compile_lookups(order_interface)
+    
+    def _get_id(self, order):
+        if order not in self.ids:
+            self.ids[order] = len(self.orders)
+            self.orders.append(order)
+        return self.ids[order]
+    
+    def _get_power_id(self, piece):
+        if piece is None:
+            return -1
+        return self.powers.setdefault(piece.get_power(), len(self.powers))
+    
+    def _compile_order(self, order, convoys, supports, linked):
+        if isinstance(order, OrderLinker):
+            self.kind.append(AdjudicationPlan.LINKER)
+            self.linker.append(-1)
+            self.start.append(-1)
+            self.land.append(-1)
+            self.power.append(-1)
+            self.valid.append(1)
+            self.travel.append(0)
+            self.crossed.append(0)
+            self.convoyed.append(-1)
+            self.supported.append(-1)
+            convoys.append([])
+            supports.append([])
+            linked.append([self._get_id(linked_order) for linked_order in order.get_orders()])
+            return
+        
+        if isinstance(order, HoldOrder):
+            kind = AdjudicationPlan.HOLD
+        elif isinstance(order, MoveOrder):
+            kind = AdjudicationPlan.MOVE
+        elif isinstance(order, SupportOrder):
+            kind = AdjudicationPlan.SUPPORT
+        elif isinstance(order, ConvoyOrder):
+            kind = AdjudicationPlan.CONVOY
+        else:
+            kind = AdjudicationPlan.OTHER
+        self.kind.append(kind)
+        self.linker.append(self._get_id(order.get_linker()) if isinstance(order, LinkedOrder) else -1)
+        
+        if kind == AdjudicationPlan.OTHER:
+            self.start.append(-1)
+            self.land.append(-1)
+        elif kind == AdjudicationPlan.SUPPORT:
+            # Generic support orders, left virtual when a support convoy
+            # order has no matching support, have no landing square
+            self.start.append(get_square_id(order.get_starting_square()))
+            self.land.append(get_square_id(order.supported_square))
+        else:
+            self.start.append(get_square_id(order.get_starting_square()))
+            self.land.append(get_square_id(order.get_landing_square()))
+        self.power.append(self._get_power_id(order.get_piece()))
+        chess_path = getattr(order, "chess_path", None)
+        self.valid.append(1 if chess_path is None or chess_path.valid else 0)
+        self.travel.append(1 if kind == AdjudicationPlan.MOVE and order.is_travel() else 0)
+        crossed = 0
+        for square in order.get_intermediate_squares():
+            crossed |= 1 << get_square_id(square)
+        self.crossed.append(crossed)
+        
+        convoyed_order = order.get_convoyed_order() if kind == AdjudicationPlan.CONVOY else None
+        self.convoyed.append(-1 if convoyed_order is None else self._get_id(convoyed_order))
+        supported_order = order.get_supported_order()
+        self.supported.append(-1 if supported_order is None else self._get_id(supported_order))
+        convoys.append([self._get_id(convoy_order) for convoy_order in order.get_convoys()])
+        supports.append([self._get_id(support_order) for support_order in order.get_supports() if not support_order.get_virtual()])
+        linked.append([])
+    
+    def _compile_lookups(self, order_interface):
+        """
+        See `Adjudicator._build_indexes`.
+        """
+        self.move_at = [-1] * 64
+        self.hold_at = [-1] * 64
+        self.convoy_at = [-1] * 64
+        self.order_at = [-1] * 64
+        opposing = [[] for _ in range(64)]
+        attacks = [[] for _ in range(64)]
+        for order in order_interface.get_orders():
+            i = self.ids[order]
+            kind = self.kind[i]
+            if kind == AdjudicationPlan.OTHER:
+                continue
+            square = self.start[i]
+            if kind == AdjudicationPlan.HOLD and self.hold_at[square] == -1:
+                self.hold_at[square] = i
+            if kind != AdjudicationPlan.CONVOY and self.order_at[square] == -1:
+                self.order_at[square] = i
+            if order.get_virtual():
+                continue
+            if kind == AdjudicationPlan.MOVE and self.move_at[square] == -1:
+                self.move_at[square] = i
+            elif kind == AdjudicationPlan.CONVOY and self.convoy_at[square] == -1:
+                self.convoy_at[square] = i
+            if kind == AdjudicationPlan.MOVE or kind == AdjudicationPlan.CONVOY:
+                opposing[self.land[i]].append(i)
+        for i in self.adjudicable:
+            if self.kind[i] == AdjudicationPlan.MOVE:
+                attacks[self.land[i]].append(i)
+        self.opposing_ptr, self.opposing = _to_csr(opposing)
+        self.attacks_ptr, self.attacks = _to_csr(attacks)
+
+def _to_csr(rows):
+    ptr = [0, *accumulate(map(len, rows))]
+    values = list(chain.from_iterable(rows))
+    return ptr, values
+
+class PlanResolver:
+    """
+    Partial information algorithm of `Adjudicator`, running on the integer
+    arrays of an AdjudicationPlan. Each method mirrors the method of
+    `Adjudicator` with the same name, and the results are the same.
+    
+    Strengths are doubled, so that they stay integers: a strength of 0.5
+    becomes 1, and each unit of strength becomes 2.
+    """
+    def __init__(self, plan):
+        self.plan = plan
+        n = len(plan.orders)
+        self.result = [False] * n
+        self.resolved = [False] * n
+        self.visited = [False] * n
+        self.cycle = []
+        self.recursion_hits = 0
+        self.uncertain = True
+    
+    def run(self):
+        """
+        Resolve the adjudicated orders.
+        
+        Returns:
+        -------
+        - list of bools, aligned with `plan.adjudicable`.
+        """
+        return [self._resolve(i, True) for i in self.plan.adjudicable]
+    
+    # ==== Main adjudication functions ====
+    
+    def _resolve(self, i, optimistic):
+        plan = self.plan
+        if plan.linker[i] != -1:
+            i = plan.linker[i]
+        if not plan.resolvable[i]:
+            # Same failure as `Adjudicator`, which has no entry for the order
+            raise KeyError(plan.orders[i])
+        
+        if self.resolved[i]:
+            return self.result[i]
+        elif i in self.cycle:
+            self.uncertain = True
+            return optimistic
+        elif self.visited[i]:
+            self.cycle.append(i)
+            self.recursion_hits += 1
+            self.uncertain = True
+            return optimistic
+        
+        self.visited[i] = True
+        old_cycle_len = len(self.cycle)
+        old_recursion_hits = self.recursion_hits
+        old_uncertain = self.uncertain
+        
+        self.uncertain = False
+        opt_result = self._adjudicate(i, True)
+        if self.uncertain and opt_result:
+            pes_result = self._adjudicate(i, False)
+        else:
+            pes_result = opt_result
+        self.visited[i] = False
+        
+        if opt_result == pes_result:
+            self.cycle = self.cycle[:old_cycle_len]
+            self.recursion_hits = old_recursion_hits
+            self.uncertain = old_uncertain
+            self.result[i] = opt_result
+            self.resolved[i] = True
+            return opt_result
+        
+        elif i in self.cycle:
+            self.recursion_hits -= 1
+            
+            if self.recursion_hits == old_recursion_hits:
+                self._backup_rule(self.cycle[old_cycle_len:])
+                self.cycle = self.cycle[:old_cycle_len]
+                self.uncertain = old_uncertain
+                return self._resolve(i, optimistic)
+        
+        elif not i in self.cycle:
+            self.cycle.append(i)
+        return optimistic
+    
+    def _adjudicate(self, i, optimistic):
+        kind = self.plan.kind[i]
+        if kind == AdjudicationPlan.LINKER:
+            return self._adjudicate_linker(i, optimistic)
+        elif kind == AdjudicationPlan.MOVE:
+            return self._adjudicate_move(i, optimistic)
+        elif kind == AdjudicationPlan.SUPPORT:
+            return self._adjudicate_support(i, optimistic)
+        elif kind == AdjudicationPlan.CONVOY:
+            return self._adjudicate_convoy(i, optimistic)
+        raise ValueError(f"Adjudicating unexpected order: {self.plan.orders[i]}")
+    
+    def _backup_rule(self, cycle):
+        if not cycle:
+            raise NameError("No orders in backup!")
+        kind = self.plan.kind
+        if any(kind[i] == AdjudicationPlan.CONVOY for i in cycle): # Szykman's rule
+            for i in cycle:
+                if kind[i] == AdjudicationPlan.CONVOY:
+                    self.result[i] = False
+                    self.resolved[i] = True
+                else:
+                    self.resolved[i] = False
+        else: # circular movement
+            for i in cycle:
+                if kind[i] == AdjudicationPlan.MOVE:
+                    self.result[i] = True
+                    self.resolved[i] = True
+                else:
+                    self.resolved[i] = False
+    
+    # ==== Core adjudication functions ====
+    
+    def _adjudicate_linker(self, i, optimistic):
+        plan = self.plan
+        for j in plan.linked[plan.linked_ptr[i]:plan.linked_ptr[i + 1]]:
+            if not self._adjudicate(j, optimistic):
+                return False
+        return True
+    
+    def _adjudicate_move(self, i, optimistic):
+        plan = self.plan
+        landing = plan.land[i]
+        at_landing = plan.order_at[landing]
+        attack_strength = self._get_attack_strength(i, at_landing, optimistic)
+        
+        if (at_landing != -1
+            and plan.kind[at_landing] == AdjudicationPlan.MOVE
+            and plan.land[at_landing] == plan.start[i]
+            and plan.valid[at_landing]
+        ): # Head-to-head
+            if self._get_defend_strength(at_landing, not optimistic) >= attack_strength:
+                return False
+        elif self._get_hold_strength(landing, not optimistic) >= attack_strength:
+            return False
+        
+        for j in plan.opposing[plan.opposing_ptr[landing]:plan.opposing_ptr[landing + 1]]:
+            if j != i and self._get_prevent_strength(j, at_landing, not optimistic) >= attack_strength:
+                return False
+        return True
+    
+    def _adjudicate_support(self, i, optimistic):
+        plan = self.plan
+        if not self._check_path(i, optimistic):
+            return False
+        
+        supported = plan.supported[i]
+        if (supported != -1
+            and plan.kind[supported] == AdjudicationPlan.CONVOY
+            and not self._check_path(supported, optimistic)
+        ):
+            return False
+        start = plan.start[i]
+        landing = plan.land[i]
+        for j in plan.attacks[plan.attacks_ptr[start]:plan.attacks_ptr[start + 1]]:
+            # checking for dislodge
+            if self._resolve(j, not optimistic):
+                return False
+            if (plan.power[j] != plan.power[i]
+                and landing != plan.start[j]
+                and not plan.crossed[j] >> landing & 1
+                and self._check_path(j, not optimistic)
+            ): # checking for cut
+                return False
+        return True
+    
+    def _adjudicate_convoy(self, i, optimistic):
+        plan = self.plan
+        if not self._check_path(i, optimistic):
+            return False
+        
+        landing = plan.land[i]
+        at_landing = plan.move_at[landing]
+        if at_landing != -1:
+            # check if piece moves away
+            if not self._resolve(at_landing, optimistic):
+                return False
+        elif plan.hold_at[landing] != -1:
+            # a piece is holding; convoy cannot succeed
+            return False
+        
+        convoy_strength = self._get_prevent_strength(i, -1, optimistic)
+        for j in plan.opposing[plan.opposing_ptr[landing]:plan.opposing_ptr[landing + 1]]:
+            if j == i:
+                continue
+            elif plan.kind[j] == AdjudicationPlan.CONVOY: # competing convoy
+                if self._get_prevent_strength(j, -1, not optimistic) >= convoy_strength:
+                    return False
+            elif self._resolve(j, not optimistic): # attacking piece
+                return False
+        return True
+    
+    def _check_path(self, i, optimistic):
+        plan = self.plan
+        if plan.kind[i] == AdjudicationPlan.CONVOY: # check earlier convoys
+            convoyed = plan.convoyed[i]
+            for j in plan.convoys[plan.convoys_ptr[convoyed]:plan.convoys_ptr[convoyed + 1]]:
+                if j == i:
+                    return True
+                elif not self._resolve(j, optimistic):
+                    return False
+        
+        if not plan.valid[i]:
+            return False
+        
+        for j in plan.convoys[plan.convoys_ptr[i]:plan.convoys_ptr[i + 1]]:
+            if not self._resolve(j, optimistic):
+                return False
+        return True
+    
+    # ==== Strength computations ====
+    
+    def _get_hold_strength(self, square, optimistic):
+        plan = self.plan
+        i = plan.move_at[square]
+        if i != -1 and plan.valid[i]:
+            return 0 if self._resolve(i, not optimistic) else 2
+        i = plan.hold_at[square]
+        if i != -1:
+            return 2 + self._get_support_strength(i, optimistic)
+        return 0
+    
+    def _get_prevent_strength(self, i, at_landing, optimistic):
+        plan = self.plan
+        if not self._check_path(i, optimistic):
+            return 0
+        elif plan.kind[i] == AdjudicationPlan.CONVOY:
+            return max(1, self._get_support_strength(i, optimistic))
+        elif (at_landing != -1
+            and plan.kind[at_landing] == AdjudicationPlan.MOVE
+            and plan.land[at_landing] == plan.start[i]
+            and self._resolve(at_landing, not optimistic)
+        ): # head-to-head succeeds
+            return 0
+        return (0 if plan.travel[i] else 2) + self._get_support_strength(i, optimistic)
+    
+    def _get_defend_strength(self, i, optimistic):
+        plan = self.plan
+        if not plan.valid[i]:
+            return 0
+        return (0 if plan.travel[i] else 2) + self._get_support_strength(i, optimistic)
+    
+    def _get_attack_strength(self, i, at_landing, optimistic):
+        plan = self.plan
+        if not self._check_path(i, optimistic):
+            return 0
+        
+        if at_landing == -1:
+            return max(1, (0 if plan.travel[i] else 2) + self._get_support_strength(i, optimistic))
+        elif (plan.kind[at_landing] == AdjudicationPlan.MOVE
+            and plan.land[at_landing] != plan.start[i]
+            and self._resolve(at_landing, optimistic)
+        ): # no head-to-head, piece at landing moves
+            return max(1, (0 if plan.travel[i] else 2) + self._get_support_strength(i, optimistic))
+        elif plan.power[at_landing] == plan.power[i]:
+            # piece at landing is from the same power
+            return 0
+        # head-to-head or failed move at landing
+        attack_strength = 0 if plan.travel[i] else 2
+        power_at_landing = plan.power[at_landing]
+        for j in plan.supports[plan.supports_ptr[i]:plan.supports_ptr[i + 1]]:
+            if plan.power[j] != power_at_landing and self._resolve(j, optimistic):
+                attack_strength += 2
+        return max(1, attack_strength)
+    
+    def _get_support_strength(self, i, optimistic):
+        plan = self.plan
+        support = 0
+        for j in plan.supports[plan.supports_ptr[i]:plan.supports_ptr[i + 1]]:
+            if self._resolve(j, optimistic):
+                support += 2
+        return support
+
+class CompiledAdjudicator(Adjudicator):
+    """
+    Adjudicator that compiles the order set into an AdjudicationPlan, and
+    resolves it with a PlanResolver. The results are the same as those of
+    `Adjudicator`. In verbose mode, or with hooks, the adjudication runs on
+    the orders themselves, as in `Adjudicator`.
+    
+    Compiling costs more than resolving: adjudicating an order set once,
+    e.g. each test case of the DATC, is about twice as slow as with
+    `Adjudicator`. The plan is therefore kept between `query`, `adjudicate`
+    and `rebind`, until the order set changes, see `OrderInterface.changes`,
+    so that adjudicating an unchanged order set again only resolves it,
+    about 1.3 times faster than `Adjudicator`. This pays off from about
+    four adjudications of the same order set.
+    
+    The order indexes of `Adjudicator` are not needed by the plan, so they
+    are built on first access, e.g. by `_get_dependency_graph`.
+    """
+    def __init__(self, order_interface, verbose=False, stats=False, hook=None):
+        super().__init__(order_interface, verbose=verbose, stats=stats, hook=hook)
+        self.plan = None
+        self.plan_changes = None # changes of the order interface when compiling the plan
+        self.resolver = None
+    
+    def adjudicate(self):
+        if self.verbose or self.hooks:
+            return super().adjudicate()
+        
+        plan, resolver = self._get_resolver()
+        results = resolver.run()
+        for i in plan.adjudicable:
+            self.result[plan.orders[i]] = resolver.result[i]
+            self.resolved[plan.orders[i]] = resolver.resolved[i]
+        for i, result in zip(plan.adjudicable, results):
+            self.order_interface.set_success(plan.orders[i], result)
+        # Set virtual moves to fail
+        for order in self.order_interface.get_orders():
+            if order.get_virtual():
+                self.order_interface.set_success(order, False)
+        return self.stats
+    
+    def rebind(self, order_interface=None):
+        if order_interface is not None and order_interface is not self.order_interface:
+            self.plan = None
+        super().rebind(order_interface)
+        self.resolver = None
+    
+    def query(self, orders):
+        if self.verbose or self.hooks:
+            return super().query(orders)
+        
+        plan, resolver = self._get_resolver()
+        results = []
+        for order in orders:
+            i = plan.ids.get(order)
+            if i is not None and plan.linker[i] != -1:
+                i = plan.linker[i]
+            if i is not None and plan.resolvable[i]:
+                results.append(resolver._resolve(i, True))
+            elif not isinstance(order, OrderLinker) and order.get_virtual():
+                results.append(False)
+            else:
+                raise ValueError(f"Querying unexpected order: {order}")
+        return results
+    
+    def _get_resolver(self):
+        if self.plan is None or self.plan_changes != self.order_interface.changes:
+            self.plan = AdjudicationPlan(self.order_interface)
+            self.plan_changes = self.order_interface.changes
+            self.resolver = None
+        if self.resolver is None:
+            self.resolver = PlanResolver(self.plan)
+        return self.plan, self.resolver
+    
+    def _build_indexes(self, reuse=False):
+        """
+        Drop the order indexes, so that they are built again on first
+        access, see `__getattr__`.
+        """
+        for name in Adjudicator.INDEXES:
+            self.__dict__.pop(name, None)
+    
+    def __getattr__(self, name):
+        # Only called for missing attributes
+        if name in Adjudicator.INDEXES:
+            Adjudicator._build_indexes(self)
+            return self.__dict__[name]
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
@@ -0,0 +1,93 @@
+# -*-coding:utf8-*-
+
+import time
+
+from chessdip.core.order import LinkedOrder
+from chessdip.core.adjudicator import Adjudicator
+from chessdip.core.graph import strongly_connected_components, is_trivial_component
+
+class SCCAdjudicator(Adjudicator):
+    """
+    Adjudicator that first splits the dependency graph of the order set
+    into strongly connected components (SCCs), using Tarjan's algorithm.
+    The components are resolved in topological order, so that every order
+    outside a cycle is resolved in a single pass, without guessing. The
+    guessing of the partial information algorithm, as well as the backup
+    rules (Szykman's rule and circular movement), are only needed inside
+    non-trivial components.
+    
+    The results are the same as those of `Adjudicator`, but it is not
+    faster: on the DATC cases, adjudicating takes about twice as long, and
+    about 1.4 times as long through `GameManager.adjudicate`. `Adjudicator`
+    does not guess outside cycles either, so building the dependency graph
+    and running Tarjan's algorithm on every adjudication costs more than
+    it saves, at any order set size of the 8x8 board.
+    """
+    def adjudicate(self):
+        if self.hooks:
+            self._hook_adjudication_started(self.orders)
+        graph = self._get_dependency_graph()
+        position = {order: i for i, order in enumerate(self.orders)}
+        results = {}
+        for component in strongly_connected_components(self.orders, graph):
+            if is_trivial_component(component, graph):
+                order = component[0]
+                if self.hooks:
+                    results[order] = self._resolve_timed(order, graph[order])
+                else:
+                    results[order] = self._resolve_acyclic(order, graph[order])
+            else:
+                # Resolve in the same order as `Adjudicator.adjudicate`
+                for order in sorted(component, key=position.get):
+                    if self.hooks:
+                        results[order] = self._resolve_timed(order)
+                    else:
+                        results[order] = self._resolve(order, True)
+        
+        for order in self.orders:
+            self.order_interface.set_success(order, results[order])
+        # Set virtual moves to fail
+        for order in self.order_interface.get_orders():
+            if order.get_virtual():
+                self.order_interface.set_success(order, False)
+        return self.stats
+    
+    def _resolve_timed(self, order, dependencies=None):
+        """
+        See `Adjudicator._resolve_timed`. If `dependencies` is given, then
+        the order is resolved with `_resolve_acyclic`.
+        """
+        if dependencies is None:
+            return super()._resolve_timed(order)
+        start = time.perf_counter()
+        result = self._resolve_acyclic(order, dependencies)
+        seconds = time.perf_counter() - start
+        for hook in self.hooks:
+            hook.order_resolved(order, seconds)
+        return result
+    
+    def _resolve_acyclic(self, order, dependencies):
+        """
+        Resolve an order that does not belong to a cycle. If all of its
+        dependencies are resolved, then a single adjudication suffices;
+        otherwise, fall back to the partial information algorithm.
+        """
+        if isinstance(order, LinkedOrder) or self.resolved[order]:
+            return self._resolve(order, True)
+        for other_order in dependencies:
+            if not self.resolved[other_order]:
+                return self._resolve(order, True)
+        
+        if self.verbose:
+            self._debug_out(f"Resolve {order} acyclic")
+            self._debug_call_depth += 1
+        if self.hooks:
+            self._hook_resolve_started(order, True)
+        result = self._adjudicate(order, True)
+        self.result[order] = result
+        self.resolved[order] = True
+        if self.verbose:
+            self._debug_out_decr(f"end resolve: {self._debug_result(result)}, {self._debug_resolved(order)}")
+        if self.hooks:
+            self._hook_resolve_ended(order, result, "adjudicated")
+        return result
@@ -0,0 +1,374 @@
+# -*-coding:utf8-*-
+
+from chessdip.core.order import (
+    ConvoyOrder, SupportOrder, OrderLinker, LinkedOrder, BuildOrder, DisbandOrder
+)
+from chessdip.core.adjudicator import Adjudicator
+
+_MISSING = object()
+
+class JournaledDict(dict):
+    """
+    Dict that records how to undo its changes in the last journal of
+    `journals`, if any. Only item assignment, deletion and `pop` are
+    recorded.
+    """
+    def __init__(self, journals, *args):
+        super().__init__(*args)
+        self.journals = journals
+    
+    def __setitem__(self, key, value):
+        if self.journals:
+            self.journals[-1].append((self._restore, (key, self.get(key, _MISSING))))
+        super().__setitem__(key, value)
+    
+    def __delitem__(self, key):
+        if self.journals:
+            self.journals[-1].append((self._restore, (key, self[key])))
+        super().__delitem__(key)
+    
+    def pop(self, key, *default):
+        if self.journals and key in self:
+            self.journals[-1].append((self._restore, (key, self[key])))
+        return super().pop(key, *default)
+    
+    def _restore(self, key, value):
+        if value is _MISSING:
+            super().pop(key, None)
+        else:
+            super().__setitem__(key, value)
+
+class IncrementalAdjudicator(Adjudicator):
+    """
+    Adjudicator that records what each resolution reads, so that it can be
+    kept between changes of the order set and only re-resolve the orders
+    affected by a change.
+    
+    A resolution reads:
+    - squares, through the order retrieval functions and the search for
+        moves attacking a supporting piece,
+    - orders, through their supports and convoys,
+    - other resolutions, through `_resolve`.
+    An order is affected by a change if it read a changed square or order,
+    or if it read the resolution of an affected order.
+    
+    The state of the adjudicator can be restored to a checkpoint, see
+    `checkpoint`.
+    """
+    INDEXES = ("orders",) + Adjudicator.INDEXES
+    
+    def __init__(self, order_interface, verbose=False, stats=False, hook=None):
+        self.journals = []
+        self.reading = [] # stack of orders being resolved
+        self.reads = JournaledDict(self.journals) # order: (squares, orders, resolutions) read by the order
+        self.square_readers = {}
+        self.order_readers = {}
+        self.resolution_readers = {}
+        super().__init__(order_interface, verbose=verbose, stats=stats, hook=hook)
+        self.result = JournaledDict(self.journals, self.result)
+        self.resolved = JournaledDict(self.journals, self.resolved)
+        self.visited = JournaledDict(self.journals, self.visited)
+    
+    def checkpoint(self):
+        """
+        Start recording the changes of the resolutions, so that they can be
+        undone with `rollback`, or kept with `merge`. The cost of either is
+        proportional to the number of changes. The indexes rebuilt by
+        `update` are restored by reference.
+        """
+        journal = [(setattr, (self, name, getattr(self, name))) for name in IncrementalAdjudicator.INDEXES]
+        journal.append((setattr, (self, "cycle", list(self.cycle))))
+        journal.append((setattr, (self, "recursion_hits", self.recursion_hits)))
+        journal.append((setattr, (self, "uncertain", self.uncertain)))
+        self.journals.append(journal)
+    
+    def rollback(self):
+        """
+        Undo the changes since the last checkpoint, and drop it.
+        """
+        journal = self.journals.pop()
+        journals = self.journals[:]
+        self.journals.clear()
+        try:
+            for undo, args in reversed(journal):
+                undo(*args)
+        finally:
+            self.journals.extend(journals)
+    
+    def merge(self):
+        """
+        Keep the changes since the last checkpoint, and drop it.
+        """
+        journal = self.journals.pop()
+        if self.journals:
+            self.journals[-1].extend(journal)
+    
+    def rebind(self, order_interface=None):
+        """
+        Forget every resolution, and rebind to the current order set of the
+        order interface, or of `order_interface` if given. Unlike in
+        `Adjudicator.rebind`, the indexes are made anew, so that they can
+        be restored by reference, see `checkpoint`.
+        """
+        if order_interface is not None:
+            self.order_interface = order_interface
+        self.update(list(self.resolved))
+    
+    def update(self, changed_orders):
+        """
+        Invalidate the resolutions affected by the changed orders, and
+        rebind to the current order set of the order interface.
+        """
+        squares = set()
+        for order in changed_orders:
+            squares.update(_get_squares(order))
+        
+        affected = set()
+        for square in squares:
+            affected.update(self.square_readers.get(square, ()))
+        for order in changed_orders:
+            if isinstance(order, LinkedOrder):
+                affected.add(order.get_linker())
+            affected.add(order)
+            affected.update(self.order_readers.get(order, ()))
+        
+        # Propagate to the orders that read affected resolutions
+        stack = list(affected)
+        while stack:
+            order = stack.pop()
+            for reader in self.resolution_readers.get(order, ()):
+                if reader not in affected:
+                    affected.add(reader)
+                    stack.append(reader)
+        
+        for order in affected:
+            self._forget_reads(order)
+            if order in self.resolved:
+                self.resolved[order] = False
+        self._rebind()
+    
+    def _rebind(self):
+        orders = self.order_interface.get_adjudicable_orders()
+        current = set(orders)
+        for order in self.orders:
+            if order not in current:
+                self._forget_reads(order)
+                del self.result[order]
+                del self.resolved[order]
+                del self.visited[order]
+        for order in orders:
+            if order not in self.resolved:
+                self.result[order] = False
+                self.resolved[order] = False
+                self.visited[order] = False
+        self.orders = orders
+        self._build_indexes()
+        
+        self.cycle = []
+        self.recursion_hits = 0
+        self.uncertain = True
+        for order in self.orders:
+            self.visited[order] = False
+    
+    # ==== Recording ====
+    
+    def _forget_reads(self, order):
+        if order not in self.reads:
+            return
+        squares, orders, resolutions = self.reads.pop(order)
+        for square in squares:
+            self._discard(self.square_readers[square], order)
+        for other_order in orders:
+            self._discard(self.order_readers[other_order], order)
+        for other_order in resolutions:
+            self._discard(self.resolution_readers[other_order], order)
+    
+    def _get_reads(self):
+        reader = self.reading[-1]
+        if reader not in self.reads:
+            self.reads[reader] = (set(), set(), set())
+        return reader, self.reads[reader]
+    
+    def _read_square(self, square):
+        if self.reading:
+            reader, (squares, _, _) = self._get_reads()
+            self._add(squares, square)
+            self._add(self.square_readers.setdefault(square, set()), reader)
+    
+    def _read_order(self, order):
+        if self.reading:
+            reader, (_, orders, _) = self._get_reads()
+            self._add(orders, order)
+            self._add(self.order_readers.setdefault(order, set()), reader)
+    
+    def _read_resolution(self, order):
+        if self.reading:
+            reader, (_, _, resolutions) = self._get_reads()
+            self._add(resolutions, order)
+            self._add(self.resolution_readers.setdefault(order, set()), reader)
+    
+    def _add(self, items, item):
+        if self.journals and item not in items:
+            self.journals[-1].append((items.discard, (item,)))
+        items.add(item)
+    
+    def _discard(self, items, item):
+        if self.journals and item in items:
+            self.journals[-1].append((items.add, (item,)))
+        items.discard(item)
+    
+    # ==== Recorded functions ====
+    
+    def _resolve(self, order, optimistic):
+        if isinstance(order, LinkedOrder):
+            order = order.get_linker()
+        self._read_resolution(order)
+        self.reading.append(order)
+        try:
+            return super()._resolve(order, optimistic)
+        finally:
+            self.reading.pop()
+    
+    def _adjudicate_support(self, order, optimistic):
+        self._read_square(order.get_starting_square())
+        return super()._adjudicate_support(order, optimistic)
+    
+    def _check_path(self, order, optimistic):
+        self._read_order(order)
+        if isinstance(order, ConvoyOrder):
+            self._read_order(order.get_convoyed_order())
+        return super()._check_path(order, optimistic)
+    
+    def _get_other_opposing(self, order):
+        self._read_square(order.get_landing_square())
+        return super()._get_other_opposing(order)
+    
+    def _get_move(self, square):
+        self._read_square(square)
+        return super()._get_move(square)
+    
+    def _get_hold(self, square):
+        self._read_square(square)
+        return super()._get_hold(square)
+    
+    def _get_convoy(self, square):
+        self._read_square(square)
+        return super()._get_convoy(square)
+    
+    def _get_order_at_landing(self, order):
+        self._read_square(order.get_landing_square())
+        return super()._get_order_at_landing(order)
+    
+    def _get_real_supports(self, order):
+        self._read_order(order)
+        return super()._get_real_supports(order)
+
+def _get_squares(order):
+    """
+    Get the squares where a change of `order` can be seen by the
+    adjudicator.
+    """
+    if isinstance(order, OrderLinker):
+        squares = []
+        for linked_order in order.get_orders():
+            squares.extend(_get_squares(linked_order))
+        return squares
+    elif isinstance(order, BuildOrder | DisbandOrder):
+        return []
+    squares = [order.get_starting_square()]
+    if isinstance(order, SupportOrder):
+        squares.append(order.supported_square)
+    else:
+        squares.append(order.get_landing_square())
+    squares.extend(order.get_intermediate_squares())
+    return squares
+
+class AdjudicationSession:
+    """
+    Incremental adjudication of the order set of an order interface. The
+    session observes the order interface, and when the order set changes,
+    only the resolutions affected by the change are invalidated and
+    resolved again. This is meant for live previews, where the order set
+    is adjudicated after every edit.
+    
+    A session can also fork, to try out changes of the order set: after
+    `fork`, the order set is edited and adjudicated as usual, and
+    `rollback` restores the order set and the resolutions as they were
+    before the fork. Resolutions that do not depend on the changed orders
+    are kept throughout. Forks can be nested.
+    """
+    def __init__(self, order_interface):
+        self.order_interface = order_interface
+        self.order_interface.add_observer(self)
+        self.adjudicator = None
+        self.changed_orders = []
+        self.forks = [] # (adjudicator, changed_orders) before each fork
+    
+    def close(self):
+        """
+        Stop observing the order interface. Open branches are merged.
+        """
+        while self.forks:
+            self.merge()
+        self.order_interface.remove_observer(self)
+        self.adjudicator = None
+    
+    def fork(self):
+        """
+        Start a branch of the order set. The cost of forking, and of
+        leaving the branch with `rollback` or `merge`, is proportional to
+        the changes made in the branch.
+        """
+        self.order_interface.checkpoint()
+        if self.adjudicator is not None:
+            self.adjudicator.checkpoint()
+        self.forks.append((self.adjudicator, self.changed_orders[:]))
+    
+    def rollback(self):
+        """
+        Leave the current branch, restoring the order set, the success of
+        the orders, and the resolutions as they were at the fork.
+        """
+        adjudicator, changed_orders = self.forks.pop()
+        self.order_interface.rollback()
+        if adjudicator is not None:
+            adjudicator.rollback()
+        self.adjudicator = adjudicator
+        self.changed_orders = changed_orders
+    
+    def merge(self):
+        """
+        Leave the current branch, keeping its changes.
+        """
+        adjudicator, _ = self.forks.pop()
+        self.order_interface.merge()
+        if adjudicator is not None:
+            adjudicator.merge()
+    
+    def order_changed(self, order):
+        self.changed_orders.append(order)
+    
+    def orders_cleared(self):
+        self.adjudicator = None
+        self.changed_orders.clear()
+    
+    def adjudicate(self, verbose=False, hook=None):
+        """
+        Adjudicate the current order set, reusing the resolutions that are
+        not affected by the changes since the last adjudication. The same
+        assumptions as `Adjudicator.adjudicate` hold. The events of this
+        adjudication are reported to `hook`, if given.
+        """
+        if self.adjudicator is None:
+            self.adjudicator = IncrementalAdjudicator(self.order_interface)
+        else:
+            self.adjudicator.update(self.changed_orders)
+        self.changed_orders = []
+        self.adjudicator.verbose = verbose
+        self.adjudicator.hooks = [] if hook is None else [hook]
+        try:
+            self.adjudicator.adjudicate()
+        except Exception:
+            # Start from scratch next time
+            self.adjudicator = None
+            raise
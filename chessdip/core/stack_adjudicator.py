@@ -0,0 +1,310 @@
+# -*-coding:utf8-*-
+
+from chessdip.core.order import (
+    MoveOrder, ConvoyOrder, SupportOrder, OrderLinker, LinkedOrder
+)
+from chessdip.core.adjudicator import Adjudicator
+
+class StackAdjudicator(Adjudicator):
+    """
+    Adjudicator implementing the same partial information algorithm as
+    `Adjudicator`, but without recursion: each resolution is a generator
+    that yields the orders it needs resolved, and `_resolve` drives these
+    generators with an explicit stack. The generators act as continuation
+    records: they hold the state of an adjudication while the orders it
+    depends on are being resolved.
+    
+    The depth of the dependency chains, e.g. a rook convoyed across the
+    whole board, is thus only limited by memory, and not by Python's
+    recursion limit.
+    
+    The `_*_steps` methods mirror the methods of `Adjudicator` with the
+    same name; calls to `_resolve` are replaced by yielding a request
+    `(order, optimistic)`, whose result is sent back into the generator.
+    They are copies, not derived from `Adjudicator`, so that the reference
+    adjudicator does not pay for generators: the two must change together.
+    """
+    def _resolve(self, order, optimistic):
+        stack = [self._resolve_steps(order, optimistic)]
+        value = None
+        while stack:
+            try:
+                request = stack[-1].send(value)
+            except StopIteration as stop:
+                stack.pop()
+                value = stop.value
+                continue
+            other_order, other_optimistic = request
+            resolved_order = other_order
+            if isinstance(resolved_order, LinkedOrder):
+                resolved_order = resolved_order.get_linker()
+            if self.resolved[resolved_order] and not self.verbose and not self.hooks:
+                # Shortcut: no need for a new continuation
+                value = self.result[resolved_order]
+            else:
+                stack.append(self._resolve_steps(other_order, other_optimistic))
+                value = None
+        return value
+    
+    # ==== Main adjudication functions ====
+    
+    def _resolve_steps(self, order, optimistic):
+        """
+        See `Adjudicator._resolve`.
+        """
+        if self.verbose:
+            self._debug_out(f"Resolve {order} {self._debug_optimistic(optimistic)}")
+            self._debug_call_depth += 1
+        
+        if isinstance(order, LinkedOrder):
+            order = order.get_linker()
+        if self.hooks:
+            self._hook_resolve_started(order, optimistic)
+        
+        if self.resolved[order]:
+            if self.verbose:
+                self._debug_out_decr(f"1. end resolve: {self._debug_result(self.result[order])}, {self._debug_resolved(order)}")
+            if self.hooks:
+                self._hook_resolve_ended(order, self.result[order], "resolved")
+            return self.result[order]
+        elif order in self.cycle:
+            self.uncertain = True
+            if self.verbose:
+                self._debug_out_decr(f"2. end resolve: in cycle, uncertain, {self._debug_result(optimistic)}, {self._debug_resolved(order)}")
+            if self.hooks:
+                self._hook_resolve_ended(order, optimistic, "cycle")
+            return optimistic
+        elif self.visited[order]:
+            self.cycle.append(order)
+            self.recursion_hits += 1
+            self.uncertain = True
+            if self.verbose:
+                self._debug_out_decr(f"3. end resolve: visited, uncertain, {self._debug_result(optimistic)}, {self._debug_resolved(order)}")
+            if self.hooks:
+                self._hook_resolve_ended(order, optimistic, "recursion")
+            return optimistic
+        
+        self.visited[order] = True
+        old_cycle_len = len(self.cycle)
+        old_recursion_hits = self.recursion_hits
+        old_uncertain = self.uncertain
+        
+        self.uncertain = False
+        opt_result = yield from self._adjudicate_steps(order, True)
+        if self.uncertain and opt_result:
+            pes_result = yield from self._adjudicate_steps(order, False)
+        else:
+            pes_result = opt_result
+        self.visited[order] = False
+        
+        if opt_result == pes_result:
+            self.cycle = self.cycle[:old_cycle_len]
+            self.recursion_hits = old_recursion_hits
+            self.uncertain = old_uncertain
+            self.result[order] = opt_result
+            self.resolved[order] = True
+            if self.verbose:
+                self._debug_out_decr(f"4. end resolve: {self._debug_result(opt_result)}, {self._debug_resolved(order)}")
+            if self.hooks:
+                self._hook_resolve_ended(order, opt_result, "adjudicated")
+            return opt_result
+        
+        elif order in self.cycle:
+            self.recursion_hits -= 1
+            
+            if self.recursion_hits == old_recursion_hits:
+                self._backup_rule(self.cycle[old_cycle_len:])
+                self.cycle = self.cycle[:old_cycle_len]
+                self.uncertain = old_uncertain
+                ret = yield order, optimistic
+                if self.verbose:
+                    self._debug_out_decr(f"5. end resolve: ancestor of cycle, {self._debug_result(ret)}, {self._debug_resolved(order)}")
+                if self.hooks:
+                    self._hook_resolve_ended(order, ret, "backup")
+                return ret
+        
+        elif not order in self.cycle:
+            self.cycle.append(order)
+        if self.verbose:
+            self._debug_out_decr(f"6. end resolve: not ancestor of cycle, {self._debug_result(optimistic)}, {self._debug_resolved(order)}")
+        if self.hooks:
+            self._hook_resolve_ended(order, optimistic, "guess")
+        return optimistic
+    
+    def _adjudicate_steps(self, order, optimistic):
+        if self.verbose:
+            self._debug_out(f"Adjudicate {order} {self._debug_optimistic(optimistic)}")
+            self._debug_call_depth += 1
+        if isinstance(order, OrderLinker):
+            ret = yield from self._adjudicate_linker_steps(order, optimistic)
+        elif isinstance(order, MoveOrder):
+            ret = yield from self._adjudicate_move_steps(order, optimistic)
+        elif isinstance(order, SupportOrder):
+            ret = yield from self._adjudicate_support_steps(order, optimistic)
+        elif isinstance(order, ConvoyOrder):
+            ret = yield from self._adjudicate_convoy_steps(order, optimistic)
+        else:
+            raise ValueError(f"Adjudicating unexpected order: {order}")
+        if self.verbose:
+            self._debug_out_decr(f"end adjudicate: {self._debug_result(ret)}")
+        return ret
+    
+    # ==== Core adjudication functions ====
+    
+    def _adjudicate_linker_steps(self, linker, optimistic):
+        for order in linker.get_orders():
+            if not (yield from self._adjudicate_steps(order, optimistic)):
+                return False
+        return True
+    
+    def _adjudicate_move_steps(self, order, optimistic):
+        order_at_landing = self._get_order_at_landing(order)
+        attack_strength = yield from self._get_attack_strength_steps(order, order_at_landing, optimistic)
+        
+        if (isinstance(order_at_landing, MoveOrder)
+            and order_at_landing.get_landing_square() == order.get_starting_square()
+            and order_at_landing.chess_path.valid
+        ): # Head-to-head
+            defend_strength = yield from self._get_defend_strength_steps(order_at_landing, not optimistic)
+            if defend_strength >= attack_strength:
+                return False
+        else: # No head-to-head
+            hold_strength = yield from self._get_hold_strength_steps(order.get_landing_square(), not optimistic)
+            if hold_strength >= attack_strength:
+                return False
+        
+        # Get prevent strengths
+        opposing_orders = self._get_other_opposing(order)
+        for other_order in opposing_orders:
+            prevent_strength = yield from self._get_prevent_strength_steps(other_order, order_at_landing, not optimistic)
+            if prevent_strength >= attack_strength:
+                return False
+        return True
+    
+    def _adjudicate_support_steps(self, order, optimistic):
+        if not (yield from self._check_path_steps(order, optimistic)):
+            return False
+        
+        supported_order = order.get_supported_order()
+        if isinstance(supported_order, ConvoyOrder) and not (yield from self._check_path_steps(supported_order, optimistic)):
+            return False
+        for other_order in self._get_attacks(order.get_starting_square()):
+            # checking for dislodge
+            if (yield other_order, not optimistic):
+                return False
+            if (other_order.get_piece().get_power() != order.get_piece().get_power()
+                and order.get_landing_square() != other_order.get_starting_square()
+                and order.get_landing_square() not in self.crossed_squares[other_order]
+                and (yield from self._check_path_steps(other_order, not optimistic))
+            ): # checking for cut
+                return False
+        return True
+    
+    def _adjudicate_convoy_steps(self, order, optimistic):
+        if not (yield from self._check_path_steps(order, optimistic)):
+            return False
+        
+        order_at_landing = self._get_move(order.get_landing_square())
+        if order_at_landing is not None:
+            # check if piece moves away
+            if not (yield order_at_landing, optimistic):
+                return False
+        else:
+            order_at_landing = self._get_hold(order.get_landing_square())
+            if order_at_landing is not None:
+                # a piece is holding; convoy cannot succeed
+                return False
+        
+        convoy_strength = yield from self._get_prevent_strength_steps(order, None, optimistic)
+        other_orders = self._get_other_opposing(order)
+        for other_order in other_orders:
+            if isinstance(other_order, ConvoyOrder): # competing convoy
+                other_convoy_strength = yield from self._get_prevent_strength_steps(other_order, None, not optimistic)
+                if other_convoy_strength >= convoy_strength:
+                    return False
+            elif isinstance(other_order, MoveOrder): # attacking piece
+                if (yield other_order, not optimistic):
+                    return False
+        return True
+    
+    def _check_path_steps(self, order, optimistic):
+        if isinstance(order, ConvoyOrder): # check earlier convoys
+            for other_order in order.get_convoyed_order().get_convoys():
+                if other_order is order:
+                    return True
+                elif not (yield other_order, optimistic):
+                    return False
+        
+        if not order.chess_path.valid:
+            return False
+        
+        for convoy_order in order.get_convoys():
+            if not (yield convoy_order, optimistic):
+                return False
+        return True
+    
+    # ==== Strength computations ====
+    
+    def _get_hold_strength_steps(self, square, optimistic):
+        order = self._get_move(square)
+        if order is not None and order.chess_path.valid:
+            if (yield order, not optimistic): # we want the move to fail
+                return 0
+            else:
+                return 1
+        else: # count support-holds of hold order
+            order = self._get_hold(square)
+            if order is not None:
+                return 1 + (yield from self._get_support_strength_steps(order, optimistic))
+        return 0
+    
+    def _get_prevent_strength_steps(self, order, order_at_landing, optimistic):
+        if not (yield from self._check_path_steps(order, optimistic)):
+            return 0
+        elif isinstance(order, ConvoyOrder):
+            return max(0.5, (yield from self._get_support_strength_steps(order, optimistic)))
+        elif (order_at_landing is not None
+            and isinstance(order_at_landing, MoveOrder)
+            and order_at_landing.get_landing_square() == order.get_starting_square()
+            and (yield order_at_landing, not optimistic)
+        ): # head-to-head succeeds
+            return 0
+        else: # head-to-head fails or no head-to-head
+            return (0 if order.is_travel() else 1) + (yield from self._get_support_strength_steps(order, optimistic))
+    
+    def _get_defend_strength_steps(self, order, optimistic):
+        if not order.chess_path.valid:
+            return 0
+        else:
+            return (0 if order.is_travel() else 1) + (yield from self._get_support_strength_steps(order, optimistic))
+    
+    def _get_attack_strength_steps(self, order, order_at_landing, optimistic):
+        if not (yield from self._check_path_steps(order, optimistic)):
+            return 0
+        
+        if order_at_landing is None:
+            return max(0.5, (0 if order.is_travel() else 1) + (yield from self._get_support_strength_steps(order, optimistic)))
+        elif (isinstance(order_at_landing, MoveOrder)
+            and order_at_landing.get_landing_square() != order.get_starting_square()
+            and (yield order_at_landing, optimistic)
+        ): # no head-to-head, piece at landing moves
+            return max(0.5, (0 if order.is_travel() else 1) + (yield from self._get_support_strength_steps(order, optimistic)))
+        elif order_at_landing.get_piece().get_power() == order.get_piece().get_power():
+            # piece at landing is from the same power
+            return 0
+        else: # head-to-head or failed move at landing
+            attack_strength = (0 if order.is_travel() else 1)
+            power_at_landing = order_at_landing.get_piece().get_power()
+            for support_order in self._get_real_supports(order):
+                if (support_order.get_piece().get_power() != power_at_landing
+                    and (yield support_order, optimistic)
+                ):
+                    attack_strength += 1
+            return max(0.5, attack_strength)
+    
+    def _get_support_strength_steps(self, order, optimistic):
+        support = 0
+        for support_order in self._get_real_supports(order):
+            if (yield support_order, optimistic):
+                support += 1
+        return support
@@ -0,0 +1,296 @@
+# -*-coding:utf8-*-
+
+from chessdip.board.square import SQUARES
+from chessdip.core.order import (
+    MoveOrder, ConvoyOrder, SupportOrder, OrderLinker, LinkedOrder
+)
+from chessdip.core.adjudicator import Adjudicator
+
+_SQUARE_BITS = {square: 1 << i for i, square in enumerate(SQUARES)}
+
+class OrderSetAnalysis:
+    """
+    Static analysis of the order set of an adjudicator, telling whether
+    the partial information algorithm may have to guess. Guesses are only
+    made on cycles of the dependency graph, see
+    `Adjudicator._get_dependencies`: convoy paradoxes, circular movement,
+    head-to-head battles, and supports cut by the moves they bear on.
+    
+    Instead of building the dependency graph, the dependencies are lifted
+    to squares: an order lives on its starting square, and a square
+    depends on the squares of the orders that the orders living on it
+    depend on. The square graph has at most 64 nodes, with bitmasks as
+    edges. A cycle of orders gives a cycle of squares, unless all of its
+    orders live on the same square. There, the only possible cycle is a
+    move depending on the path of another order across its starting
+    square, whose convoy depends on the move in turn; such moves are
+    detected separately.
+    
+    The analysis is conservative: an order set may be reported as cyclic
+    even though no guess is needed. In particular, castles tie the king
+    and rook squares into a cycle.
+    
+    Attributes:
+    ----------
+    - acyclic: bool. True if no cycle can form, so that every order can be
+        resolved in a single adjudication.
+    - cyclic_squares: list of Squares. The squares that may be on a cycle.
+    - convoys: int. Number of real convoys, i.e. path squares of real
+        orders.
+    - attacked_supports: int. Number of supports attacked by a move, i.e.
+        that may be cut.
+    """
+    def __init__(self, adjudicator):
+        self.adjudicator = adjudicator
+        self.convoys = 0
+        self.attacked_supports = 0
+        self.cyclic_squares = []
+        
+        # Squares of the orders resolved by `_check_path(order, ...)`, and
+        # of the real supports of each order
+        self.path_depends = {} # order: bitmask
+        self.supports_depends = {} # order: bitmask
+        for order in adjudicator.order_interface.get_orders():
+            convoys = order.get_convoys()
+            if convoys:
+                depends = 0
+                for convoy_order in convoys:
+                    # Convoys check the earlier convoys of their path
+                    self.path_depends[convoy_order] = depends
+                    depends |= _SQUARE_BITS[convoy_order.get_starting_square()]
+                self.path_depends[order] = depends
+            supports = order.get_supports()
+            if supports:
+                depends = 0
+                for support_order in supports:
+                    if not support_order.get_virtual():
+                        depends |= _SQUARE_BITS[support_order.get_starting_square()]
+                self.supports_depends[order] = depends
+        self.opposing_depends = {} # landing square: bitmasks
+        
+        edges = {} # square bit: bitmask of the squares it depends on
+        blocked = False
+        path_depends = self.path_depends
+        attacks_by_landing = adjudicator.attacks_by_landing
+        for order in adjudicator.orders:
+            if isinstance(order, LinkedOrder):
+                continue # resolved through its linker
+            elif isinstance(order, OrderLinker):
+                squares = 0
+                depends = 0
+                for linked_order in order.get_orders():
+                    square_bit = _SQUARE_BITS[linked_order.get_starting_square()]
+                    move_depends = self._get_move_depends(linked_order)
+                    blocked = blocked or bool(move_depends & square_bit)
+                    squares |= square_bit
+                    depends |= move_depends
+                # The squares of a linker depend on each other
+                depends |= squares
+                for linked_order in order.get_orders():
+                    square_bit = _SQUARE_BITS[linked_order.get_starting_square()]
+                    edges[square_bit] = edges.get(square_bit, 0) | depends
+                continue
+            
+            square_bit = _SQUARE_BITS[order.get_starting_square()]
+            if isinstance(order, MoveOrder):
+                depends = self._get_move_depends(order)
+                if depends & square_bit:
+                    blocked = True
+            elif isinstance(order, SupportOrder):
+                depends = path_depends.get(order, 0)
+                supported_order = order.get_supported_order()
+                if isinstance(supported_order, ConvoyOrder):
+                    depends |= path_depends.get(supported_order, 0)
+                attacks = attacks_by_landing.get(order.get_starting_square())
+                if attacks:
+                    self.attacked_supports += 1
+                    for other_order in attacks:
+                        depends |= _SQUARE_BITS[other_order.get_starting_square()] | path_depends.get(other_order, 0)
+            elif isinstance(order, ConvoyOrder):
+                self.convoys += 1
+                depends = self._get_convoy_depends(order)
+            else:
+                raise ValueError(f"Analyzing unexpected order: {order}")
+            if depends:
+                edges[square_bit] = edges.get(square_bit, 0) | depends
+        
+        # Remove squares without dependencies on other remaining squares,
+        # until only cycles remain
+        alive = 0
+        for square_bit in edges:
+            alive |= square_bit
+        changed = True
+        while changed:
+            changed = False
+            for square_bit, depends in edges.items():
+                if alive & square_bit and not depends & alive & ~square_bit:
+                    alive &= ~square_bit
+                    changed = True
+        
+        self.acyclic = not alive and not blocked
+        while alive:
+            i = (alive & -alive).bit_length() - 1
+            self.cyclic_squares.append(SQUARES[i])
+            alive &= alive - 1
+    
+    def __str__(self):
+        if self.acyclic:
+            return "acyclic"
+        squares = ", ".join(str(square) for square in self.cyclic_squares)
+        return f"may be cyclic at: {squares}" if squares else "may be cyclic"
+    
+    def _get_move_depends(self, order):
+        adjudicator = self.adjudicator
+        path_depends = self.path_depends
+        supports_depends = self.supports_depends
+        landing_square = order.get_landing_square()
+        # The opposing depends of the order itself are already included
+        depends = path_depends.get(order, 0) | supports_depends.get(order, 0) | self._get_opposing_depends(landing_square)[0]
+        order_at_landing = adjudicator.orders_by_start.get(landing_square)
+        if isinstance(order_at_landing, MoveOrder):
+            depends |= _SQUARE_BITS[landing_square] | supports_depends.get(order_at_landing, 0)
+        if landing_square in adjudicator.moves_by_start:
+            depends |= _SQUARE_BITS[landing_square]
+        hold_at_landing = adjudicator.holds_by_start.get(landing_square)
+        if hold_at_landing is not None:
+            depends |= supports_depends.get(hold_at_landing, 0)
+        return depends
+    
+    def _get_convoy_depends(self, order):
+        square = order.get_landing_square()
+        _, convoy_depends, other_depends = self._get_opposing_depends(square)
+        depends = self.path_depends.get(order, 0) | self.supports_depends.get(order, 0) | convoy_depends | other_depends
+        if square in self.adjudicator.moves_by_start:
+            depends |= _SQUARE_BITS[square]
+        return depends
+    
+    def _get_opposing_depends(self, square):
+        """
+        Squares that the orders landing on `square` make their opponents
+        depend on: the squares of the paths and supports of all orders, of
+        the paths and supports of convoys, and of the other orders.
+        """
+        depends = self.opposing_depends.get(square)
+        if depends is None:
+            all_depends = convoy_depends = other_depends = 0
+            for order in self.adjudicator.opposing_by_landing.get(square, []):
+                order_depends = self.path_depends.get(order, 0) | self.supports_depends.get(order, 0)
+                all_depends |= order_depends
+                if isinstance(order, ConvoyOrder):
+                    convoy_depends |= order_depends
+                else:
+                    other_depends |= _SQUARE_BITS[order.get_starting_square()]
+            depends = (all_depends, convoy_depends, other_depends)
+            self.opposing_depends[square] = depends
+        return depends
+
+class StaticAdjudicator(Adjudicator):
+    """
+    Adjudicator that first analyzes the order set statically, see
+    `OrderSetAnalysis`. If no cycle can form, then every order is resolved
+    by a single adjudication, without the guessing and the bookkeeping of
+    the partial information algorithm. Otherwise, the order set is
+    adjudicated as by `Adjudicator`. The results are the same as those of
+    `Adjudicator`.
+    
+    The analysis is reported to the hooks, see
+    `AdjudicationHook.order_set_analyzed`.
+    """
+    def __init__(self, order_interface, verbose=False, stats=False, hook=None):
+        super().__init__(order_interface, verbose=verbose, stats=stats, hook=hook)
+        self.analysis = None
+        self.single_pass = False
+        self.passing = False # whether a single pass is running
+    
+    def adjudicate(self):
+        self._analyze()
+        return super().adjudicate()
+    
+    def rebind(self, order_interface=None):
+        super().rebind(order_interface)
+        self.analysis = None
+        self.single_pass = False
+    
+    def query(self, orders):
+        self._analyze()
+        return super().query(orders)
+    
+    def _analyze(self):
+        if self.analysis is None:
+            self.analysis = OrderSetAnalysis(self)
+            for hook in self.hooks:
+                hook.order_set_analyzed(self.analysis)
+        self.single_pass = self.analysis.acyclic
+    
+    def _recover(self):
+        """
+        Switch to the full algorithm after a cycle was met in a single pass,
+        which the analysis should prevent. The orders resolved so far did
+        not depend on guesses, so their results are kept.
+        """
+        self.analysis.acyclic = False
+        self.single_pass = False
+        for order in self.visited:
+            self.visited[order] = False
+        self._debug_call_depth = 0
+        self._depth = 0
+    
+    def _resolve(self, order, optimistic):
+        if not self.single_pass:
+            return super()._resolve(order, optimistic)
+        elif self.passing:
+            return self._resolve_single_pass(order, optimistic)
+        
+        # Outermost call of a single pass: on a missed cycle, go on with the
+        # full algorithm, within the same adjudication
+        self.passing = True
+        try:
+            return self._resolve_single_pass(order, optimistic)
+        except _MissedCycle:
+            self._recover()
+            return super()._resolve(order, optimistic)
+        finally:
+            self.passing = False
+    
+    def _resolve_single_pass(self, order, optimistic):
+        if isinstance(order, LinkedOrder):
+            order = order.get_linker()
+        if self.hooks:
+            self._hook_resolve_started(order, optimistic)
+        if self.resolved[order]:
+            if self.hooks:
+                self._hook_resolve_ended(order, self.result[order], "resolved")
+            return self.result[order]
+        elif self.visited[order]:
+            raise _MissedCycle(order)
+        
+        if self.verbose:
+            self._debug_out(f"Resolve {order} single pass")
+            self._debug_call_depth += 1
+        self.visited[order] = True
+        result = self._adjudicate(order, True)
+        self.visited[order] = False
+        self.result[order] = result
+        self.resolved[order] = True
+        if self.verbose:
+            self._debug_out_decr(f"end resolve: {self._debug_result(result)}, {self._debug_resolved(order)}")
+        if self.hooks:
+            self._hook_resolve_ended(order, result, "adjudicated")
+        return result
+    
+    def _adjudicate(self, order, optimistic):
+        if self.verbose or not self.single_pass:
+            return super()._adjudicate(order, optimistic)
+        # Same as `Adjudicator._adjudicate`, without debug messages
+        if isinstance(order, OrderLinker):
+            return self._adjudicate_linker(order, optimistic)
+        elif isinstance(order, MoveOrder):
+            return self._adjudicate_move(order, optimistic)
+        elif isinstance(order, SupportOrder):
+            return self._adjudicate_support(order, optimistic)
+        elif isinstance(order, ConvoyOrder):
+            return self._adjudicate_convoy(order, optimistic)
+        raise ValueError(f"Adjudicating unexpected order: {order}")
+
+class _MissedCycle(Exception):
+    pass
@@ -0,0 +1,250 @@
+# -*-coding:utf8-*-
+
+import time
+
+from chessdip.core.order import MoveOrder, ConvoyOrder
+
+class AdjudicationCancelled(Exception):
+    """
+    Raised out of an adjudication by an AdjudicationBudget. The results of
+    the order set are then incomplete.
+    """
+    pass
+
+class AdjudicationHook:
+    """
+    Interface for observing an adjudication. An adjudicator calls the
+    methods of its hooks at the events below; the default methods do
+    nothing, so that subclasses only override the events they need.
+    
+    The outcome of a call to `_resolve` is one of:
+    - "resolved": the order was already resolved,
+    - "cycle": the order is part of a known cycle, and its result is a
+        guess,
+    - "recursion": the order is being resolved, and its result is a
+        guess,
+    - "adjudicated": the order was adjudicated and is now resolved,
+    - "backup": the order was resolved again after the backup rule,
+    - "guess": the adjudication depends on a guess, and the result is a
+        guess.
+    """
+    GUESSES = ("cycle", "recursion", "guess")
+    
+    def adjudication_started(self, orders):
+        """
+        Called at the start of `adjudicate` and `query`, with the orders to
+        resolve, and by an AdjudicationCache when it sets stored results.
+        """
+        pass
+    
+    def resolve_started(self, order, optimistic, depth):
+        pass
+    
+    def resolve_ended(self, order, result, outcome, depth):
+        pass
+    
+    def backup_rule_applied(self, rule, orders):
+        """
+        `rule` is "szykman" or "circular".
+        """
+        pass
+    
+    def order_resolved(self, order, seconds):
+        """
+        Called by `adjudicate` for each order of the order set, with the
+        wall time spent resolving the order, including the orders it
+        depends on that were not resolved yet.
+        """
+        pass
+    
+    def order_set_analyzed(self, analysis):
+        """
+        Called by adjudicators that analyze the order set before resolving
+        it, with an OrderSetAnalysis, see `StaticAdjudicator`.
+        """
+        pass
+
+class AdjudicationStats(AdjudicationHook):
+    """
+    Hook counting the events of one or more adjudications.
+    
+    Attributes:
+    ----------
+    - adjudications: int. Number of adjudications and queries.
+    - resolve_calls: int. Number of calls to `_resolve`.
+    - resolved_hits: int. Calls to `_resolve` on already resolved orders.
+    - guesses: int. Calls to `_resolve` that returned a guess.
+    - recursion_hits: int. Calls to `_resolve` on orders being resolved.
+    - szykman: int. Applications of Szykman's rule.
+    - circular: int. Applications of the circular movement rule.
+    - max_depth: int. Maximal nesting depth of `_resolve`.
+    - order_time: dict. Wall time in seconds spent by `adjudicate` per
+        order type, given by class name.
+    - acyclic_sets: int. Analyzed order sets where no cycle can form.
+    - cyclic_sets: int. Analyzed order sets where a cycle may form.
+    """
+    def __init__(self):
+        self.adjudications = 0
+        self.resolve_calls = 0
+        self.resolved_hits = 0
+        self.guesses = 0
+        self.recursion_hits = 0
+        self.szykman = 0
+        self.circular = 0
+        self.max_depth = 0
+        self.order_time = {}
+        self.acyclic_sets = 0
+        self.cyclic_sets = 0
+    
+    def __str__(self):
+        return ", ".join(f"{name}: {value}" for name, value in self.as_dict().items())
+    
+    def as_dict(self):
+        return {
+            "adjudications": self.adjudications,
+            "resolve_calls": self.resolve_calls,
+            "resolved_hits": self.resolved_hits,
+            "guesses": self.guesses,
+            "recursion_hits": self.recursion_hits,
+            "szykman": self.szykman,
+            "circular": self.circular,
+            "max_depth": self.max_depth,
+            "order_time": dict(self.order_time),
+            "acyclic_sets": self.acyclic_sets,
+            "cyclic_sets": self.cyclic_sets,
+        }
+    
+    def adjudication_started(self, orders):
+        self.adjudications += 1
+    
+    def resolve_started(self, order, optimistic, depth):
+        self.resolve_calls += 1
+        if depth + 1 > self.max_depth:
+            self.max_depth = depth + 1
+    
+    def resolve_ended(self, order, result, outcome, depth):
+        if outcome == "resolved":
+            self.resolved_hits += 1
+        elif outcome in AdjudicationHook.GUESSES:
+            self.guesses += 1
+            if outcome == "recursion":
+                self.recursion_hits += 1
+    
+    def backup_rule_applied(self, rule, orders):
+        if rule == "szykman":
+            self.szykman += 1
+        else:
+            self.circular += 1
+    
+    def order_resolved(self, order, seconds):
+        name = type(order).__name__
+        self.order_time[name] = self.order_time.get(name, 0) + seconds
+    
+    def order_set_analyzed(self, analysis):
+        if analysis.acyclic:
+            self.acyclic_sets += 1
+        else:
+            self.cyclic_sets += 1
+
+class AdjudicationBudget(AdjudicationHook):
+    """
+    Hook bounding the wall time of an adjudication, e.g. of order sets
+    submitted by players to a server. Every `interval` calls to `_resolve`,
+    the budget reports the progress of the adjudication to `progress`, if
+    given, and raises AdjudicationCancelled if the time is up or if the
+    budget was cancelled. The adjudicator is left as is, and can be
+    rebound to adjudicate again, see `Adjudicator.rebind`.
+    
+    The clock starts when the budget is made, and restarts with its
+    counters at the start of each adjudication, so that one budget bounds
+    every adjudication of a game, see `GameManager.set_adjudicator_hook`.
+    A cancelled budget stays cancelled, and stops every adjudication at its
+    start, until `reset` is called.
+    
+    Attributes:
+    ----------
+    - seconds: float or None. The time budget. If None, then the
+        adjudication is only stopped by `cancel`.
+    - resolve_calls: int. Number of calls to `_resolve` so far.
+    - resolved_orders: int. Number of orders resolved so far.
+    - cancelled: bool. Whether `cancel` was called since the budget was
+        made or reset.
+    """
+    def __init__(self, seconds=None, progress=None, interval=100):
+        """
+        Parameters:
+        ----------
+        - seconds: float or None, optional. Default value is None.
+        - progress: callable or None, optional. Called with the budget as
+            only argument, e.g. to report `resolve_calls` and
+            `resolved_orders`, or to `cancel` the adjudication. Default
+            value is None.
+        - interval: int, optional. Number of calls to `_resolve` between
+            checks of the budget. Default value is 100.
+        """
+        self.seconds = seconds
+        self.progress = progress
+        self.interval = interval
+        self.reset()
+    
+    def start(self):
+        """
+        Restart the clock and reset the counters. A cancelled budget stays
+        cancelled.
+        """
+        self.deadline = None if self.seconds is None else time.monotonic() + self.seconds
+        self.resolve_calls = 0
+        self.resolved_orders = 0
+    
+    def reset(self):
+        """
+        Restart the clock, reset the counters, and clear a cancellation.
+        """
+        self.start()
+        self.cancelled = False
+    
+    def cancel(self):
+        """
+        Stop the adjudication at the next check. This can be called from
+        another thread.
+        """
+        self.cancelled = True
+    
+    def get_elapsed(self):
+        """
+        Get the time in seconds since the budget started, if it has a time
+        budget.
+        """
+        return None if self.deadline is None else time.monotonic() - self.deadline + self.seconds
+    
+    def check(self):
+        """
+        Report progress, and raise AdjudicationCancelled if the adjudication
+        should stop.
+        """
+        if self.progress is not None:
+            self.progress(self)
+        if self.cancelled:
+            raise AdjudicationCancelled("Adjudication cancelled.")
+        elif self.deadline is not None and time.monotonic() > self.deadline:
+            raise AdjudicationCancelled(f"Adjudication ran out of its budget of {self.seconds} seconds, after {self.resolve_calls} resolve calls.")
+    
+    def adjudication_started(self, orders):
+        self.start()
+        if self.cancelled:
+            raise AdjudicationCancelled("Adjudication cancelled.")
+    
+    def resolve_started(self, order, optimistic, depth):
+        self.resolve_calls += 1
+        if self.resolve_calls % self.interval == 0:
+            self.check()
+    
+    def resolve_ended(self, order, result, outcome, depth):
+        if outcome == "adjudicated":
+            self.resolved_orders += 1
+    
+    def backup_rule_applied(self, rule, orders):
+        # Szykman's rule resolves the convoys of the cycle, and the circular
+        # movement rule its moves
+        resolved_class = ConvoyOrder if rule == "szykman" else MoveOrder
+        self.resolved_orders += sum(isinstance(order, resolved_class) for order in orders)
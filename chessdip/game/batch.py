@@ -0,0 +1,219 @@
+# -*-coding:utf8-*-
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from chessdip.board.square import get_square
+from chessdip.core.order import ConvoyOrder, BuildOrder, DisbandOrder
+from chessdip.core.cache import encode_results
+from chessdip.core.plan import AdjudicationPlan
+from chessdip.core.lockstep import LockstepAdjudicator
+from chessdip.interface.headless import HeadlessVisualInterface
+from chessdip.game.game import GameManager, SilentConsole
+from chessdip.game.board_setup import standard_setup
+
+"""
+Batch adjudication of many order sets on the same position, possibly over
+a pool of worker processes. Positions and order sets are described by
+plain tuples and strings, so that they are cheap to send to workers, and
+games are run without a figure. Success vectors can be packed into
+bitsets, see `chessdip.core.cache.encode_results`, e.g. to archive them or
+to send them over the network.
+"""
+
+class Position(namedtuple("Position", ["pieces", "en_passant"])):
+    """
+    Compact description of a board position.
+    - pieces: tuple of (power_index, piece_code, file, rank, moved), where
+        `power_index` is the index of the piece's power in the `powers` of
+        the board setup. The pieces are sorted by rank, then file.
+    - en_passant: tuple of (file, rank, file, rank): the square of a pawn
+        open to en passant, followed by the square it can be taken on.
+    """
+    __slots__ = ()
+
+def get_position(game_manager):
+    """
+    Get the Position of a game.
+    """
+    powers = game_manager.board_setup.powers
+    pieces = []
+    for piece in game_manager.board.get_pieces():
+        square = piece.get_square()
+        pieces.append((powers.index(piece.get_power()), piece.code, square.file, square.rank, piece.moved))
+    pieces.sort(key=lambda piece: (piece[3], piece[2]))
+    en_passant = []
+    for piece, square in game_manager.board.en_passant:
+        piece_square = piece.get_square()
+        en_passant.append((piece_square.file, piece_square.rank, square.file, square.rank))
+    return Position(tuple(pieces), tuple(en_passant))
+
+def set_position(game_manager, position):
+    """
+    Clear the board of a game and set up `position`.
+    
+    Returns:
+    -------
+    - list of Pieces, in the same order as `position.pieces`.
+    """
+    game_manager.clear_board()
+    game_manager.board.clear_en_passant()
+    powers = game_manager.board_setup.powers
+    pieces = []
+    for power_index, code, file, rank, moved in position.pieces:
+        piece = game_manager.board.add_piece(code, powers[power_index], get_square(file, rank))
+        game_manager.board.set_moved(piece, moved)
+        pieces.append(piece)
+    for file, rank, en_passant_file, en_passant_rank in position.en_passant:
+        piece = game_manager.board.get_piece(get_square(file, rank))
+        game_manager.board.mark_en_passant(piece, get_square(en_passant_file, en_passant_rank))
+    return pieces
+
+def make_headless_game(setup=None):
+    """
+    Make a GameManager that neither draws nor prints anything.
+    """
+    if setup is None:
+        setup = standard_setup
+    return GameManager(board=setup, visualizer=HeadlessVisualInterface(), console=SilentConsole())
+
+def adjudicate_order_set(game_manager, pieces, order_set):
+    """
+    Replace the orders of a game by `order_set` and adjudicate them. The
+    pieces on the board are left unchanged.
+    
+    Parameters:
+    ----------
+    - game_manager: GameManager.
+    - pieces: list of Pieces. The pieces to report results for.
+    - order_set: iterable of (power_name, message) pairs, where `message`
+        is an order as written in the sandbox, e.g. ("England", "Kd1 d2").
+        Power names can be shortened to any distinct prefix.
+    
+    Returns:
+    -------
+    - tuple of bools, the success vector: for each piece of `pieces`,
+        whether all of its real orders succeeded.
+    """
+    _set_order_set(game_manager, order_set)
+    game_manager.adjudicate()
+    
+    success = {}
+    for order in game_manager.order_manager.get_orders():
+        if order.get_virtual() or isinstance(order, ConvoyOrder | BuildOrder | DisbandOrder):
+            continue
+        piece = order.get_piece()
+        success[piece] = success.get(piece, True) and order.get_success()
+    return tuple(success.get(piece, False) for piece in pieces)
+
+def _set_order_set(game_manager, order_set):
+    game_manager.order_manager.clear()
+    for power_name, message in order_set:
+        power = game_manager._get_power(power_name.lower())
+        game_manager.process_orders(power, [message])
+
+def adjudicate_many(position, order_sets, setup=None, workers=None, chunksize=16, packed=False):
+    """
+    Adjudicate many order sets on the same position, fanning them out over
+    a pool of worker processes. Each worker sets up the position once, and
+    then only receives order sets.
+    
+    Parameters:
+    ----------
+    - position: Position.
+    - order_sets: iterable of order sets. See `adjudicate_order_set` for
+        the format of an order set.
+    - setup: BoardSetup or None, optional. The setup whose powers are
+        referred to by `position`. If None, then `standard_setup` is used.
+        Default value is None.
+    - workers: int or None, optional. Number of worker processes. If None,
+        then the number of processors is used. If 0, then the order sets
+        are adjudicated in the current process. Default value is None.
+    - chunksize: int, optional. Number of order sets sent to a worker at
+        once. Default value is 16.
+    - packed: bool, optional. If True, then the success vectors are packed
+        into bitsets by the workers. Default value is False.
+    
+    Yields:
+    ------
+    - tuple of bools, the success vector of each order set, in order. See
+        `adjudicate_order_set`. If `packed` is True, then bytes instead,
+        to be unpacked by `chessdip.core.cache.decode_results` with the
+        number of pieces of `position`.
+    """
+    if workers == 0:
+        game_manager = make_headless_game(setup)
+        pieces = set_position(game_manager, position)
+        for order_set in order_sets:
+            success = adjudicate_order_set(game_manager, pieces, order_set)
+            yield encode_results(success) if packed else success
+        return
+    
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(setup, position, packed)) as executor:
+        yield from executor.map(_adjudicate_in_worker, order_sets, chunksize=chunksize)
+
+def adjudicate_lockstep(position, order_sets, setup=None, packed=False):
+    """
+    Adjudicate many order sets on the same position at once, with a
+    LockstepAdjudicator. The order sets are compiled one after the other
+    in the current process, and then resolved together.
+    
+    Parameters:
+    ----------
+    - position: Position.
+    - order_sets: iterable of order sets. See `adjudicate_order_set` for
+        the format of an order set.
+    - setup: BoardSetup or None, optional. See `adjudicate_many`. Default
+        value is None.
+    - packed: bool, optional. If True, then the success vectors are packed
+        into bitsets. Default value is False.
+    
+    Returns:
+    -------
+    - list of tuples of bools, the success vector of each order set, in
+        order. See `adjudicate_order_set`. If `packed` is True, then a list
+        of bytes instead, see `adjudicate_many`.
+    """
+    game_manager = make_headless_game(setup)
+    pieces = set_position(game_manager, position)
+    plans = []
+    for order_set in order_sets:
+        _set_order_set(game_manager, order_set)
+        game_manager._add_holds()
+        plans.append(AdjudicationPlan(game_manager.order_manager))
+    results = LockstepAdjudicator(plans).adjudicate()
+    success_vectors = [_get_success_vector(plan, plan_results, pieces) for plan, plan_results in zip(plans, results)]
+    if packed:
+        return [encode_results(success) for success in success_vectors]
+    return success_vectors
+
+def _get_success_vector(plan, results, pieces):
+    """
+    Success vector of an order set from the results of its plan, as set by
+    `Adjudicator.adjudicate`. Orders without a result, i.e. holds, succeed.
+    """
+    result = dict(zip(plan.adjudicable, results))
+    success = {}
+    for i, order in enumerate(plan.orders):
+        if plan.kind[i] in (AdjudicationPlan.CONVOY, AdjudicationPlan.LINKER, AdjudicationPlan.OTHER) or order.get_virtual():
+            continue
+        order_result = result.get(plan.linker[i] if plan.linker[i] != -1 else i, True)
+        piece = order.get_piece()
+        success[piece] = success.get(piece, True) and order_result
+    return tuple(success.get(piece, False) for piece in pieces)
+
+# ==== Worker processes ====
+
+_worker_game = None
+_worker_pieces = None
+_worker_packed = False
+
+def _init_worker(setup, position, packed=False):
+    global _worker_game, _worker_pieces, _worker_packed
+    _worker_game = make_headless_game(setup)
+    _worker_pieces = set_position(_worker_game, position)
+    _worker_packed = packed
+
+def _adjudicate_in_worker(order_set):
+    success = adjudicate_order_set(_worker_game, _worker_pieces, order_set)
+    return encode_results(success) if _worker_packed else success
@@ -1,24 +1,17 @@
 # -*-coding:utf8-*-
 
-import matplotlib.pyplot as plt
-
-from chessdip.board.piece import Piece
-from chessdip.board.chess_path import ChessPath
-from chessdip.core.order import (
-    HoldOrder, MoveOrder, ConvoyOrder, SupportOrder,
-    SupportHoldOrder, SupportMoveOrder, SupportConvoyOrder,
-    OrderLinker, LinkedMoveOrder,
-    BuildOrder, DisbandOrder
-)
+from chessdip.core.order import HoldOrder, MoveOrder, OrderLinker, DisbandOrder
 from chessdip.core.adjudicator import Adjudicator
+from chessdip.core.session import AdjudicationSession
+from chessdip.core.parallel import ParallelAdjudicator
 
 from chessdip.interface.board import BoardInterface
-from chessdip.interface.visual import VisualInterface
 
 from chessdip.game.parser import Parser
 from chessdip.game.board_setup import BoardSetup
 from chessdip.game.phase import Phase
 from chessdip.game.order_manager import OrderManager
+from chessdip.game.standalone import make_order, add_holds
 
 class Console:
     """
@@ -33,25 +26,58 @@ class Console:
     def input(self, *args, **kwargs):
         return input(*args, **kwargs)
 
+class SilentConsole(Console):
+    """
+    Console that discards output, for running games without a user.
+    """
+    def out(self, *args, **kwargs):
+        pass
+
 class GameManager:
     """
     Managing class for a game.
     """
-    def __init__(self, board=None):
+    def __init__(self, board=None, visualizer=None, console=None, debug=False):
+        """
+        Parameters:
+        ----------
+        - board: BoardSetup or None, optional. If None, then an empty
+            setup is used. Default value is None.
+        - visualizer: VisualInterface, HeadlessVisualInterface, or None,
+            optional. If None, then a VisualInterface is created. Default
+            value is None.
+        - console: Console or None, optional. If None, then a Console is
+            created. Default value is None.
+        - debug: bool, optional. If True, then the board checks its indexes
+            and hash after every change, see
+            `BoardInterface.check_consistency`. Default value is False.
+        """
         if board is None:
             self.board_setup = BoardSetup()
         else:
             self.board_setup = board
         
-        self.visualizer = VisualInterface()
+        if visualizer is None:
+            # Imported here, so that headless games do not import matplotlib
+            from chessdip.interface.visual import VisualInterface
+            visualizer = VisualInterface()
+        if console is None:
+            console = Console()
+        self.visualizer = visualizer
         self.order_manager = OrderManager(self.visualizer)
-        self.console = Console()
-        self.board = BoardInterface(self.board_setup, self.visualizer)
+        self.console = console
+        self.board = BoardInterface(self.board_setup, self.visualizer, debug=debug)
         self.parser = Parser()
         
         self.powers = self.board_setup.get_true_powers()
         
+        self.adjudicator_class = Adjudicator
+        self.adjudicator = None # reused between adjudications, see Adjudicator.rebind
         self.adjudicator_verbose = False
+        self.adjudication_session = None
+        self.adjudication_cache = None
+        self.adjudicator_hook = None
+        self.shadow_verifier = None
         
         self.year = 1
         self.phase = Phase.SPRING
@@ -64,6 +90,14 @@ class GameManager:
     def get_powers(self):
         return self.powers
     
+    def get_position_hash(self):
+        """
+        Get the Zobrist hash of the position and phase, e.g. as a key of
+        transposition tables or to find duplicate positions. The hash is
+        kept up to date as pieces move and phases pass, see `Board`.
+        """
+        return self.board.get_hash()
+    
     def update_view(self):
         self.visualizer.render()
     
@@ -101,29 +135,150 @@ class GameManager:
                         return order
         return None
     
+    def set_adjudicator_class(self, adjudicator_class):
+        """
+        Set the adjudicator used by `adjudicate`: `Adjudicator`, or one of
+        its subclasses, e.g. `SCCAdjudicator` or `StackAdjudicator`.
+        `ParallelAdjudicator` is refused, since it is slower on this board.
+        """
+        if issubclass(adjudicator_class, ParallelAdjudicator):
+            raise ValueError(f"{adjudicator_class.__name__} is slower than Adjudicator on this board.")
+        self.adjudicator_class = adjudicator_class
+        self.close_adjudicator()
+    
     def set_adjudicator_verbose(self, verbose):
         self.adjudicator_verbose = verbose
+        self.close_adjudicator()
+    
+    def set_adjudicator_hook(self, hook):
+        """
+        Set an AdjudicationHook, e.g. an AdjudicationStats, that observes
+        the adjudications of `adjudicate`, or an AdjudicationBudget that
+        stops them when they take too long. If `hook` is None, then the
+        adjudications are not observed.
+        """
+        self.adjudicator_hook = hook
+        self.close_adjudicator()
+    
+    def close_adjudicator(self):
+        """
+        Close the adjudicator kept between adjudications, see
+        `Adjudicator.close`. It is made again by the next adjudication. The
+        adjudicator is also closed when replaced, see
+        `set_adjudicator_class`.
+        """
+        if self.adjudicator is not None:
+            self.adjudicator.close()
+            self.adjudicator = None
+    
+    def set_incremental_adjudication(self, incremental):
+        """
+        If `incremental` is True, then `adjudicate` keeps the resolutions
+        of the previous adjudication that are not affected by the order
+        changes since then. This is useful when adjudicating after every
+        edit of the order set.
+        """
+        if incremental and self.adjudication_session is None:
+            self.adjudication_session = AdjudicationSession(self.order_manager)
+        elif not incremental and self.adjudication_session is not None:
+            self.adjudication_session.close()
+            self.adjudication_session = None
+    
+    def fork(self):
+        """
+        Start a what-if branch of the order set, e.g. to see how the
+        adjudication changes if a piece supports instead of moving. Orders
+        are then given and adjudicated as usual, and `rollback` restores
+        the order set and its adjudication as they were at the fork. Only
+        the orders affected by the changes are adjudicated again. Branches
+        can be nested.
+        
+        This turns on incremental adjudication, see
+        `set_incremental_adjudication`.
+        """
+        self.set_incremental_adjudication(True)
+        self.adjudication_session.fork()
+    
+    def rollback(self):
+        """
+        Leave the current what-if branch, discarding its changes.
+        
+        Returns:
+        -------
+        - bool. False if there is no branch to leave.
+        """
+        if not self._has_branch():
+            self.console.out("No what-if branch to roll back.")
+            return False
+        self.adjudication_session.rollback()
+        return True
+    
+    def merge(self):
+        """
+        Leave the current what-if branch, keeping its changes.
+        
+        Returns:
+        -------
+        - bool. False if there is no branch to leave.
+        """
+        if not self._has_branch():
+            self.console.out("No what-if branch to merge.")
+            return False
+        self.adjudication_session.merge()
+        return True
+    
+    def _has_branch(self):
+        return self.adjudication_session is not None and bool(self.adjudication_session.forks)
+    
+    def set_adjudication_cache(self, cache):
+        """
+        Set the AdjudicationCache used by `adjudicate`, e.g. to share stored
+        results between games. If `cache` is None, then no cache is used.
+        Incremental adjudication, if set, takes precedence over the cache.
+        """
+        self.adjudication_cache = cache
+    
+    def set_shadow_verifier(self, verifier):
+        """
+        Set a ShadowVerifier, which verifies a sample of the adjudications
+        of `adjudicate` against the reference `Adjudicator` in the
+        background, e.g. when trying a faster adjudicator class. If
+        `verifier` is None, then adjudications are not verified.
+        """
+        self.shadow_verifier = verifier
     
     def adjudicate(self):
+        shadow_job = None
+        if self.shadow_verifier is not None:
+            shadow_job = self.shadow_verifier.sample(self)
         self._add_holds()
-        adjudicator = Adjudicator(self.order_manager, verbose=self.adjudicator_verbose)
-        adjudicator.adjudicate()
+        if self.adjudication_session is not None:
+            self.adjudication_session.adjudicate(verbose=self.adjudicator_verbose, hook=self.adjudicator_hook)
+        elif self.adjudication_cache is not None:
+            self.adjudication_cache.adjudicate(self.order_manager, adjudicator_class=self.adjudicator_class, en_passant=self.board.en_passant, verbose=self.adjudicator_verbose, hook=self.adjudicator_hook)
+        elif self.adjudicator is None:
+            self.adjudicator = self.adjudicator_class(self.order_manager, verbose=self.adjudicator_verbose, hook=self.adjudicator_hook)
+            self.adjudicator.adjudicate()
+        else:
+            self.adjudicator.rebind()
+            self.adjudicator.adjudicate()
+        if shadow_job is not None:
+            self.shadow_verifier.submit(shadow_job, self._get_engine_name())
         self._make_disbands()
     
+    def _get_engine_name(self):
+        if self.adjudication_session is not None:
+            return "AdjudicationSession"
+        elif self.adjudication_cache is not None:
+            return "AdjudicationCache"
+        return self.adjudicator_class.__name__
+    
     def _add_holds(self):
         """
-        Add or make real the hold orders for non-moving pieces.
+        Add or make real the hold orders for non-moving pieces, see
+        `add_holds`.
         """
-        has_move_order = {piece: False for piece in self.board.get_pieces()}
-        for order in self.order_manager.get_orders():
-            if isinstance(order, MoveOrder) and not order.get_virtual() and order.chess_path.valid:
-                has_move_order[order.get_piece()] = True
-        for order in self.order_manager.get_orders():
-            if isinstance(order, HoldOrder) and not has_move_order[order.get_piece()]:
-                self.order_manager.set_virtual(order, False)
-        for piece, b in has_move_order.items():
-            if not b:
-                self.order_manager.add(HoldOrder(piece))
+        add_holds(self.order_manager, self.board)
     
     def _make_disbands(self):
         failed_move = {piece: False for piece in self.board.get_pieces()}
@@ -144,7 +299,7 @@ class GameManager:
     def set_phase(self):
         phase_str = "WSF"[self.phase]
         year_str = str(self.year) if self.year >= 9 else f"0{self.year}"
-        self.board.set_phase(f"{phase_str}{year_str}")
+        self.board.set_phase(f"{phase_str}{year_str}", self.phase)
     
     def progress(self):
         self.board.clear_en_passant()
@@ -167,142 +322,31 @@ class GameManager:
             self._process_order(power, message.lower().replace(' ', ''))
     
     def add_en_passant(self, power, starting_square, travel_square, attack_square):
-        pawn_piece = self.board.get_piece(starting_square)
-        if pawn_piece is None or pawn_piece.code != Piece.PAWN:
-            self.console.out(f"No pawn on {starting_square}.")
-            return False
-        passed_pawn_piece = self.board.get_piece(attack_square)
-        if passed_pawn_piece is None or passed_pawn_piece.code != Piece.PAWN:
-            self.console.out(f"No pawn on {attack_square} to attack.")
-        elif not self.board.can_en_passant(passed_pawn_piece, travel_square):
-            self.console.out(f"{passed_pawn_piece} is not open to en passant.")
-        else:
-            linker = OrderLinker()
-            self.order_manager.get_order(LinkedMoveOrder, (linker, pawn_piece, travel_square), kwargs=dict(move_type=MoveOrder.TRAVEL))
-            self.order_manager.get_order(LinkedMoveOrder, (linker, pawn_piece, attack_square), kwargs=dict(move_type=MoveOrder.ATTACK, exception="en_passant"))
+        return self._make_order(power, OrderLinker, ("en_passant", starting_square, travel_square, attack_square))
     
     def add_castle(self, power, long=False):
-        king_square = power.get_king_square()
-        if long:
-            rook_square = power.get_queen_rook_square()
-        else:
-            rook_square = power.get_king_rook_square()
-        king_piece = self.board.get_piece(king_square)
-        rook_piece = self.board.get_piece(rook_square)
-        if king_piece is None:
-            self.console.out(f"No king on {king_square} to castle.")
-            return False
-        elif rook_piece is None:
-            self.console.out(f"No rook on {rook_square} to castle.")
-            return False
-        elif self.board.get_moved(king_piece):
-            self.console.out(f"{king_piece} already moved.")
-            return False
-        elif self.board.get_moved(rook_piece):
-            self.console.out(f"{rook_piece} already moved.")
-            return False
-        elif long: # queenside castle
-            linker = OrderLinker()
-            self.order_manager.get_order(LinkedMoveOrder, (linker, king_piece, power.get_queenside_castle_king_square()), kwargs=dict(move_type=MoveOrder.TRAVEL, exception="castle"))
-            self.order_manager.get_order(LinkedMoveOrder, (linker, rook_piece, power.get_queenside_castle_rook_square()), kwargs=dict(move_type=MoveOrder.TRAVEL, exception="castle"))
-            return True
-        else: # kingside castle
-            linker = OrderLinker()
-            self.order_manager.get_order(LinkedMoveOrder, (linker, king_piece, power.get_kingside_castle_king_square()), kwargs=dict(move_type=MoveOrder.TRAVEL, exception="castle"))
-            self.order_manager.get_order(LinkedMoveOrder, (linker, rook_piece, power.get_kingside_castle_rook_square()), kwargs=dict(move_type=MoveOrder.TRAVEL, exception="castle"))
-            return True
+        return self._make_order(power, OrderLinker, ("long_castle" if long else "short_castle",))
     
     def _process_order(self, power, message):
         """
         Currently written for the sandbox mode, but should be adapted.
-        
-        We allow orders along illegal chess paths, but we do not allow
-        illegal implicit convoy orders.
         """
         order_class, args = self.parser.parse(message)
         if order_class is None:
             self.console.out("Could not parse order.")
             return False
-        
-        if order_class is OrderLinker: # special linked orders
-            if args[0] == "en_passant":
-                return self.add_en_passant(power, *args[1:])
-            elif args[0] == "long_castle":
-                return self.add_castle(power, long=True)
-            elif args[0] == "short_castle":
-                return self.add_castle(power, long=False)
-            return False
-        
-        starting_square = args[0]
-        piece = self.board.get_piece(starting_square)
-        if order_class is BuildOrder:
-            pass
-        elif piece is None:
-            self.console.out(f"No piece on {starting_square}.")
-            return False
-        elif piece.power != power:
-            self.console.out("Cannot order another power's piece.")
-            return False
-        
-        if order_class is HoldOrder:
-            self.order_manager.get_order(order_class, (piece,))
-            return True
-        elif order_class is MoveOrder:
-            landing_square = args[1]
-            kwargs = None
-            if piece.code == Piece.PAWN and starting_square.file == landing_square.file:
-                kwargs = dict(move_type=MoveOrder.TRAVEL)
-            elif piece.code == Piece.PAWN:
-                kwargs = dict(move_type=MoveOrder.ATTACK)
-            self.order_manager.get_order(order_class, (piece, landing_square), kwargs=kwargs)
-            return True
-        elif order_class is SupportHoldOrder:
-            supported_square = args[1]
-            supported_piece = self.board.get_piece(supported_square)
-            if supported_piece is None:
-                self.console.out(f"No piece on {supported_square} to support.")
-                return False
-            self.order_manager.get_support_order(order_class, piece, HoldOrder, (supported_piece,))
-            return True
-        elif order_class is SupportMoveOrder:
-            supported_square = args[1]
-            supported_piece = self.board.get_piece(supported_square)
-            supported_landing_square = args[3]
-            if supported_piece is None:
-                self.console.out(f"No piece on {supported_square} to support.")
-                return False
-            self.order_manager.get_support_order(order_class, piece, MoveOrder, (supported_piece, supported_landing_square))
-            return True
-        elif order_class is SupportConvoyOrder:
-            convoy_square = args[1]
-            convoy_starting_square = args[2]
-            convoyed_piece = self.board.get_piece(convoy_starting_square)
-            if convoyed_piece is None:
-                self.console.out(f"No piece on {convoy_starting_square} to support convoy.")
-                return False
-            convoyed_order_class = SupportOrder if args[3] == 's' else MoveOrder
-            convoy_landing_square = args[4]
-            _, intermediate_squares = ChessPath.validate_path(convoyed_piece, convoy_landing_square)
-            if convoy_square not in intermediate_squares:
-                self.console.out("Convoying square cannot convoy along specified path.")
-                return False
-            self.order_manager.get_support_convoy_order(piece, convoy_square, convoyed_order_class, (convoyed_piece, convoy_landing_square))
-            return True
-        elif order_class is BuildOrder:
-            piece_chr = args[1].upper() if args[1] else "P"
-            piece_code = self.parser.piece_dict[piece_chr]
-            order = BuildOrder(power, piece_code, starting_square)
-            self.order_manager._clear_conflicting_orders(order)
-            self.order_manager.add(order)
-            return True
-        elif order_class is DisbandOrder:
-            order = DisbandOrder(piece)
-            self.order_manager._clear_conflicting_orders(order)
-            self.order_manager.add(order)
-            return True
-        else:
-            self.console.out("Unknown error!")
+        return self._make_order(power, order_class, args)
+    
+    def _make_order(self, power, order_class, args):
+        """
+        Make an order, see `make_order`, and report why it cannot be made.
+        """
+        try:
+            make_order(self.order_manager, self.board, power, order_class, args)
+        except ValueError as e:
+            self.console.out(e)
             return False
+        return True
     
     def sandbox(self):
         self.console.out("Beginning sandbox. Awaiting instructions.")
@@ -330,7 +374,9 @@ All commands are case insensitive:
    current order set.
  - clear: clear the board.
  - exit: exit the sandbox. Alias: quit.
+ - fork: start a what-if branch of the order set.
  - help: print this message.
+ - merge: leave the current what-if branch, keeping its orders.
  - orders: print the current order set.
  - power <name>: specify the current power. <name> can be a distinct
    prefix, e.g. "ita" for "Italy".
@@ -339,6 +385,8 @@ All commands are case insensitive:
  - redraw (EXPERIMENTAL): redraw paths so that there is less overlap.
    This is an experimental feature.
  - remove <square>: remove the order on the given square.
+ - rollback: leave the current what-if branch, restoring the orders
+   and their adjudication as they were at the fork.
  - save <filename>: save the current board via Matplotlib's `savefig`
    function. Default extension is `.png`.
 """[1:-1] # remove first and last newlines
@@ -347,6 +395,13 @@ All commands are case insensitive:
                 self.adjudicate()
             elif message == "clear":
                 self.clear_board()
+            elif message == "fork":
+                self.fork()
+                self.console.out("Started a what-if branch.")
+            elif message == "merge":
+                self.merge()
+            elif message == "rollback":
+                self.rollback()
             elif message == "orders":
                 if not self.order_manager.has_orders():
                     self.console.out("No orders to display.")
@@ -384,6 +439,7 @@ All commands are case insensitive:
                     filename = "render.png"
                 elif '.' not in filename:
                     filename += ".png"
+                import matplotlib.pyplot as plt
                 plt.savefig(filename, dpi=300)
             elif power is None:
                 self.console.out("No power has been selected. Select a power by writing \"power [name]\"")
@@ -2,7 +2,7 @@
 
 import re
 
-from chessdip.board.square import Square
+from chessdip.board.square import get_square
 from chessdip.board.piece import Piece
 from chessdip.core.order import (
     HoldOrder, MoveOrder, ConvoyOrder, SupportOrder,
@@ -121,4 +121,4 @@ def _square(square_str):
     """
     file = ord(square_str[0]) - ord('a')
     rank = int(square_str[1]) - 1
-    return Square(file=file, rank=rank)
\ No newline at end of file
+    return get_square(file, rank)
\ No newline at end of file
@@ -0,0 +1,266 @@
+# -*-coding:utf8-*-
+
+import logging
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+from chessdip.board.square import get_square
+from chessdip.board.piece import Piece
+from chessdip.core.order import (
+    HoldOrder, MoveOrder, ConvoyOrder, SupportOrder,
+    SupportHoldOrder, SupportMoveOrder, SupportConvoyOrder,
+    LinkedOrder, BuildOrder, DisbandOrder
+)
+from chessdip.game.batch import get_position
+from chessdip.game.standalone import adjudicate_orders, parse_orders
+
+"""
+Shadow verification of the adjudications of a game against the reference
+`Adjudicator`. A sample of the adjudications is adjudicated again in the
+background from plain data, see `chessdip.game.standalone`, and the orders
+whose results differ are logged together with a dump of the position and
+the orders, written as a test case of `chessdip.test.test`.
+"""
+
+logger = logging.getLogger(__name__)
+
+_LETTERS = "PNBRK"
+
+class ShadowVerifier:
+    """
+    Verifier of a fraction of the adjudications of games, see
+    `GameManager.set_shadow_verifier`. The position and the orders of a
+    sampled adjudication are taken as plain data before the adjudication,
+    and its results after; the reference adjudication then runs in a
+    background worker, so that the game does not wait for it.
+    
+    Attributes:
+    ----------
+    - sampled: int. Number of sampled adjudications.
+    - verified: int. Number of sampled adjudications that were verified.
+    - mismatches: list of str. The dumps of the adjudications whose results
+        differ from the reference, in the format of `format_test_case`.
+    """
+    def __init__(self, fraction=1., seed=None, executor=None, log=None):
+        """
+        Parameters:
+        ----------
+        - fraction: float, optional. Fraction of the adjudications to
+            verify. Default value is 1.
+        - seed: int or None, optional. Seed of the sampling. Default value
+            is None.
+        - executor: concurrent.futures.Executor or None, optional. The
+            executor running the reference adjudications. If None, then a
+            single background thread is used. Default value is None.
+        - log: logging.Logger or None, optional. The logger of mismatches
+            and errors. If None, then the logger of this module is used.
+            Default value is None.
+        """
+        self.fraction = fraction
+        self.random = random.Random(seed)
+        self.own_executor = executor is None
+        self.executor = ThreadPoolExecutor(max_workers=1) if executor is None else executor
+        self.log = logger if log is None else log
+        self.sampled = 0
+        self.verified = 0
+        self.mismatches = []
+    
+    def sample(self, game_manager):
+        """
+        Decide whether to verify the coming adjudication of a game, and if
+        so, take its position and orders. This is called before the hold
+        orders of non-moving pieces are added, so that the dump only has
+        the holds that were ordered.
+        
+        Returns:
+        -------
+        - ShadowJob or None: the job to `submit` after the adjudication, or
+            None if the adjudication is not sampled.
+        """
+        if self.random.random() >= self.fraction:
+            return None
+        self.sampled += 1
+        return ShadowJob(game_manager)
+    
+    def submit(self, job, engine):
+        """
+        Take the results of the adjudication of `job`, and verify them in
+        the background.
+        
+        Parameters:
+        ----------
+        - job: ShadowJob, as returned by `sample`.
+        - engine: str. Name of the adjudication engine, for the dump.
+        """
+        results = job.get_results()
+        future = self.executor.submit(_adjudicate_job, job.position, job.setup, job.messages)
+        future.add_done_callback(lambda future: self._verified(job, engine, results, future))
+    
+    def close(self):
+        """
+        Wait for the pending verifications, and shut down the executor if it
+        was made by this verifier.
+        """
+        if self.own_executor:
+            self.executor.shutdown(wait=True)
+    
+    def _verified(self, job, engine, results, future):
+        try:
+            reference_results = future.result()
+        except Exception:
+            self.log.exception("Shadow adjudication failed:\n%s", job.format_test_case("SHADOW"))
+            return
+        self.verified += 1
+        if reference_results == results:
+            return
+        lines = [f"# Shadow mismatch of {engine} against Adjudicator:"]
+        for (power_index, message), result, reference_result in zip(job.messages, results, reference_results):
+            if result != reference_result:
+                lines.append(f"# - {message}: {_format_result(result)}, expected {_format_result(reference_result)}")
+        dump = "\n".join(lines) + "\n" + job.format_test_case(f"SHADOW{len(self.mismatches) + 1}")
+        self.mismatches.append(dump)
+        self.log.warning("Adjudication mismatch:\n%s", dump)
+
+class ShadowJob:
+    """
+    Position and orders of an adjudication, as plain data.
+    
+    Attributes:
+    ----------
+    - position: Position.
+    - setup: BoardSetup.
+    - messages: list of (power_index, message), the real orders as written
+        in the sandbox, see `get_order_messages`.
+    - orders: list of lists of Orders. For each message, the orders it
+        stands for in the order set of the game.
+    """
+    def __init__(self, game_manager):
+        self.position = get_position(game_manager)
+        self.setup = game_manager.board_setup
+        self.messages = []
+        self.orders = []
+        powers = self.setup.powers
+        for power, message, orders in get_order_messages(game_manager.order_manager):
+            self.messages.append((powers.index(power), message))
+            self.orders.append(orders)
+    
+    def get_results(self):
+        """
+        Get the success of each message, once adjudicated.
+        """
+        return tuple(all(order.get_success() for order in orders) for orders in self.orders)
+    
+    def format_test_case(self, name):
+        return format_test_case(name, self.position, self.messages, self.setup)
+
+def get_order_messages(order_interface):
+    """
+    Write the real orders of an order set as in the sandbox. Convoy,
+    build, and disband orders are left out, as they are implied by other
+    orders or are not adjudicated.
+    
+    Returns:
+    -------
+    - list of (power, message, orders), where `orders` is the list of
+        orders that `message` stands for, e.g. both orders of a castle.
+    """
+    messages = []
+    linkers = []
+    for order in order_interface.get_orders():
+        if order.get_virtual() or isinstance(order, ConvoyOrder | BuildOrder | DisbandOrder):
+            continue
+        piece = order.get_piece()
+        power = piece.get_power()
+        if isinstance(order, LinkedOrder):
+            linker = order.get_linker()
+            if linker in linkers:
+                continue
+            linkers.append(linker)
+            orders = list(linker.get_orders())
+            messages.append((power, _get_linker_message(orders), orders))
+            continue
+        
+        start = f"{_LETTERS[piece.code]}{order.get_starting_square()}"
+        supported_order = order.get_supported_order()
+        if isinstance(order, HoldOrder):
+            message = f"{start} H"
+        elif isinstance(order, MoveOrder):
+            message = f"{start} {order.get_landing_square()}"
+        elif isinstance(order, SupportHoldOrder):
+            message = f"{start} S {supported_order.get_starting_square()} H"
+        elif isinstance(order, SupportMoveOrder):
+            message = f"{start} S {supported_order.get_starting_square()} {supported_order.get_landing_square()}"
+        elif isinstance(order, SupportConvoyOrder):
+            convoyed_order = supported_order.get_convoyed_order()
+            convoyed_piece = convoyed_order.get_piece()
+            code = "S " if isinstance(convoyed_order, SupportOrder) else ""
+            message = (
+                f"{start} S {supported_order.get_landing_square()}"
+                f" C {_LETTERS[convoyed_piece.code]}{convoyed_order.get_starting_square()}"
+                f" {code}{convoyed_order.get_landing_square()}"
+            )
+        else:
+            raise ValueError(f"Cannot write order {order}.")
+        messages.append((power, message, [order]))
+    return messages
+
+def format_test_case(name, position, messages, setup):
+    """
+    Write a position and orders as a test case of `chessdip.test.test`,
+    i.e. as a function `test_<name>` that sets up the pieces, gives the
+    orders, and adjudicates them. Powers are referred to by their lowercase
+    names, as in the test module for the standard setup.
+    
+    Parameters:
+    ----------
+    - name: str.
+    - position: Position.
+    - messages: iterable of (power_index, message).
+    - setup: BoardSetup. The setup whose powers are referred to by
+        `position` and `messages`.
+    """
+    powers = setup.powers
+    lines = [f"def test_{name}():"]
+    pieces = {}
+    moved = []
+    for power_index, code, file, rank, piece_moved in position.pieces:
+        square = get_square(file, rank)
+        pieces.setdefault(power_index, []).append(f'"{_LETTERS[code]}{square}"')
+        if piece_moved:
+            moved.append(f'"{square}"')
+    for power_index, instructions in pieces.items():
+        lines.append(f"    GM.setup_pieces({_power_name(powers[power_index])}, [{', '.join(instructions)}])")
+    if moved:
+        lines.append(f"    for square in [{', '.join(moved)}]:")
+        lines.append(f"        GM.board.set_moved(GM.board.get_piece(GM.parser.square(square)), True)")
+    for file, rank, en_passant_file, en_passant_rank in position.en_passant:
+        lines.append(f'    GM.board.mark_en_passant(GM.board.get_piece(GM.parser.square("{get_square(file, rank)}")), GM.parser.square("{get_square(en_passant_file, en_passant_rank)}"))')
+    power_messages = {}
+    for power_index, message in messages:
+        power_messages.setdefault(power_index, []).append(f'"{message}"')
+    for power_index, power_message in power_messages.items():
+        lines.append(f"    GM.process_orders({_power_name(powers[power_index])}, [{', '.join(power_message)}])")
+    lines.append("    GM.adjudicate()")
+    return "\n".join(lines) + "\n"
+
+def _get_linker_message(orders):
+    pieces = [order.get_piece() for order in orders]
+    if pieces[0] is pieces[-1]: # en passant
+        piece = pieces[0]
+        travel_order = next(order for order in orders if order.is_travel())
+        attack_order = next(order for order in orders if order.is_attack())
+        return f"{_LETTERS[piece.code]}{piece.get_square()} T {travel_order.get_landing_square()} X {attack_order.get_landing_square()}"
+    king_order = next(order for order in orders if order.get_piece().code == Piece.KING)
+    power = king_order.get_piece().get_power()
+    if king_order.get_landing_square() == power.get_queenside_castle_king_square():
+        return "O-O-O"
+    return "O-O"
+
+def _adjudicate_job(position, setup, messages):
+    return adjudicate_orders(position, parse_orders(messages), setup=setup)
+
+def _format_result(result):
+    return {True: "succeeds", False: "fails", None: "replaced"}[result]
+
+def _power_name(power):
+    return power.name.lower()
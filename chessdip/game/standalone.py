@@ -0,0 +1,284 @@
+# -*-coding:utf8-*-
+
+from chessdip.board.square import get_square
+from chessdip.board.piece import Piece
+from chessdip.board.chess_path import ChessPath
+from chessdip.core.order import (
+    HoldOrder, MoveOrder, SupportOrder,
+    SupportHoldOrder, SupportMoveOrder, SupportConvoyOrder,
+    OrderLinker, LinkedMoveOrder,
+    BuildOrder, DisbandOrder
+)
+from chessdip.core.adjudicator import Adjudicator
+from chessdip.game.board_setup import standard_setup
+from chessdip.game.order_manager import OrderManager
+from chessdip.game.parser import Parser
+from chessdip.interface.headless import HeadlessVisualInterface
+
+"""
+Standalone adjudication of plain data: a position and a list of parsed
+orders go in, and the success of each order comes out. Orders are kept in
+an OrderManager with a HeadlessVisualInterface: no game, figure, or
+console is made, and matplotlib is not imported, so that this module can
+serve adjudication jobs and services.
+"""
+
+class PositionBoard:
+    """
+    Board made from a Position, with the methods of BoardInterface needed
+    to make orders.
+    """
+    def __init__(self, position, powers):
+        """
+        Parameters:
+        ----------
+        - position: Position.
+        - powers: list of Powers, such as the `powers` of a BoardSetup.
+            The powers that `position` refers to by index.
+        """
+        self.pieces = {} # square: piece
+        for power_index, code, file, rank, moved in position.pieces:
+            square = get_square(file, rank)
+            piece = Piece(code, powers[power_index], square)
+            piece.moved = moved
+            self.pieces[square] = piece
+        self.en_passant = []
+        for file, rank, en_passant_file, en_passant_rank in position.en_passant:
+            piece = self.pieces[get_square(file, rank)]
+            self.en_passant.append((piece, get_square(en_passant_file, en_passant_rank)))
+    
+    def get_pieces(self):
+        return self.pieces.values()
+    
+    def get_piece(self, square):
+        return self.pieces.get(square)
+    
+    def get_moved(self, piece):
+        return piece.moved
+    
+    def can_en_passant(self, piece, square):
+        return (piece, square) in self.en_passant
+
+def adjudicate_orders(position, orders, setup=None, adjudicator_class=Adjudicator):
+    """
+    Adjudicate orders on a position.
+    
+    Parameters:
+    ----------
+    - position: Position.
+    - orders: iterable of (power_index, order_class, args), where
+        `power_index` is the index of the ordering power in the `powers` of
+        the board setup, and (order_class, args) is an order as returned by
+        `Parser.parse`. An order replaces the earlier orders of its pieces.
+    - setup: BoardSetup or None, optional. The setup whose powers are
+        referred to by `position` and `orders`. If None, then
+        `standard_setup` is used. Default value is None.
+    - adjudicator_class: class, optional. Default value is Adjudicator.
+    
+    Returns:
+    -------
+    - tuple of bools or Nones: for each order of `orders`, whether it
+        succeeded. Linked orders (castles and en passant) succeed together.
+        Orders that were replaced by a later order are None.
+    
+    Raises:
+    ------
+    - ValueError: if an order cannot be made, e.g. there is no piece on its
+        starting square.
+    """
+    if setup is None:
+        setup = standard_setup
+    board = PositionBoard(position, setup.powers)
+    order_set = OrderManager(HeadlessVisualInterface())
+    made_orders = []
+    for power_index, order_class, args in orders:
+        order = make_order(order_set, board, setup.powers[power_index], order_class, args)
+        if isinstance(order, OrderLinker):
+            made_orders.append(tuple(order.get_orders()))
+        else:
+            made_orders.append((order,))
+    
+    add_holds(order_set, board)
+    adjudicator = adjudicator_class(order_set)
+    try:
+        adjudicator.adjudicate()
+    finally:
+        adjudicator.close()
+    
+    results = []
+    for made in made_orders:
+        if all(order in order_set.get_orders() and not order.get_virtual() for order in made):
+            results.append(all(order.get_success() for order in made))
+        else:
+            results.append(None)
+    return tuple(results)
+
+def parse_orders(messages):
+    """
+    Parse orders as written in the sandbox.
+    
+    Parameters:
+    ----------
+    - messages: iterable of (power_index, message), e.g. (3, "Kd1 d2").
+    
+    Returns:
+    -------
+    - list of (power_index, order_class, args), as taken by
+        `adjudicate_orders`.
+    """
+    parser = Parser()
+    orders = []
+    for power_index, message in messages:
+        order_class, args = parser.parse(message.lower().replace(' ', ''))
+        if order_class is None:
+            raise ValueError(f"Could not parse order {message}.")
+        orders.append((power_index, order_class, args))
+    return orders
+
+def make_order(order_set, board, power, order_class, args):
+    """
+    Make an order in an order set. This is how the orders of a game are
+    made, see `GameManager.process_orders`.
+    
+    We allow orders along illegal chess paths, but we do not allow
+    illegal implicit convoy orders.
+    
+    Parameters:
+    ----------
+    - order_set: OrderManager.
+    - board: PositionBoard or BoardInterface.
+    - power: Power. The ordering power.
+    - order_class, args: an order as returned by `Parser.parse`.
+    
+    Returns:
+    -------
+    - Order or OrderLinker: the real order that was made.
+    
+    Raises:
+    ------
+    - ValueError: if the order cannot be made.
+    """
+    if order_class is OrderLinker: # special linked orders
+        if args[0] == "en_passant":
+            return _make_en_passant(order_set, board, *args[1:])
+        elif args[0] == "long_castle":
+            return _make_castle(order_set, board, power, long=True)
+        elif args[0] == "short_castle":
+            return _make_castle(order_set, board, power, long=False)
+        raise ValueError(f"Unknown linked order {args[0]}.")
+    
+    starting_square = args[0]
+    piece = board.get_piece(starting_square)
+    if order_class is BuildOrder:
+        pass
+    elif piece is None:
+        raise ValueError(f"No piece on {starting_square}.")
+    elif piece.power != power:
+        raise ValueError("Cannot order another power's piece.")
+    
+    if order_class is HoldOrder:
+        return order_set.get_order(order_class, (piece,))
+    elif order_class is MoveOrder:
+        landing_square = args[1]
+        kwargs = None
+        if piece.code == Piece.PAWN and starting_square.file == landing_square.file:
+            kwargs = dict(move_type=MoveOrder.TRAVEL)
+        elif piece.code == Piece.PAWN:
+            kwargs = dict(move_type=MoveOrder.ATTACK)
+        return order_set.get_order(order_class, (piece, landing_square), kwargs=kwargs)
+    elif order_class is SupportHoldOrder:
+        supported_piece = _get_piece(board, args[1], "to support")
+        return order_set.get_support_order(order_class, piece, HoldOrder, (supported_piece,))
+    elif order_class is SupportMoveOrder:
+        supported_piece = _get_piece(board, args[1], "to support")
+        return order_set.get_support_order(order_class, piece, MoveOrder, (supported_piece, args[3]))
+    elif order_class is SupportConvoyOrder:
+        convoy_square = args[1]
+        convoyed_piece = _get_piece(board, args[2], "to support convoy")
+        convoyed_order_class = SupportOrder if args[3] == 's' else MoveOrder
+        convoy_landing_square = args[4]
+        _, intermediate_squares = ChessPath.validate_path(convoyed_piece, convoy_landing_square)
+        if convoy_square not in intermediate_squares:
+            raise ValueError("Convoying square cannot convoy along specified path.")
+        return order_set.get_support_convoy_order(piece, convoy_square, convoyed_order_class, (convoyed_piece, convoy_landing_square))
+    elif order_class is BuildOrder:
+        piece_chr = args[1].upper() if args[1] else "P"
+        order = BuildOrder(power, Parser().piece_dict[piece_chr], starting_square)
+        order_set._clear_conflicting_orders(order)
+        return order_set.add(order)
+    elif order_class is DisbandOrder:
+        order = DisbandOrder(piece)
+        order_set._clear_conflicting_orders(order)
+        return order_set.add(order)
+    raise ValueError(f"Unknown order class {order_class}.")
+
+def add_holds(order_set, board):
+    """
+    Add or make real the hold orders for non-moving pieces, before an
+    adjudication. A piece has at most one hold order: a given or supported
+    hold order is made real, and a hold order is only added to pieces
+    without one, so that adjudicating again does not add orders.
+    
+    Parameters:
+    ----------
+    - order_set: OrderManager.
+    - board: PositionBoard or BoardInterface.
+    """
+    has_move_order = {piece: False for piece in board.get_pieces()}
+    has_hold_order = {piece: False for piece in board.get_pieces()}
+    for order in order_set.get_orders():
+        if isinstance(order, MoveOrder) and not order.get_virtual() and order.chess_path.valid:
+            has_move_order[order.get_piece()] = True
+    for order in order_set.get_orders():
+        if isinstance(order, HoldOrder) and not has_move_order[order.get_piece()]:
+            if order.get_virtual():
+                order_set.set_virtual(order, False)
+            has_hold_order[order.get_piece()] = True
+    for piece, b in has_move_order.items():
+        if not b and not has_hold_order[piece]:
+            order_set.add(HoldOrder(piece))
+
+def _get_piece(board, square, purpose):
+    piece = board.get_piece(square)
+    if piece is None:
+        raise ValueError(f"No piece on {square} {purpose}.")
+    return piece
+
+def _make_en_passant(order_set, board, starting_square, travel_square, attack_square):
+    pawn_piece = board.get_piece(starting_square)
+    if pawn_piece is None or pawn_piece.code != Piece.PAWN:
+        raise ValueError(f"No pawn on {starting_square}.")
+    passed_pawn_piece = board.get_piece(attack_square)
+    if passed_pawn_piece is None or passed_pawn_piece.code != Piece.PAWN:
+        raise ValueError(f"No pawn on {attack_square} to attack.")
+    elif not board.can_en_passant(passed_pawn_piece, travel_square):
+        raise ValueError(f"{passed_pawn_piece} is not open to en passant.")
+    linker = OrderLinker()
+    order_set.get_order(LinkedMoveOrder, (linker, pawn_piece, travel_square), kwargs=dict(move_type=MoveOrder.TRAVEL))
+    order_set.get_order(LinkedMoveOrder, (linker, pawn_piece, attack_square), kwargs=dict(move_type=MoveOrder.ATTACK, exception="en_passant"))
+    return linker
+
+def _make_castle(order_set, board, power, long=False):
+    king_square = power.get_king_square()
+    if long:
+        rook_square = power.get_queen_rook_square()
+        king_landing_square = power.get_queenside_castle_king_square()
+        rook_landing_square = power.get_queenside_castle_rook_square()
+    else:
+        rook_square = power.get_king_rook_square()
+        king_landing_square = power.get_kingside_castle_king_square()
+        rook_landing_square = power.get_kingside_castle_rook_square()
+    king_piece = board.get_piece(king_square)
+    rook_piece = board.get_piece(rook_square)
+    if king_piece is None:
+        raise ValueError(f"No king on {king_square} to castle.")
+    elif rook_piece is None:
+        raise ValueError(f"No rook on {rook_square} to castle.")
+    elif board.get_moved(king_piece):
+        raise ValueError(f"{king_piece} already moved.")
+    elif board.get_moved(rook_piece):
+        raise ValueError(f"{rook_piece} already moved.")
+    linker = OrderLinker()
+    order_set.get_order(LinkedMoveOrder, (linker, king_piece, king_landing_square), kwargs=dict(move_type=MoveOrder.TRAVEL, exception="castle"))
+    order_set.get_order(LinkedMoveOrder, (linker, rook_piece, rook_landing_square), kwargs=dict(move_type=MoveOrder.TRAVEL, exception="castle"))
+    return linker
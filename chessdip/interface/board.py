@@ -1,6 +1,6 @@
 # -*-coding:utf8-*-
 
-from chessdip.board.square import Square
+from chessdip.board.square import SQUARES, get_square_id
 from chessdip.board.power import Side
 from chessdip.board.piece import Piece
 from chessdip.board.board import Board
@@ -8,16 +8,27 @@ from chessdip.board.board import Board
 class BoardInterface:
     """
     Managing class for squares, supply centers, and pieces.
+    
+    Pieces are looked up by square in the index of the board,
+    `Board.square_pieces`, which is updated with the pieces. If `debug` is
+    True, then the index, the bitboards, and the hash of the board are
+    checked against the pieces after every change, see
+    `check_consistency`.
+    
+    The `moved` flag of pieces is part of the hash of the position, see
+    `get_hash`, so it is set with `set_moved`.
     """
-    def __init__(self, setup, visualizer):
+    def __init__(self, setup, visualizer, debug=False):
         """
         Parameters:
         ----------
         - setup: BoardSetup: data for how the board and pieces should be
             initialized.
         - visualizer: VisualInterface.
+        - debug: bool, optional. Default value is False.
         """
         self.visualizer = visualizer
+        self.debug = debug
         
         self.board = Board(setup)
         self.board_artist = self.visualizer.make_board_artist(self.board)
@@ -30,11 +41,12 @@ class BoardInterface:
         for _, artist in self.piece_artists.items():
             artist.remove()
         self.piece_artists.clear()
-        for rank in range(8):
-            for file in range(8):
-                square = Square(rank=rank, file=file)
-                self.set_ownership(square, self.board.get_default_owner(square))
-                self.set_sc_ownership(square, self.board.get_default_sc_owner(square))
+        self.board.clear_pieces()
+        if self.debug:
+            self.check_consistency()
+        for square in SQUARES:
+            self.set_ownership(square, self.board.get_default_owner(square))
+            self.set_sc_ownership(square, self.board.get_default_sc_owner(square))
         self.visualizer.set_stale()
     
     def get_pieces(self):
@@ -43,25 +55,43 @@ class BoardInterface:
     def get_moved(self, piece):
         return piece.moved
     
+    def set_moved(self, piece, moved):
+        self.board.set_moved(piece, moved)
+    
+    def get_hash(self):
+        """
+        Get the Zobrist hash of the position, see `Board`.
+        """
+        return self.board.position_hash
+    
     def add_piece(self, code, power, square):
         piece = Piece(code, power, square)
         piece.moved = False
+        self.board.add_piece(piece)
         self.set_ownership(square, power)
         piece_artist = self.visualizer.make_piece_artist(piece)
         self.piece_artists[piece] = piece_artist
         self.visualizer.add_artist(piece_artist)
+        if self.debug:
+            self.check_consistency()
         return piece
     
     def remove_piece(self, piece):
         self.piece_artists[piece].remove()
         del self.piece_artists[piece]
+        self.board.remove_piece(piece)
         self.visualizer.set_stale()
+        if self.debug:
+            self.check_consistency()
     
     def get_piece(self, square):
-        for piece in self.get_pieces():
-            if piece.get_square() == square:
-                return piece
-        return None
+        """
+        Get the piece on `square`, or None. While orders are executed, a
+        square may hold several pieces, of which the first to arrive is
+        returned.
+        """
+        pieces = self.board.square_pieces[get_square_id(square)]
+        return pieces[0] if pieces else None
     
     def set_ownership(self, square, power):
         changed = self.board.set_ownership(square, power)
@@ -88,26 +118,73 @@ class BoardInterface:
         self.visualizer.set_stale()
     
     def vacate_square(self, square):
-        for piece in self.get_pieces():
-            if piece.get_square() == square:
-                self.remove_piece(piece)
-                self.visualizer.set_stale()
+        for piece in list(self.board.square_pieces[get_square_id(square)]):
+            self.remove_piece(piece)
     
     def move_piece_to(self, piece, square):
+        self.board.move_piece(piece, square)
         piece.move_to(square)
-        piece.moved = True
+        self.board.set_moved(piece, True)
         self.piece_artists[piece].move_to(square)
         self.set_ownership(square, piece.get_power())
         self.visualizer.set_stale()
+        if self.debug:
+            self.check_consistency()
+    
+    def check_consistency(self):
+        """
+        Check the square index, the bitboards, and the hash of the board
+        against the pieces, the supply center ownership, and the squares
+        open to en passant.
+        
+        Raises:
+        ------
+        - RuntimeError: if they differ.
+        """
+        square_pieces = [[] for _ in range(64)]
+        for piece in self.get_pieces():
+            square_pieces[get_square_id(piece.square)].append(piece)
+        board = self.board
+        for index, (pieces, indexed_pieces) in enumerate(zip(square_pieces, board.square_pieces)):
+            if set(pieces) != set(indexed_pieces) or len(indexed_pieces) != len(pieces):
+                raise RuntimeError(f"Square index of {SQUARES[index]} has {[str(piece) for piece in indexed_pieces]}, expected {[str(piece) for piece in pieces]}.")
+        occupied = 0
+        power_pieces = [0] * len(board.power_pieces)
+        piece_types = [0] * len(board.piece_types)
+        for piece in self.get_pieces():
+            bit = 1 << get_square_id(piece.square)
+            occupied |= bit
+            power_pieces[board.powers.index(piece.power)] |= bit
+            piece_types[piece.code] |= bit
+        if occupied != board.occupied or power_pieces != board.power_pieces or piece_types != board.piece_types:
+            raise RuntimeError("Piece bitboards are out of date.")
+        sc_owned = [0] * len(board.sc_owned)
+        for rank in range(8):
+            for file in range(8):
+                if board.sc_mask[rank, file]:
+                    sc_owned[board.sc_ownership[rank, file]] |= 1 << (rank * 8 + file)
+        if sc_owned != board.sc_owned:
+            raise RuntimeError("Supply center bitboards are out of date.")
+        if board.compute_hash(square for _, square in self.en_passant) != board.position_hash:
+            raise RuntimeError("Position hash is out of date.")
     
     def mark_en_passant(self, piece, square):
         self.en_passant.append((piece, square))
+        self.board.toggle_en_passant(square)
     
     def clear_en_passant(self):
+        for _, square in self.en_passant:
+            self.board.toggle_en_passant(square)
         self.en_passant.clear()
     
     def can_en_passant(self, piece, square):
         return (piece, square) in self.en_passant
     
-    def set_phase(self, phase_str):
-        self.board_artist.set_phase(phase_str)
\ No newline at end of file
+    def set_phase(self, phase_str, phase=None):
+        """
+        Show the phase as `phase_str`, and set it in the hash of the
+        position if `phase` is given.
+        """
+        self.board_artist.set_phase(phase_str)
+        if phase is not None:
+            self.board.set_phase(phase)
\ No newline at end of file
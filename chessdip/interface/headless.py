@@ -0,0 +1,84 @@
+# -*-coding:utf8-*-
+
+class NullArtist:
+    """
+    Artist that draws nothing. It accepts the calls made by the board and
+    order interfaces on board, piece, and order artists.
+    """
+    def __init__(self):
+        self.virtual = False
+    
+    def add_to_ax(self, ax, zorder=1.):
+        pass
+    
+    def remove(self):
+        pass
+    
+    def move_to(self, square):
+        pass
+    
+    def set_owner(self, square, power):
+        pass
+    
+    def set_sc_owner(self, square, power):
+        pass
+    
+    def set_phase(self, phase_str):
+        pass
+    
+    def get_virtual(self):
+        return self.virtual
+    
+    def set_virtual(self, virtual):
+        self.virtual = virtual
+    
+    def add_support(self, support_artist):
+        pass
+    
+    def remove_support(self, support_artist):
+        pass
+    
+    def set_success(self, success):
+        pass
+    
+    def set_support_success(self, support_artist, success):
+        pass
+
+class HeadlessVisualInterface:
+    """
+    Visual interface without a figure, for adjudicating without rendering.
+    It has the same methods as `VisualInterface`, except that every artist
+    is a `NullArtist`.
+    """
+    def __init__(self):
+        self.stale = False
+    
+    def set_stale(self, stale=True):
+        self.stale = stale
+    
+    def ion(self):
+        pass
+    
+    def ioff(self):
+        pass
+    
+    def show(self):
+        pass
+    
+    def render(self):
+        self.stale = False
+    
+    def set_title(self, title):
+        pass
+    
+    def make_board_artist(self, board):
+        return NullArtist()
+    
+    def make_piece_artist(self, piece):
+        return NullArtist()
+    
+    def make_order_artist(self, order, supported_artist):
+        return NullArtist()
+    
+    def add_artist(self, artist):
+        pass
@@ -6,16 +6,152 @@ from chessdip.core.order import (
     OrderLinker, LinkedOrder,
     BuildOrder, DisbandOrder
 )
-from chessdip.artists.chess_path import ChessPathArtist, ChessPathArtistManager
 
 class OrderInterface:
     """
     Managing class for orders and their artists.
+    
+    Changes of the order set, including the success of orders, can be
+    undone back to a checkpoint, see `checkpoint`. Checkpoints can be
+    nested.
+    
+    The changes notified to observers are also counted in `changes`, so
+    that one can tell whether the order set changed since an earlier
+    count. Changes of the success of orders are not counted.
     """
     def __init__(self, visualizer):
         self.visualizer = visualizer
         self.artists = {}
+        self.observers = []
+        self.journals = []
+        self.positions = {} # order: position in the order set, for rollbacks
+        self.next_position = 0
+        self.changes = 0
+    
+    def add_observer(self, observer):
+        """
+        Add an observer of the order set. Observers are notified of changes
+        via their methods `order_changed(order)`, called whenever an order is
+        added, removed, made (non-)virtual, or has its supports or convoys
+        changed, and `orders_cleared()`.
+        """
+        self.observers.append(observer)
+    
+    def remove_observer(self, observer):
+        self.observers.remove(observer)
+    
+    def _notify(self, *orders):
+        self.changes += 1
+        for observer in self.observers:
+            for order in orders:
+                observer.order_changed(order)
         
+    # ==== Checkpoints ====
+    
+    def checkpoint(self):
+        """
+        Start recording the changes of the order set, so that they can be
+        undone with `rollback`, or kept with `merge`. The cost of either is
+        proportional to the number of changes.
+        """
+        self.journals.append([])
+    
+    def rollback(self):
+        """
+        Undo the changes since the last checkpoint, and drop it. Observers
+        are notified of the undone changes.
+        """
+        journal = self.journals.pop()
+        journals, self.journals = self.journals, []
+        try:
+            for undo, args in reversed(journal):
+                undo(*args)
+        finally:
+            self.journals = journals
+        restored = [order for undo, args in journal if undo == self._restore for order in args[0] if order in self.artists]
+        if restored:
+            self._reorder(min(self.positions[order] for order in restored))
+    
+    def merge(self):
+        """
+        Keep the changes since the last checkpoint, and drop it. The changes
+        can still be undone by rolling back an earlier checkpoint.
+        """
+        journal = self.journals.pop()
+        if self.journals:
+            self.journals[-1].extend(journal)
+            return
+        for undo, args in journal:
+            if undo == self._restore:
+                for order in args[0]:
+                    if order not in self.artists:
+                        self.positions.pop(order, None)
+    
+    def _record(self, undo, *args):
+        if self.journals:
+            self.journals[-1].append((undo, args))
+    
+    def _restore(self, orders):
+        for order in orders:
+            position = self.positions[order]
+            if isinstance(order, LinkedOrder) and order not in order.get_linker().get_orders():
+                order.get_linker().add_order(order)
+            self.add(order)
+            self.positions[order] = position
+    
+    def _reorder(self, first):
+        """
+        Put restored orders back to their place in the order set. Restored
+        orders are added at the end of the order set, and the other orders
+        are in place, so only the orders from position `first` on move.
+        """
+        tail = []
+        for order in reversed(self.artists):
+            if self.positions[order] < first:
+                break
+            tail.append(order)
+        artists = [(order, self.artists.pop(order)) for order in tail]
+        artists.sort(key=lambda item: self.positions[item[0]])
+        self.artists.update(artists)
+    
+    def _restore_virtual(self, order, virtual):
+        order.set_virtual(virtual)
+        self.artists[order].set_virtual(virtual)
+        self._notify(order)
+        self.visualizer.set_stale()
+    
+    def _restore_support(self, order, support_order, index):
+        order.get_supports().insert(index, support_order)
+        self.artists[order].add_support(self.artists[support_order])
+        self._notify(order)
+        self.visualizer.set_stale()
+    
+    def _restore_convoy(self, order, convoy_order, index):
+        order.get_convoys().insert(index, convoy_order)
+        self._notify(order)
+    
+    def _restore_success(self, order, success):
+        """
+        Set the success of an order, but not of its convoys.
+        """
+        order.set_success(success)
+        self.artists[order].set_success(success)
+        supported_order = order.get_supported_order()
+        if supported_order is not None:
+            self.artists[supported_order].set_support_success(self.artists[order], success)
+    
+    def _restore_convoys(self, order, old_convoys, convoys, convoyed_orders, virtuals):
+        """
+        Undo `inherit_convoys`.
+        """
+        order.set_convoys(old_convoys)
+        for convoy_order, convoyed_order, virtual in zip(convoys, convoyed_orders, virtuals):
+            convoy_order.set_convoyed_order(convoyed_order)
+            convoy_order.set_virtual(virtual)
+        self._notify(order, *convoys)
+    
+    # ==== Order set ====
+    
     def has_orders(self):
         return bool(self.artists)
     
@@ -36,9 +172,15 @@ class OrderInterface:
         """
         Remove all orders and their artists.
         """
+        self._record(self._restore, list(self.artists))
         for _, artist in self.artists.items():
             artist.remove()
         self.artists.clear()
+        if not self.journals:
+            self.positions.clear()
+        self.changes += 1
+        for observer in self.observers:
+            observer.orders_cleared()
         self.visualizer.set_stale()
     
     def add(self, order):
@@ -49,47 +191,70 @@ class OrderInterface:
         order_artist = self.visualizer.make_order_artist(order, supported_artist)
         self.artists[order] = order_artist
         self.visualizer.add_artist(order_artist)
+        self.positions[order] = self.next_position
+        self.next_position += 1
+        self._record(self.remove, order)
+        self._notify(order)
         return order
     
     def remove(self, order):
+        self._record(self._restore, [order])
         self.artists[order].remove() # From visualizer
         del self.artists[order]
+        if not self.journals:
+            del self.positions[order]
         if isinstance(order, LinkedOrder):
             order.get_linker().remove_order(order)
+        self._notify(order)
         self.visualizer.set_stale()
     
     def set_virtual(self, order, virtual=True):
+        self._record(self._restore_virtual, order, order.get_virtual())
         order.set_virtual(virtual)
         self.artists[order].set_virtual(virtual)
         for convoy_order in order.get_convoys():
             self.set_virtual(convoy_order, virtual)
+        self._notify(order)
         self.visualizer.set_stale()
     
     def add_support(self, order, support_order):
+        self._record(self.remove_support, order, support_order)
         order.add_support(support_order)
         self.artists[order].add_support(self.artists[support_order])
+        self._notify(order)
         self.visualizer.set_stale()
     
     def remove_support(self, order, support_order):
+        self._record(self._restore_support, order, support_order, order.get_supports().index(support_order))
         order.remove_support(support_order)
         self.artists[order].remove_support(self.artists[support_order])
+        self._notify(order)
         self.visualizer.set_stale()
     
     def add_convoy(self, order, convoy_order):
+        self._record(self.remove_convoy, order, convoy_order)
         order.add_convoy(convoy_order)
+        self._notify(order)
     
     def remove_convoy(self, order, convoy_order):
+        self._record(self._restore_convoy, order, convoy_order, order.get_convoys().index(convoy_order))
         order.remove_convoy(convoy_order)
+        self._notify(order)
     
     def inherit_convoys(self, order, other_order):
         """
         Move the convoys of `other_order` to `order`.
         """
         convoys = other_order.get_convoys()
+        if self.journals:
+            convoyed_orders = [convoy_order.get_convoyed_order() for convoy_order in convoys]
+            virtuals = [convoy_order.get_virtual() for convoy_order in convoys]
+            self._record(self._restore_convoys, order, order.get_convoys(), convoys, convoyed_orders, virtuals)
         order.set_convoys(convoys)
         for convoy_order in convoys:
             convoy_order.set_convoyed_order(order)
             convoy_order.set_virtual(order.get_virtual())
+        self._notify(order, other_order, *convoys)
     
     def set_success(self, order, success):
         if isinstance(order, OrderLinker):
@@ -101,15 +266,15 @@ class OrderInterface:
         self.visualizer.set_stale()
     
     def _set_success_single_order(self, order, success):
-        order.set_success(success)
-        self.artists[order].set_success(success)
-        supported_order = order.get_supported_order()
-        if supported_order is not None:
-            self.artists[supported_order].set_support_success(self.artists[order], success)
+        self._record(self._restore_success, order, order.get_success())
+        self._restore_success(order, success)
         for convoy_order in order.get_convoys():
             self.set_success(convoy_order, success)
     
     def recompute_paths(self):
+        # Imported here, so that the order set can be used without matplotlib
+        from chessdip.artists.chess_path import ChessPathArtistManager
+        
         CPAM = ChessPathArtistManager(self.visualizer)
         items = [(order, artist) for order, artist in self.artists.items() if (not isinstance(order, HoldOrder | BuildOrder | DisbandOrder | ConvoyOrder)) and order.chess_path.valid]
         for order, artist in items:
@@ -0,0 +1,518 @@
+# -*-coding:utf8-*-
+
+import matplotlib
+matplotlib.use("Agg") # the test cases module imports pyplot
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import chessdip.test.test as cases
+from chessdip.game import GameManager, standard_setup
+from chessdip.game.game import SilentConsole
+from chessdip.interface.headless import HeadlessVisualInterface
+from chessdip.core.order import HoldOrder
+from chessdip.core.adjudicator import Adjudicator
+from chessdip.core.scc_adjudicator import SCCAdjudicator
+from chessdip.core.stack_adjudicator import StackAdjudicator
+from chessdip.core.plan import CompiledAdjudicator
+from chessdip.core.parallel import ParallelAdjudicator
+from chessdip.core.static_adjudicator import StaticAdjudicator, OrderSetAnalysis
+from chessdip.core.stats import AdjudicationStats, AdjudicationBudget, AdjudicationCancelled
+from chessdip.core.cache import AdjudicationCache, encode_results, decode_results
+from chessdip.board.square import Square, SQUARES, get_square_id
+from chessdip.game.batch import get_position, set_position, make_headless_game, adjudicate_order_set, adjudicate_many, adjudicate_lockstep
+from chessdip.game.order_manager import OrderManager
+from chessdip.game.standalone import PositionBoard, parse_orders, make_order, add_holds
+from chessdip.game.shadow import ShadowVerifier, get_order_messages
+
+"""
+Headless runs of the test cases of `chessdip.test.test`, without a window
+or a user, e.g. with `python -m pytest chessdip/test`.
+"""
+
+ENGINES = [SCCAdjudicator, StackAdjudicator, CompiledAdjudicator, StaticAdjudicator]
+
+def use_incremental_adjudication():
+    return lambda GM: GM.set_incremental_adjudication(True)
+
+def use_cache():
+    cache = AdjudicationCache()
+    return lambda GM: GM.set_adjudication_cache(cache)
+
+# Ways of adjudicating through a GameManager other than its adjudicator:
+# name: function making the setup of the game, shared by all test cases
+MODES = {
+    "incremental": use_incremental_adjudication,
+    "cache": use_cache,
+}
+
+def make_game(**kwargs):
+    """
+    Make a headless GameManager on the standard board, and make it the
+    game of the test cases.
+    """
+    GM = GameManager(board=standard_setup, visualizer=HeadlessVisualInterface(), console=SilentConsole(), **kwargs)
+    cases.GM = GM
+    cases.england, cases.italy, cases.france, cases.scandinavia = GM.get_powers()
+    return GM
+
+def run_case(case, adjudicator_class=Adjudicator, setup=None):
+    """
+    Run a test case. If given, `setup` is called on the game before.
+    
+    Returns:
+    -------
+    - sorted list of (order string, success), or the name of the exception
+        raised by the test case.
+    """
+    GM = make_game()
+    GM.set_adjudicator_class(adjudicator_class)
+    if setup is not None:
+        setup(GM)
+    results = []
+    set_success = GM.order_manager.set_success
+    def record(order, success):
+        results.append((str(order), success))
+        set_success(order, success)
+    GM.order_manager.set_success = record
+    try:
+        getattr(cases, f"test_{case}")()
+    except Exception as e:
+        return type(e).__name__
+    return sorted(results)
+
+@pytest.mark.parametrize("adjudicator_class", ENGINES, ids=lambda cls: cls.__name__)
+def test_engine_equivalence(adjudicator_class):
+    mismatches = [case for case in cases.TEST_CASES if run_case(case, adjudicator_class) != run_case(case)]
+    assert mismatches == []
+
+@pytest.mark.parametrize("mode", MODES)
+def test_mode_equivalence(mode):
+    setup = MODES[mode]()
+    for _ in range(2): # adjudicated again, e.g. from the cache
+        mismatches = [case for case in cases.TEST_CASES if run_case(case, setup=setup) != run_case(case)]
+        assert mismatches == []
+
+def test_one_hold_per_piece():
+    GM = make_game()
+    GM.setup_pieces(cases.england, ["Kd1", "Rd2", "Nb1"])
+    GM.process_orders(cases.england, ["Kd1 H", "Rd2 S Nb1 H"])
+    for _ in range(2):
+        GM.adjudicate()
+        holds = {str(order.get_piece()): order for order in GM.order_manager.get_orders() if isinstance(order, HoldOrder)}
+        assert len(holds) == 3
+        assert sum(isinstance(order, HoldOrder) for order in GM.order_manager.get_orders()) == 3
+        assert all(not order.get_virtual() for order in holds.values())
+        assert len(holds["England Knight at b1"].get_supports()) == 1
+
+def test_budget_reuse():
+    GM = make_game()
+    budget = AdjudicationBudget(seconds=60, interval=1)
+    GM.set_adjudicator_hook(budget)
+    for case in ["6C1", "6C3"]:
+        budget.deadline = 0 # the budget of an earlier adjudication ran out
+        GM.clear_board()
+        getattr(cases, f"test_{case}")()
+        assert 0 < budget.resolve_calls
+        assert budget.get_elapsed() < 60
+
+def test_budget_cancel():
+    GM = make_game()
+    budget = AdjudicationBudget(interval=1000)
+    GM.set_adjudicator_hook(budget)
+    budget.cancel() # e.g. from another thread, before the adjudication
+    with pytest.raises(AdjudicationCancelled):
+        cases.test_6C1()
+    assert budget.cancelled
+    budget.reset()
+    GM.clear_board()
+    cases.test_6C1()
+    assert not budget.cancelled
+
+def test_static_adjudicator_missed_cycle(monkeypatch):
+    # An analysis missing the circular movement of 6.C.1
+    analyze = OrderSetAnalysis.__init__
+    def analyze_acyclic(self, adjudicator):
+        analyze(self, adjudicator)
+        self.acyclic = True
+    monkeypatch.setattr(OrderSetAnalysis, "__init__", analyze_acyclic)
+    stats = AdjudicationStats()
+    assert run_case("6C1", StaticAdjudicator, setup=lambda GM: GM.set_adjudicator_hook(stats)) == run_case("6C1")
+    assert stats.adjudications == 1
+    assert stats.circular == 1
+
+def test_compiled_adjudicator_indexes():
+    GM = make_game()
+    cases.test_6C1()
+    adjudicator = CompiledAdjudicator(GM.order_manager)
+    adjudicator.adjudicate()
+    assert adjudicator._get_dependency_graph() == Adjudicator(GM.order_manager)._get_dependency_graph()
+
+def test_compiled_adjudicator_plan():
+    GM = make_game()
+    cases.test_6C1()
+    adjudicator = CompiledAdjudicator(GM.order_manager)
+    adjudicator.adjudicate()
+    plan = adjudicator.plan
+    adjudicator.rebind()
+    adjudicator.adjudicate()
+    assert adjudicator.plan is plan
+    GM.process_orders(cases.england, ["Kd1 H"])
+    adjudicator.rebind()
+    adjudicator.adjudicate()
+    assert adjudicator.plan is not plan
+
+def test_compiled_adjudicator_generic_support():
+    # Italy supports convoying a support that France does not give
+    results = []
+    for adjudicator_class in [Adjudicator, CompiledAdjudicator]:
+        GM = make_game()
+        GM.set_adjudicator_class(adjudicator_class)
+        GM.setup_pieces(cases.italy, ["Re1"])
+        GM.setup_pieces(cases.france, ["Bf4"])
+        GM.process_orders(cases.italy, ["Re1 S e3 C Bf4 S d2"])
+        GM.adjudicate()
+        results.append(sorted((str(order), order.get_success()) for order in GM.order_manager.get_orders()))
+    assert results[0] == results[1]
+
+def test_rollback():
+    GM = make_game()
+    assert not GM.rollback() and not GM.merge()
+    GM.setup_pieces(cases.england, ["Kd1", "Rd2", "Nb1"])
+    GM.process_orders(cases.england, ["Kd1 e1", "Rd2 d4", "Nb1 c3"])
+    GM.adjudicate()
+    orders = [(str(order), order.get_success()) for order in GM.order_manager.get_orders()]
+    GM.fork()
+    GM.process_orders(cases.england, ["Kd1 S Rd2 d3", "Rd2 d3"])
+    GM.adjudicate()
+    assert GM.rollback()
+    assert [(str(order), order.get_success()) for order in GM.order_manager.get_orders()] == orders
+    assert not GM.rollback()
+
+def test_standalone_checkpoint():
+    GM = make_game()
+    GM.setup_pieces(cases.england, ["Kd1", "Rd2", "Nb1"])
+    board = PositionBoard(get_position(GM), standard_setup.powers)
+    england = standard_setup.powers.index(cases.england)
+    order_set = OrderManager(HeadlessVisualInterface())
+    def make_orders(messages):
+        for power_index, order_class, args in parse_orders([(england, message) for message in messages]):
+            make_order(order_set, board, standard_setup.powers[power_index], order_class, args)
+    def get_state():
+        return [(str(order), order.get_virtual(), order.get_success(), len(order.get_supports())) for order in order_set.get_orders()]
+    
+    make_orders(["Kd1 e1", "Rd2 d4", "Nb1 c3"])
+    add_holds(order_set, board)
+    Adjudicator(order_set).adjudicate()
+    state = get_state()
+    order_set.checkpoint()
+    make_orders(["Kd1 S Rd2 d3", "Rd2 d3"])
+    add_holds(order_set, board)
+    Adjudicator(order_set).adjudicate()
+    assert get_state() != state
+    order_set.rollback()
+    assert get_state() == state
+
+def test_parallel_adjudicator():
+    executor = ProcessPoolExecutor(max_workers=2)
+    try:
+        mismatches = []
+        for case in cases.TEST_CASES:
+            def make_adjudicator(GM):
+                # Not offered by GameManager, see ParallelAdjudicator
+                GM.adjudicator = ParallelAdjudicator(GM.order_manager, executor=executor, workers=2, min_orders=1)
+            if run_case(case, setup=make_adjudicator) != run_case(case):
+                mismatches.append(case)
+        assert mismatches == []
+    finally:
+        executor.shutdown()
+    
+    GM = make_game()
+    with pytest.raises(ValueError):
+        GM.set_adjudicator_class(ParallelAdjudicator)
+
+class BrokenExecutor:
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_exception(BrokenProcessPool())
+        return future
+
+def test_parallel_adjudicator_broken_pool(caplog):
+    GM = make_game()
+    GM.setup_pieces(cases.england, ["Kd1", "Rh1"])
+    GM.setup_pieces(cases.italy, ["Ka8", "Ra1"])
+    GM.process_orders(cases.england, ["Kd1 d2", "Rh1 h2"])
+    GM.process_orders(cases.italy, ["Ka8 b8", "Ra1 a2"])
+    GM._add_holds()
+    adjudicator = ParallelAdjudicator(GM.order_manager, executor=BrokenExecutor(), workers=2, min_orders=1)
+    adjudicator.adjudicate()
+    assert adjudicator.components > 1
+    assert all(order.get_success() for order in GM.order_manager.get_orders())
+    assert "Worker pool of ParallelAdjudicator broke" in caplog.text
+
+def test_parallel_adjudicator_close():
+    GM = make_game()
+    cases.test_6A1()
+    adjudicator = ParallelAdjudicator(GM.order_manager, workers=2, min_orders=1)
+    adjudicator.adjudicate()
+    assert adjudicator.executor is not None
+    adjudicator.close()
+    assert adjudicator.executor is None
+
+def test_canonical_squares():
+    assert Square(3, 4) is SQUARES[35]
+    GM = make_game()
+    cases.test_6A1()
+    for order in GM.order_manager.get_orders():
+        for square in (order.get_starting_square(), order.get_landing_square(), *order.get_intermediate_squares()):
+            assert square is SQUARES[get_square_id(square)]
+
+@pytest.mark.parametrize("case", cases.TEST_CASES)
+def test_board_consistency(case):
+    GM = make_game(debug=True)
+    adjudicate = GM.adjudicate
+    def adjudicate_and_progress():
+        adjudicate()
+        for _ in range(3):
+            GM.progress()
+            GM.board.check_consistency()
+    GM.adjudicate = adjudicate_and_progress
+    getattr(cases, f"test_{case}")()
+    GM.board.check_consistency()
+
+@pytest.mark.parametrize("case", cases.TEST_CASES)
+def test_position_hash(case):
+    GM = make_game()
+    getattr(cases, f"test_{case}")()
+    for _ in range(3):
+        GM.progress()
+    
+    # The same position, set up from scratch, has the same hash
+    other_GM = GameManager(board=standard_setup, visualizer=HeadlessVisualInterface(), console=SilentConsole())
+    set_position(other_GM, get_position(GM))
+    other_GM.phase = GM.phase
+    other_GM.set_phase()
+    board = GM.board.board
+    for square in SQUARES:
+        if board.sc_mask[square.rank, square.file]:
+            other_GM.board.set_sc_ownership(square, board.powers[board.sc_ownership[square.rank, square.file]])
+    assert other_GM.get_position_hash() == GM.get_position_hash()
+
+def adjudicate_orders_with_cache(cache, messages):
+    GM = make_game()
+    GM.set_adjudication_cache(cache)
+    GM.setup_pieces(cases.england, ["Kd1", "Rd2"])
+    GM.setup_pieces(cases.france, ["Ke2"])
+    GM.process_orders(cases.england, messages)
+    GM.adjudicate()
+    return sorted((str(order), order.get_success()) for order in GM.order_manager.get_orders())
+
+def test_adjudication_cache_eviction():
+    cache = AdjudicationCache(max_size=2)
+    order_sets = {"A": ["Kd1 e1"], "B": ["Rd2 S Kd1 e2", "Kd1 e2"], "C": ["Kd1 c1"]}
+    for name in "ABAC":
+        adjudicate_orders_with_cache(cache, order_sets[name])
+    assert (len(cache), cache.hits, cache.misses) == (2, 1, 3)
+    adjudicate_orders_with_cache(cache, order_sets["B"]) # evicted by C
+    assert (cache.hits, cache.misses) == (1, 4)
+    adjudicate_orders_with_cache(cache, order_sets["C"])
+    assert (cache.hits, cache.misses) == (2, 4)
+
+def test_adjudication_cache_save(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = AdjudicationCache()
+    results = adjudicate_orders_with_cache(cache, ["Rd2 S Kd1 e2", "Kd1 e2"])
+    cache.save(path)
+    
+    other_cache = AdjudicationCache(path=path)
+    assert other_cache.entries == cache.entries
+    assert adjudicate_orders_with_cache(other_cache, ["Kd1 e2", "Rd2 S Kd1 e2"]) == results
+    assert (other_cache.hits, other_cache.misses) == (1, 0)
+    
+    small_cache = AdjudicationCache(max_size=0)
+    small_cache.load(path)
+    assert len(small_cache) == 0
+
+@pytest.mark.parametrize("count", [0, 1, 7, 8, 9, 64, 100])
+def test_results_codec(count):
+    results = tuple(bool(i % 3 == 0 or i % 5 == 1) for i in range(count))
+    data = encode_results(results)
+    assert len(data) == (count + 7) // 8
+    assert decode_results(data, count) == results
+    assert decode_results(data, count, as_array=True).tolist() == list(results)
+
+def test_results_codec_layout():
+    # Result i is bit i % 8 of byte i // 8
+    assert encode_results([True, False, False, True, False, False, False, False, False, True]) == bytes([0b1001, 0b10])
+    assert decode_results(bytes([0b1001, 0b10]), 3) == (True, False, False)
+    with pytest.raises(ValueError):
+        decode_results(bytes([0b1001]), 9)
+
+def get_order_sets(case):
+    """
+    Run a test case, and get the position and the order set of each of its
+    adjudications, in the format of `chessdip.game.batch`.
+    """
+    GM = make_game()
+    adjudicate = GM.adjudicate
+    order_sets = []
+    def record_and_adjudicate():
+        order_set = [(power.name, message) for power, message, _ in get_order_messages(GM.order_manager)]
+        order_sets.append((get_position(GM), order_set))
+        adjudicate()
+    GM.adjudicate = record_and_adjudicate
+    getattr(cases, f"test_{case}")()
+    return order_sets
+
+def get_free_orders(order_set):
+    """
+    Get the indexes of the orders of an order set that can be left out: the
+    orders of pieces that no order mentions but their own, as the
+    adjudicator expects supported and convoyed orders to be given. Orders
+    of a piece to support itself are kept as well.
+    """
+    free_orders = []
+    for i, (_, message) in enumerate(order_set):
+        piece = message.split()[0]
+        messages = [other_message for _, other_message in order_set[:i] + order_set[i + 1:]] + [message[len(piece):]]
+        if piece[0] in "PNBRK" and not any(piece[1:] in other_message for other_message in messages):
+            free_orders.append(i)
+    return free_orders
+
+def get_variants(order_set):
+    """
+    An order set, followed by the order sets missing one of its orders, see
+    `get_free_orders`.
+    """
+    return [order_set] + [order_set[:i] + order_set[i + 1:] for i in get_free_orders(order_set)]
+
+@pytest.mark.parametrize("case", cases.TEST_CASES)
+def test_lockstep_equivalence(case):
+    for position, order_set in get_order_sets(case):
+        GM = make_headless_game()
+        pieces = set_position(GM, position)
+        order_sets = get_variants(order_set)
+        results = [adjudicate_order_set(GM, pieces, variant) for variant in order_sets]
+        assert adjudicate_lockstep(position, order_sets) == results
+        assert adjudicate_lockstep(position, order_sets, packed=True) == [encode_results(success) for success in results]
+
+@pytest.mark.parametrize("case", cases.TEST_CASES)
+def test_adjudicate_many_in_process(case):
+    for position, order_set in get_order_sets(case):
+        order_sets = get_variants(order_set)
+        results = list(adjudicate_many(position, order_sets, workers=0))
+        assert results == adjudicate_lockstep(position, order_sets)
+        assert list(adjudicate_many(position, order_sets, workers=0, packed=True)) == [encode_results(success) for success in results]
+
+def test_adjudicate_many():
+    (position, order_set), = get_order_sets("6E5")
+    order_sets = get_variants(order_set) * 4
+    results = list(adjudicate_many(position, order_sets, workers=0))
+    assert list(adjudicate_many(position, order_sets, workers=2, chunksize=3)) == results
+    packed = adjudicate_many(position, order_sets, workers=2, packed=True)
+    assert [decode_results(data, len(position.pieces)) for data in packed] == results
+
+class StuckAdjudicator(Adjudicator):
+    """
+    A wrong adjudicator, whose moves all fail.
+    """
+    def _adjudicate_move(self, order, optimistic):
+        return False
+
+def test_shadow_verifier(caplog, monkeypatch):
+    verifier = ShadowVerifier()
+    for adjudicator_class in [StuckAdjudicator, Adjudicator]:
+        GM = make_game()
+        GM.set_adjudicator_class(adjudicator_class)
+        GM.set_shadow_verifier(verifier)
+        GM.setup_pieces(cases.england, ["Kd1", "Rd2"])
+        GM.process_orders(cases.england, ["Kd1 e1", "Rd2 d4"])
+        GM.adjudicate()
+    verifier.close()
+    assert (verifier.sampled, verifier.verified, len(verifier.mismatches)) == (2, 2, 1)
+    dump = verifier.mismatches[0]
+    assert dump.startswith("# Shadow mismatch of StuckAdjudicator against Adjudicator:\n")
+    assert "# - Kd1 e1: fails, expected succeeds\n" in dump
+    assert "Adjudication mismatch" in caplog.text
+    
+    # The dump is a test case reproducing the mismatch
+    monkeypatch.setattr(cases, "test_SHADOW1", None, raising=False)
+    exec(dump, vars(cases))
+    assert all(success for _, success in run_case("SHADOW1"))
+    assert run_case("SHADOW1", StuckAdjudicator) != run_case("SHADOW1")
+
+def test_shadow_verifier_fraction():
+    verifier = ShadowVerifier(fraction=0.)
+    GM = make_game()
+    GM.set_shadow_verifier(verifier)
+    cases.test_6A1()
+    verifier.close()
+    assert (verifier.sampled, verifier.verified) == (0, 0)
+
+@pytest.mark.parametrize("adjudicator_class", [Adjudicator, *ENGINES], ids=lambda cls: cls.__name__)
+def test_query(adjudicator_class):
+    mismatches = []
+    for case in cases.TEST_CASES:
+        GM = make_game()
+        def query_and_adjudicate():
+            GM._add_holds()
+            orders = [order for order in GM.order_manager.get_orders() if order.get_virtual() or not isinstance(order, HoldOrder)]
+            successes = [order.get_success() for order in orders]
+            adjudicator = adjudicator_class(GM.order_manager)
+            queried = [adjudicator.query([order])[0] for order in reversed(orders)][::-1]
+            assert [order.get_success() for order in orders] == successes
+            adjudicator.adjudicate() # reusing the queried orders
+            adjudicated = [order.get_success() for order in orders]
+            Adjudicator(GM.order_manager).adjudicate()
+            if not queried == adjudicated == [order.get_success() for order in orders]:
+                mismatches.append(case)
+        GM.adjudicate = query_and_adjudicate
+        getattr(cases, f"test_{case}")()
+    assert mismatches == []
+
+def test_query_partial():
+    GM = make_game()
+    GM.setup_pieces(cases.england, ["Kd1", "Rd2"])
+    GM.setup_pieces(cases.france, ["Ke8", "Ng8"])
+    GM.process_orders(cases.england, ["Kd1 e1", "Rd2 d3"])
+    GM.process_orders(cases.france, ["Ke8 f7", "Ng8 S e8 f7"])
+    GM._add_holds()
+    orders = {str(order): order for order in GM.order_manager.get_orders()}
+    adjudicator = Adjudicator(GM.order_manager)
+    assert adjudicator.query([orders["France King at e8 move to f7"]]) == [True]
+    unresolved = [str(order) for order, resolved in adjudicator.resolved.items() if not resolved]
+    assert sorted(unresolved) == ["England King at d1 move to e1", "England Rook at d2 move to d3"]
+    
+    hold, = [order for order in GM.order_manager.get_orders() if isinstance(order, HoldOrder)]
+    with pytest.raises(ValueError):
+        adjudicator.query([hold])
+    GM.process_orders(cases.england, ["Rd2 S d1 c1"])
+    virtual_move, = [order for order in GM.order_manager.get_orders() if str(order) == "[virtual] England King at d1 move to c1"]
+    assert Adjudicator(GM.order_manager).query([virtual_move]) == [False]
+
+@pytest.mark.parametrize("case", cases.TEST_CASES)
+def test_incremental_edits(case):
+    def get_results(GM):
+        return [(str(order), order.get_success()) for order in GM.order_manager.get_orders()]
+    
+    for position, order_set in get_order_sets(case):
+        GM = make_headless_game()
+        GM.set_incremental_adjudication(True)
+        set_position(GM, position)
+        # Each free order is made a hold, then given again
+        edits = list(order_set)
+        for i in get_free_orders(order_set):
+            power_name, message = order_set[i]
+            edits.extend([(power_name, f"{message.split()[0]} H"), (power_name, message)])
+        for i, (power_name, message) in enumerate(edits):
+            GM.process_orders(GM._get_power(power_name.lower()), [message])
+            if i < len(order_set) - 1:
+                continue
+            # As in GM.adjudicate, without the disbands of the next phase
+            GM._add_holds()
+            GM.adjudication_session.adjudicate()
+            results = get_results(GM)
+            Adjudicator(GM.order_manager).adjudicate()
+            assert results == get_results(GM)